@@ -2,219 +2,377 @@
 Agent Factory Functions
 
 Creates agent functions for the 3-stage hierarchical evaluation pipeline.
-Each factory returns a callable that:
+Each factory returns a runnable node that:
 1. Takes MTState as input
 2. Invokes LLM with structured output
 3. Returns dict to update state
 
+Nodes carry both a sync and a native async implementation, so the compiled
+graph can be driven with app.invoke or app.ainvoke. Under app.ainvoke every
+LLM call goes through chain.ainvoke on the shared client: many in-flight
+segments share one event loop and one HTTP connection pool instead of a
+worker thread per outstanding call.
+
+Chains are StructuredChain instances, which consult the persistent response
+cache (core.llm_cache) before calling the model and return a metrics record
+per call; nodes append it to MTState.nodeMetrics. Prompts are assembled with
+build_prompt so each node's static prefix (system prompt) is byte-stable and
+all variable fields follow it in the human message.
+
 Three factory types:
 - make_error_agent_stage1: Super category agents (Accuracy, Fluency, Terminology, Style)
 - make_error_agent_stage2: Sub-category agents (13 total) - critically evaluate Stage 1
 - make_error_agent_stage3: Verification agents (4 total) - check consistency
+
+make_merged_error_agent_stage2 is the merged alternative to the stage-2
+fan-out: one call per super category returning every sub-category at once.
+
+Every factory takes an optional `llm`; by default agents share the client
+returned by get_llm(), which is created lazily on first use. Stage 1-3
+factories also take an optional `escalation` (core.cascade.Escalation):
+uncertain outputs are then re-requested from the escalation's stronger model.
+Stage-2 factories take `document_context`: the agent then also reads
+MTState.documentContext (document mode, core.document). Stage 1-3
+factories take `glossary`: the agent also gets the glossary matches of
+MTState.glossaryHits (core.glossary) as evidence.
 """
 
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableLambda
+from core.encoding import DEFAULT_REASONING_CHARS, ENCODING_LEGEND, encode_output, encode_outputs
+from core.glossary import encode_hits
+from core.structured_chain import StructuredChain, build_prompt
 from core.models import AgentOutputStage1, AgentOutputStage2, AgentOutputStage3, MTState, MissingErrorsOutput
-from typing import Dict
+from core.taxonomy import CATEGORIES, SUB_CATEGORIES, stage1_key, stage3_key
+from functools import lru_cache
+from typing import Dict, Optional
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+DEFAULT_MODEL = "gpt-4.1-mini"
 
-llm = ChatOpenAI(
-    model="gpt-4.1-mini",
-    temperature=0,
-    api_key=os.getenv("OPENAI_API_KEY")
-)
 
+@lru_cache(maxsize=None)
+def get_llm(model: str = DEFAULT_MODEL, temperature: float = 0.0, base_url: Optional[str] = None):
+    """
+    The shared chat client for a model, created on first use (not at import),
+    so importing the agents does not read .env or build an HTTP client.
+    """
+    from dotenv import load_dotenv
+    from langchain_openai import ChatOpenAI
 
-def make_error_agent_stage1(system_prompt: str, state_key: str):
-    
-    prompt_template = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", """
-            SOURCE SENTENCE: {source}
+    load_dotenv()
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=base_url,
+        # retries are done (and counted) by StructuredChain
+        max_retries=0,
+    )
 
-            MACHINE TRANSLATED SENTENCE: {translated}
 
-            REFERENCE SENTENCE: {reference}""")
-        ])
-    
-    chain = prompt_template | llm.with_structured_output(AgentOutputStage1)
-    
-    def agent_fn(state: MTState) -> Dict[str, AgentOutputStage1]:
-       
-        output = chain.invoke({
-            "source": state["source"],
-            "translated": state["mt"],
-            "reference": state["reference"],
-        })
-        
-        return {state_key: output}
-    
-    return agent_fn
+def _round(state: MTState) -> int:
+    return state.get("round") or 1
 
 
-def make_error_agent_stage2(system_prompt: str, state_key: str, super_category: str):
-    
-    prompt_template = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", """
+def _with_legend(system_prompt: str) -> str:
+    return system_prompt.strip() + "\n\n" + ENCODING_LEGEND
+
+
+def _evidence_template(document_context: bool = False, glossary: bool = False) -> str:
+    """Optional blocks that follow the reference sentence in the human message."""
+    blocks = ""
+    if document_context:
+        blocks += """
+        DOCUMENT CONTEXT (all segments of the document, shortened; [n] = segment number):
+        {document_context}
+"""
+    if glossary:
+        blocks += """
+        GLOSSARY MATCHES (client glossary terms in the source -> approved renderings):
+        {glossary}
+"""
+    return blocks
+
+
+def _evidence_inputs(state: MTState, document_context: bool = False, glossary: bool = False) -> dict:
+    inputs = {}
+    if document_context:
+        inputs["document_context"] = state.get("documentContext") or "-"
+    if glossary:
+        inputs["glossary"] = encode_hits(state.get("glossaryHits"))
+    return inputs
+
+
+def _stage2_template(document_context: bool = False, glossary: bool = False) -> str:
+    return """
         SOURCE SENTENCE: {source}
 
         MACHINE TRANSLATED SENTENCE: {translated}
 
         REFERENCE SENTENCE: {reference}
-
+""" + _evidence_template(document_context, glossary) + """
         PREVIOUS AGENT EVALUATIONS (Stage-1): {previous_agent}
 
         ROUND: {round}
 
         MISSING-ERRORS AUDIT (from previous round, may be empty):
         {missing_errors}
-        """)
-    ])
+        """
+
+
+def _stage2_inputs(state: MTState, super_category: str, reasoning_chars, document_context: bool, glossary: bool) -> dict:
+    inputs = {
+        "source": state["source"],
+        "translated": state["mt"],
+        "reference": state["reference"],
+        "previous_agent": encode_outputs(state, [super_category], reasoning_chars),
+        "round": state.get("round", 1),
+        "missing_errors": encode_output(state.get("missingErrors"), reasoning_chars),
+    }
+    inputs.update(_evidence_inputs(state, document_context, glossary))
+    return inputs
+
+
+def make_error_agent_stage1(system_prompt: str, state_key: str, llm=None, escalation=None, glossary: bool = False):
+    
+    prompt_template = build_prompt(system_prompt, """
+        SOURCE SENTENCE: {source}
+
+        MACHINE TRANSLATED SENTENCE: {translated}
+
+        REFERENCE SENTENCE: {reference}
+""" + _evidence_template(glossary=glossary))
     
-    chain = prompt_template | llm.with_structured_output(AgentOutputStage2)
+    chain = StructuredChain(prompt_template, llm or get_llm(), AgentOutputStage1, state_key, escalation=escalation)
     
-    def agent_fn_stage2(state: MTState) -> Dict[str, AgentOutputStage2]:
-       
-        missing_errors = state.get("missingErrors")
-        if missing_errors is None:
-            missing_errors_payload = "None"
-        elif hasattr(missing_errors, "model_dump"):
-            missing_errors_payload = missing_errors.model_dump()
-        else:
-            missing_errors_payload = missing_errors
-
-        output = chain.invoke({
+    def build_inputs(state: MTState) -> dict:
+        return {
             "source": state["source"],
             "translated": state["mt"],
             "reference": state["reference"],
-            "previous_agent": state[super_category],
-            "round": state.get("round", 1),
-            "missing_errors": missing_errors_payload,
-        })
+            **_evidence_inputs(state, glossary=glossary),
+        }
+
+    def agent_fn(state: MTState) -> Dict[str, AgentOutputStage1]:
+       
+        output, record = chain.invoke(build_inputs(state), _round(state))
+        
+        return {state_key: output, "nodeMetrics": [record]}
+
+    async def aagent_fn(state: MTState) -> Dict[str, AgentOutputStage1]:
+
+        output, record = await chain.ainvoke(build_inputs(state), _round(state))
+
+        return {state_key: output, "nodeMetrics": [record]}
+    
+    return RunnableLambda(agent_fn, afunc=aagent_fn, name=state_key)
+
+
+def make_error_agent_stage2(
+    system_prompt: str,
+    state_key: str,
+    super_category: str,
+    llm=None,
+    reasoning_chars=DEFAULT_REASONING_CHARS,
+    escalation=None,
+    document_context: bool = False,
+    glossary: bool = False,
+):
+    
+    prompt_template = build_prompt(_with_legend(system_prompt), _stage2_template(document_context, glossary))
+    
+    chain = StructuredChain(prompt_template, llm or get_llm(), AgentOutputStage2, state_key, escalation=escalation)
+    
+    def build_inputs(state: MTState) -> dict:
+        return _stage2_inputs(state, super_category, reasoning_chars, document_context, glossary)
+
+    def agent_fn_stage2(state: MTState) -> Dict[str, AgentOutputStage2]:
+       
+        output, record = chain.invoke(build_inputs(state), _round(state))
         
-        return {state_key: output}
+        return {state_key: output, "nodeMetrics": [record]}
+
+    async def aagent_fn_stage2(state: MTState) -> Dict[str, AgentOutputStage2]:
+
+        output, record = await chain.ainvoke(build_inputs(state), _round(state))
+
+        return {state_key: output, "nodeMetrics": [record]}
     
-    return agent_fn_stage2
+    return RunnableLambda(agent_fn_stage2, afunc=aagent_fn_stage2, name=state_key)
+
+
+def _merged_stage2_system_prompt(sub_prompts: Dict[str, str]) -> str:
+    """
+    Combine the per-sub-category stage-2 prompts into one system prompt: the
+    preamble they share is stated once, followed by each sub-category's own
+    instructions under the name of the output field it fills.
+    """
+    texts = [p.strip() for p in sub_prompts.values()]
+    preamble = os.path.commonprefix(texts)
+    # cut back to a paragraph boundary so no sub-category loses half a line
+    preamble = preamble[:preamble.rfind("\n\n") + 1] if len(texts) > 1 else ""
+
+    sections = [
+        f"### Sub-category field `{key}`\n{text[len(preamble):].strip()}"
+        for key, text in zip(sub_prompts, texts)
+    ]
+
+    return (
+        preamble
+        + "\nThis is a combined evaluation. Assess each sub-category below separately, "
+        + "exactly as if it were your only assignment, and return one evaluation per "
+        + "sub-category in the output field of the same name. Evidence for one "
+        + "sub-category must not change the probability of another.\n\n"
+        + "\n\n".join(sections)
+    )
+
+
+def make_merged_error_agent_stage2(
+    sub_prompts: Dict[str, str],
+    state_key: str,
+    super_category: str,
+    output_model,
+    llm=None,
+    reasoning_chars=DEFAULT_REASONING_CHARS,
+    escalation=None,
+    document_context: bool = False,
+    glossary: bool = False,
+):
+
+    system_prompt = _merged_stage2_system_prompt(sub_prompts)
+
+    prompt_template = build_prompt(_with_legend(system_prompt), _stage2_template(document_context, glossary))
+
+    chain = StructuredChain(prompt_template, llm or get_llm(), output_model, state_key, escalation=escalation)
+
+    def build_inputs(state: MTState) -> dict:
+        return _stage2_inputs(state, super_category, reasoning_chars, document_context, glossary)
+
+    def split(output, record) -> Dict[str, AgentOutputStage2]:
+        update = {
+            field.alias or name: getattr(output, name)
+            for name, field in type(output).model_fields.items()
+        }
+        update["nodeMetrics"] = [record]
+        return update
+
+    def agent_fn_merged(state: MTState) -> Dict[str, AgentOutputStage2]:
+
+        return split(*chain.invoke(build_inputs(state), _round(state)))
+
+    async def aagent_fn_merged(state: MTState) -> Dict[str, AgentOutputStage2]:
+
+        return split(*await chain.ainvoke(build_inputs(state), _round(state)))
+
+    return RunnableLambda(agent_fn_merged, afunc=aagent_fn_merged, name=state_key)
 
 
-def make_error_agent_stage3(system_prompt: str, state_key: str, super_category: str):
+def make_error_agent_stage3(
+    system_prompt: str,
+    state_key: str,
+    super_category: str,
+    llm=None,
+    reasoning_chars=DEFAULT_REASONING_CHARS,
+    escalation=None,
+    glossary: bool = False,
+):
     
     # Create prompt template that includes both Stage 1 and Stage 2 evaluations
-    prompt_template = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", """
+    prompt_template = build_prompt(_with_legend(system_prompt), """
         SOURCE SENTENCE: {source}
 
         MACHINE TRANSLATED SENTENCE: {translated}
 
         REFERENCE SENTENCE: {reference}
-
+""" + _evidence_template(glossary=glossary) + """
         SUPER CATEGORY AGENT EVALUATIONS (Stage-1): {previous_agent}
 
-        SUB CATEGORY AGENTS EVALUATIONS (Stage-2): {sub_category_agent}
+        SUB CATEGORY AGENTS EVALUATIONS (Stage-2):
+        {sub_category_agent}
 
         ROUND: {round}
 
         MISSING-ERRORS AUDIT (from previous round, may be empty):
         {missing_errors}
         """)
-    ])
     
-    chain = prompt_template | llm.with_structured_output(AgentOutputStage3)
+    chain = StructuredChain(prompt_template, llm or get_llm(), AgentOutputStage3, state_key, escalation=escalation)
     
-    def agent_fn_stage3(state: MTState) -> Dict[str, AgentOutputStage3]:
-        
-        if super_category == "accuracyStage1":
-            sub_keys = ["addition", "omission", "mistranslation", "untranslated_text"]
-        elif super_category == "fluencyStage1":
-            sub_keys = ["punctuation", "spelling", "grammar", "register", "inconsistency", "characterEncoding"]
-        elif super_category == "terminologyStage1":
-            sub_keys = ["inappropriate_for_context", "inconsistent_use"]
-        elif super_category == "styleStage1":
-            sub_keys = ["awkward"]
-        else:
-            sub_keys = []
-        
-        combined_sub_category = [state[s] for s in sub_keys if state.get(s) is not None]
-        
-        missing_errors = state.get("missingErrors")
-        if missing_errors is None:
-            missing_errors_payload = "None"
-        elif hasattr(missing_errors, "model_dump"):
-            missing_errors_payload = missing_errors.model_dump()
-        else:
-            missing_errors_payload = missing_errors
-
-        output = chain.invoke({
+    sub_keys = SUB_CATEGORIES.get(super_category.replace("Stage1", ""), [])
+
+    def build_inputs(state: MTState) -> dict:
+        return {
             "source": state["source"],
             "translated": state["mt"],
             "reference": state["reference"],
-            "previous_agent": state[super_category],
-            "sub_category_agent": combined_sub_category,
+            "previous_agent": encode_outputs(state, [super_category], reasoning_chars),
+            "sub_category_agent": encode_outputs(state, [s for s in sub_keys if state.get(s) is not None], reasoning_chars),
             "round": state.get("round", 1),
-            "missing_errors": missing_errors_payload,
-        })
+            "missing_errors": encode_output(state.get("missingErrors"), reasoning_chars),
+            **_evidence_inputs(state, glossary=glossary),
+        }
+
+    def agent_fn_stage3(state: MTState) -> Dict[str, AgentOutputStage3]:
+        
+        output, record = chain.invoke(build_inputs(state), _round(state))
         
-        return {state_key: output}
+        return {state_key: output, "nodeMetrics": [record]}
+
+    async def aagent_fn_stage3(state: MTState) -> Dict[str, AgentOutputStage3]:
+
+        output, record = await chain.ainvoke(build_inputs(state), _round(state))
+
+        return {state_key: output, "nodeMetrics": [record]}
     
-    return agent_fn_stage3
+    return RunnableLambda(agent_fn_stage3, afunc=aagent_fn_stage3, name=state_key)
 
-def make_missing_errors_audit_agent(system_prompt: str, state_key: str = "missingErrors"):
-    prompt_temp = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", """Source sentnce: {source} machine translated sentence: {translated} round: {round} prior pipeline outputs: {prior_state}""")
-    ])
+def make_missing_errors_audit_agent(
+    system_prompt: str, state_key: str = "missingErrors", llm=None, reasoning_chars=DEFAULT_REASONING_CHARS
+):
+    prompt_temp = build_prompt(_with_legend(system_prompt), """
+        SOURCE SENTENCE: {source}
 
-    chain = prompt_temp | llm.with_structured_output(MissingErrorsOutput)
-    def fn(state: MTState):
-        prior_state = {
-            # stage 1
-            "accuracyStage1": state.get("accuracyStage1"),
-            "fluencyStage1": state.get("fluencyStage1"),
-            "terminologyStage1": state.get("terminologyStage1"),
-            "styleStage1": state.get("styleStage1"),
-            # stage 2
-            "addition": state.get("addition"),
-            "omission": state.get("omission"),
-            "mistranslation": state.get("mistranslation"),
-            "untranslated_text": state.get("untranslated_text"),
-            "punctuation": state.get("punctuation"),
-            "spelling": state.get("spelling"),
-            "grammar": state.get("grammar"),
-            "register": state.get("register"),
-            "inconsistency": state.get("inconsistency"),
-            "characterEncoding": state.get("characterEncoding"),
-            "inappropriate_for_context": state.get("inappropriate_for_context"),
-            "inconsistent_use": state.get("inconsistent_use"),
-            "awkward": state.get("awkward"),
-            # stage 3
-            "accuracyStage3": state.get("accuracyStage3"),
-            "fluencyStage3": state.get("fluencyStage3"),
-            "terminologyStage3": state.get("terminologyStage3"),
-            "styleStage3": state.get("styleStage3"),
-        }
+        MACHINE TRANSLATED SENTENCE: {translated}
+
+        REFERENCE SENTENCE: {reference}
 
-        output = chain.invoke({
+        ROUND: {round}
+
+        PRIOR PIPELINE OUTPUTS:
+        {prior_state}
+        """)
+
+    chain = StructuredChain(prompt_temp, llm or get_llm(), MissingErrorsOutput, state_key)
+    # stage 1, stage 2, stage 3
+    prior_keys = (
+        [stage1_key(c) for c in CATEGORIES]
+        + [s for c in CATEGORIES for s in SUB_CATEGORIES[c]]
+        + [stage3_key(c) for c in CATEGORIES]
+    )
+
+    def build_inputs(state: MTState) -> dict:
+        return {
             "source": state["source"],
             "translated": state["mt"],
             "reference": state["reference"],
             "round": state.get("round", 1),
-            "prior_state": str(prior_state), 
-        })
+            "prior_state": encode_outputs(state, prior_keys, reasoning_chars),
+        }
+
+    def fn(state: MTState):
+        output, record = chain.invoke(build_inputs(state), _round(state))
+        return {state_key: output, "nodeMetrics": [record]}
 
-        return {state_key: output}
+    async def afn(state: MTState):
+        output, record = await chain.ainvoke(build_inputs(state), _round(state))
+        return {state_key: output, "nodeMetrics": [record]}
 
-    return fn
+    return RunnableLambda(fn, afunc=afn, name=state_key)
 
 def test_agent(agent_fn, test_state: MTState):
     
     try:
-        result = agent_fn(test_state)
+        result = agent_fn.invoke(test_state)
         return result
     except Exception as e:
         print(f"Error testing agent: {e}")
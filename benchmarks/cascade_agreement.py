@@ -0,0 +1,177 @@
+"""
+Model Cascade: escalation rate and agreement with the strong model
+
+Evaluates a sample corpus twice, once with every agent on the strong model
+(the baseline) and once with the cheap-first cascade (core.cascade), and
+reports:
+
+- escalation rate: share of cascade LLM calls re-requested from the strong
+  model (node level) or share of segments re-run on it (segment level)
+- cost: LLM calls and tokens per segment, cascade vs baseline
+- agreement: mean / max |difference| of final_quality_score_100, share of
+  segments within --tolerance points, and per category how often the
+  stage-3 verdict (errorsExists) matches
+
+--fake runs offline with two FakeChatModel instances (different seeds) as
+the cheap and the strong model. Their outputs are independent random draws,
+so that only exercises the mechanics; agreement numbers mean something only
+against real models.
+
+Usage:
+    python -m benchmarks.cascade_agreement --corpus sample.jsonl --model gpt-4.1 --cheap-model gpt-4.1-nano
+    python -m benchmarks.cascade_agreement --fake --segments 50 --level segment --json cascade.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+from itertools import islice
+from typing import Dict, List
+
+from core.aggregation import get_verified_errors
+from core.cascade import CascadeConfig
+from core.corpus import read_segments
+from core.llm_cache import set_response_cache
+from core.runner import build_input_state
+from core.taxonomy import CATEGORIES
+
+
+async def _run(app, segments, max_rounds: int, concurrency: int) -> List[Dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(segment):
+        async with semaphore:
+            return await app.ainvoke(build_input_state(segment, max_rounds))
+
+    return await asyncio.gather(*(bounded(s) for s in segments))
+
+
+def build_fake_apps(cascade: CascadeConfig, cheap_seed: int):
+    """(baseline, cascade) apps on FakeChatModel, built like core.pipeline.build_app does."""
+    from benchmarks.fake_llm import FakeChatModel
+    from core.cascade import Escalation, SegmentCascade
+    from core.graph import build_graph
+
+    strong = FakeChatModel(model_name="fake-strong", seed=0)
+    cheap = FakeChatModel(model_name="fake-cheap", seed=cheap_seed)
+    stage_llms = {"stage1": cheap, "stage2": cheap, "stage3": cheap, "audit": strong}
+
+    baseline = build_graph(llm=strong).compile()
+    if cascade.level == "segment":
+        cheap_app = build_graph(llm=strong, stage_llms=stage_llms).compile()
+        return baseline, SegmentCascade(cheap_app, baseline, cascade)
+    escalation = Escalation(strong, cascade)
+    return baseline, build_graph(llm=strong, stage_llms=stage_llms, escalation=escalation).compile()
+
+
+def build_model_apps(model: str, cascade: CascadeConfig):
+    from core.pipeline import PipelineConfig, build_app
+
+    return build_app(PipelineConfig(model=model)), build_app(PipelineConfig(model=model, cascade=cascade))
+
+
+def _score(state: Dict) -> float:
+    return state["aggregation"]["final_quality_score_100"]
+
+
+def compare(baseline: List[Dict], cascade: List[Dict], tolerance: float) -> Dict:
+    diffs = [abs(_score(b) - _score(c)) for b, c in zip(baseline, cascade)]
+    n = len(diffs)
+
+    verdicts = {}
+    for category in CATEGORIES:
+        same = [
+            get_verified_errors(b).get(category) == get_verified_errors(c).get(category)
+            for b, c in zip(baseline, cascade)
+        ]
+        verdicts[category] = sum(same) / n
+
+    def per_segment(states, key):
+        return statistics.fmean(s["runMetrics"][key] for s in states)
+
+    def tokens(states):
+        return statistics.fmean(s["runMetrics"]["input_tokens"] + s["runMetrics"]["output_tokens"] for s in states)
+
+    calls = sum(s["runMetrics"]["calls"] for s in cascade)
+    return {
+        "segments": n,
+        "node_escalation_rate": sum(s["runMetrics"]["escalations"] for s in cascade) / calls if calls else 0.0,
+        "segment_escalation_rate": sum(
+            bool(s["runMetrics"].get("segment_escalated") or s["runMetrics"]["escalations"]) for s in cascade
+        ) / n,
+        "calls_per_segment": {"baseline": per_segment(baseline, "calls"), "cascade": per_segment(cascade, "calls")},
+        "tokens_per_segment": {"baseline": tokens(baseline), "cascade": tokens(cascade)},
+        "score_abs_diff_mean": statistics.fmean(diffs),
+        "score_abs_diff_max": max(diffs),
+        "within_tolerance": sum(d <= tolerance for d in diffs) / n,
+        "verdict_agreement": verdicts,
+    }
+
+
+def format_report(report: Dict, tolerance: float) -> str:
+    calls, tokens = report["calls_per_segment"], report["tokens_per_segment"]
+    lines = [
+        f"Segments: {report['segments']}",
+        f"Escalation: {report['node_escalation_rate']:.1%} of cascade calls, "
+        f"{report['segment_escalation_rate']:.1%} of segments with any escalation",
+        f"Calls / segment: baseline {calls['baseline']:.1f}, cascade {calls['cascade']:.1f} "
+        "(escalated calls count once)",
+        f"Tokens / segment: baseline {tokens['baseline']:.0f}, cascade {tokens['cascade']:.0f}",
+        f"Final score |diff|: mean {report['score_abs_diff_mean']:.2f}, max {report['score_abs_diff_max']:.2f}, "
+        f"{report['within_tolerance']:.1%} within {tolerance:g} points",
+        "Stage-3 verdict agreement: "
+        + ", ".join(f"{c} {share:.1%}" for c, share in report["verdict_agreement"].items()),
+    ]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Escalation rate and score agreement of the model cascade.")
+    parser.add_argument("--corpus", default=None, help="sample corpus (default: synthetic segments)")
+    parser.add_argument("--segments", type=int, default=50)
+    parser.add_argument("--max-rounds", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--model", default="gpt-4.1-mini", help="strong model (baseline and escalation target)")
+    parser.add_argument("--cheap-model", default="gpt-4.1-nano", help="model of stages 1-3 in the cascade")
+    parser.add_argument("--level", choices=["node", "segment"], default="node")
+    parser.add_argument("--min-confidence", type=float, default=CascadeConfig.min_confidence)
+    parser.add_argument("--min-consistency", type=float, default=CascadeConfig.min_consistency)
+    parser.add_argument("--tolerance", type=float, default=5.0, help="final-score points counted as agreement")
+    parser.add_argument("--fake", action="store_true", help="offline run on FakeChatModel (mechanics only)")
+    parser.add_argument("--cheap-seed", type=int, default=1, help="seed of the fake cheap model")
+    parser.add_argument("--json", default=None, help="write the report here")
+    args = parser.parse_args(argv)
+
+    set_response_cache(None)
+    if args.corpus:
+        segments = list(islice(read_segments(args.corpus), args.segments))
+    else:
+        from benchmarks.suite import synthetic_segments
+        segments = synthetic_segments(args.segments)
+
+    cascade = CascadeConfig(
+        stage1_model=args.cheap_model,
+        stage2_model=args.cheap_model,
+        stage3_model=args.cheap_model,
+        min_confidence=args.min_confidence,
+        min_consistency=args.min_consistency,
+        level=args.level,
+    )
+    if args.fake:
+        baseline_app, cascade_app = build_fake_apps(cascade, args.cheap_seed)
+    else:
+        baseline_app, cascade_app = build_model_apps(args.model, cascade)
+
+    baseline = asyncio.run(_run(baseline_app, segments, args.max_rounds, args.concurrency))
+    results = asyncio.run(_run(cascade_app, segments, args.max_rounds, args.concurrency))
+    report = compare(baseline, results, args.tolerance)
+    print(format_report(report, args.tolerance))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
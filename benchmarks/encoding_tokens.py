@@ -0,0 +1,133 @@
+"""
+Inter-Stage Encoding: input tokens per node
+
+Runs a sample corpus through the graph with the deterministic fake LLM
+(reasoning strings of realistic length) once per context encoding and
+reports the mean input tokens per call of every node:
+
+- repr: the pydantic reprs the agents interpolated before core.encoding
+  (reproduced here by swapping the encoder functions the factories use)
+- full / <n> / none: core.encoding with reasons kept whole, cut after n
+  characters, or dropped
+
+Token counts are the fake LLM's estimate (~4 characters per token), which is
+what matters for the relative reduction.
+
+Usage:
+    python -m benchmarks.encoding_tokens --corpus sample.jsonl --json encoding.json
+    python -m benchmarks.encoding_tokens --segments 50 --reason-words 60 --reasoning-chars 80 160
+"""
+
+import argparse
+import asyncio
+import json
+from contextlib import contextmanager
+from itertools import islice
+
+import agents.agent_factory as agent_factory
+from benchmarks.fake_llm import FakeChatModel
+from benchmarks.suite import synthetic_segments
+from core.corpus import read_segments
+from core.graph import build_graph
+from core.llm_cache import set_response_cache
+from core.metrics import node_metrics
+from core.runner import build_input_state
+
+
+def _repr_outputs(state, keys, reasoning_chars=None):
+    keys = list(keys)
+    if len(keys) == 1:
+        return str(state.get(keys[0]))  # stage 2: the stage-1 object
+    if len(keys) <= 6:
+        return str([state.get(k) for k in keys])  # stage 3: list of stage-2 objects
+    return str({k: state.get(k) for k in keys})  # audit: dict of everything
+
+
+def _repr_output(output, reasoning_chars=None):
+    return output.model_dump() if hasattr(output, "model_dump") else "None"
+
+
+@contextmanager
+def repr_encoding():
+    saved = agent_factory.encode_outputs, agent_factory.encode_output
+    agent_factory.encode_outputs, agent_factory.encode_output = _repr_outputs, _repr_output
+    try:
+        yield
+    finally:
+        agent_factory.encode_outputs, agent_factory.encode_output = saved
+
+
+async def _run(app, segments, max_rounds: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(segment):
+        async with semaphore:
+            return await app.ainvoke(build_input_state(segment, max_rounds))
+
+    return await asyncio.gather(*(bounded(s) for s in segments))
+
+
+def measure(segments, llm, reasoning_chars, max_rounds: int, concurrency: int, legacy: bool = False):
+    """Mean input tokens per call, per node."""
+    node_metrics.reset()
+    app = build_graph(llm=llm, reasoning_chars=reasoning_chars).compile()
+    if legacy:
+        with repr_encoding():
+            asyncio.run(_run(app, segments, max_rounds, concurrency))
+    else:
+        asyncio.run(_run(app, segments, max_rounds, concurrency))
+    return {node: n["input_tokens"] / n["calls"] for node, n in node_metrics.snapshot().items()}
+
+
+def format_table(results, focus: str) -> str:
+    """One column per variant, plus the change of `focus` against repr."""
+    variants = list(results)
+    lines = [f"{'node':<28}" + "".join(f"{v:>10}" for v in variants) + f"{focus + ' vs repr':>14}"]
+
+    def row(name, values, before, after):
+        change = f"{(after - before) / before:>+14.1%}" if before else f"{'':>14}"
+        return f"{name:<28}" + "".join(f"{x:>10.0f}" for x in values) + change
+
+    for node in results["repr"]:
+        values = [results[v].get(node, 0.0) for v in variants]
+        lines.append(row(node, values, results["repr"][node], results[focus].get(node, 0.0)))
+    totals = {v: sum(results[v].values()) for v in variants}
+    lines.append(row("TOTAL (sum of means)", list(totals.values()), totals["repr"], totals[focus]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Input tokens per node for each inter-stage encoding.")
+    parser.add_argument("--corpus", default=None, help="sample corpus (default: synthetic segments)")
+    parser.add_argument("--segments", type=int, default=20)
+    parser.add_argument("--max-rounds", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--reason-words", type=int, default=50, help="length of the fake agents' reasoning")
+    parser.add_argument("--reasoning-chars", type=int, nargs="+", default=[160])
+    parser.add_argument("--json", default=None, help="write the per-node means here")
+    args = parser.parse_args(argv)
+
+    set_response_cache(None)
+    if args.corpus:
+        segments = list(islice(read_segments(args.corpus), args.segments))
+    else:
+        segments = synthetic_segments(args.segments)
+
+    # every other audit loops, so round-2 prompts (with the audit in them) are measured too
+    llm = FakeChatModel(reason_words=args.reason_words, missing_rate=0.5)
+    results = {"repr": measure(segments, llm, None, args.max_rounds, args.concurrency, legacy=True)}
+    results["full"] = measure(segments, llm, None, args.max_rounds, args.concurrency)
+    for chars in args.reasoning_chars:
+        results[str(chars)] = measure(segments, llm, chars, args.max_rounds, args.concurrency)
+    results["none"] = measure(segments, llm, 0, args.max_rounds, args.concurrency)
+
+    print("Mean input tokens per call:")
+    print(format_table(results, str(args.reasoning_chars[0])))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Deterministic Fake LLM
+
+A chat model that stands in for the ChatOpenAI client in
+agents.agent_factory so the graph can be benchmarked offline. It supports
+the forced tool call StructuredChain binds (bind_tools) and answers with
+valid arguments for whatever schema was bound: AgentOutputStage1/2/3,
+MissingErrorsOutput and the merged stage-2 models.
+
+Responses are a pure function of (seed, schema, rendered messages), so two
+runs over the same corpus produce the same verdicts, the same loop decisions
+and the same token counts. Latency is drawn from a lognormal distribution
+around `latency_ms` (sigma=0 gives a constant latency) using the same
+per-call RNG, so it is reproducible too.
+
+Usage metadata mimics the provider: ~4 characters per token, and the system
+prompt counts as prefix-cached in 128-token blocks once it reaches 1024
+tokens.
+"""
+
+import asyncio
+import hashlib
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from core.models import AgentOutputStage1, AgentOutputStage2, AgentOutputStage3, MissingErrorsOutput
+from core.taxonomy import SUB_CATEGORIES
+
+
+CHARS_PER_TOKEN = 4
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+_REASON_WORDS = (
+    "the translation renders source phrase verb tense agreement omits adds term meaning "
+    "context reference sentence clause word order literal idiom register formal particle "
+    "appears correct incorrect missing extra because however while compared stage agent"
+).split()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def cached_prefix_tokens(system_tokens: int) -> int:
+    if system_tokens < CACHE_MIN_TOKENS:
+        return 0
+    return system_tokens // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    error_rate: share of stage-1/2 outputs that report an error
+    missing_rate: share of audits that answer missingErrorsExists = "YES"
+    (drives the loop; 1.0 makes every segment run max_rounds rounds)
+    reason_words: length of generated reasoning strings (0 = a short fixed
+    sentence), for benchmarks where prompt size matters
+    """
+
+    model_name: str = "fake-mt-judge"
+    seed: int = 0
+    latency_ms: float = 0.0
+    latency_sigma: float = 0.0
+    error_rate: float = 0.2
+    missing_rate: float = 0.1
+    reason_words: int = 0
+
+    _schemas: Dict[str, type] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-mt-judge"
+
+    def bind_tools(self, tools, tool_choice: Optional[str] = None, **kwargs):
+        for tool in tools:
+            self._schemas[tool.__name__] = tool
+        return self.bind(tool_choice=tool_choice or tools[0].__name__, **kwargs)
+
+    # responses
+
+    def _rng(self, schema_name: str, messages: List[BaseMessage]) -> random.Random:
+        h = hashlib.sha256(f"{self.seed}\x00{schema_name}".encode())
+        for m in messages:
+            h.update(b"\x00")
+            h.update(str(m.content).encode("utf-8"))
+        return random.Random(int.from_bytes(h.digest()[:8], "big"))
+
+    def _latency(self, rng: random.Random) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.latency_ms / 1000 * math.exp(self.latency_sigma * rng.gauss(0.0, 1.0))
+
+    def _probability(self, rng: random.Random) -> float:
+        if rng.random() < self.error_rate:
+            return round(rng.uniform(0.5, 0.95), 2)
+        return round(rng.uniform(0.0, 0.2), 2)
+
+    def _text(self, rng: random.Random, default: str) -> str:
+        if not self.reason_words:
+            return default
+        return " ".join(rng.choice(_REASON_WORDS) for _ in range(self.reason_words)).capitalize() + "."
+
+    def _build(self, schema, rng: random.Random) -> Dict[str, Any]:
+        if schema is AgentOutputStage1:
+            return {
+                "probability": self._probability(rng),
+                "reason": self._text(rng, "Synthetic stage-1 assessment."),
+                "confidence": round(rng.uniform(60, 100)),
+            }
+        if schema is AgentOutputStage2:
+            return {
+                "reEvaluatedProb": self._probability(rng),
+                "thoughtsOnStage1": self._text(rng, "Synthetic review of the stage-1 assessment."),
+                "reason": self._text(rng, "Synthetic stage-2 assessment."),
+                "reEvaluatedConfidence": round(rng.uniform(60, 100)),
+            }
+        if schema is AgentOutputStage3:
+            return {
+                "consistencyScore": round(rng.uniform(50, 100)),
+                "errorsExists": "YES" if rng.random() < self.error_rate else "NO",
+                "existanceReasoning": self._text(rng, "Synthetic verification."),
+            }
+        if schema is MissingErrorsOutput:
+            if rng.random() >= self.missing_rate:
+                return {
+                    "missingErrorsExists": "NO",
+                    "missingErrorTypes": [],
+                    "reasoning": self._text(rng, "Synthetic audit."),
+                }
+            category = rng.choice(sorted(SUB_CATEGORIES))
+            return {
+                "missingErrorsExists": "YES",
+                "missingErrorTypes": [f"{category}:{rng.choice(SUB_CATEGORIES[category])}"],
+                "reasoning": self._text(rng, "Synthetic audit."),
+            }
+        # merged stage-2 models: one nested output per (aliased) field
+        return {
+            (field.alias or name): self._build(field.annotation, rng)
+            for name, field in schema.model_fields.items()
+        }
+
+    def _respond(self, messages: List[BaseMessage], tool_choice: Optional[str]) -> Tuple[ChatResult, float]:
+        if tool_choice not in self._schemas:
+            raise ValueError(f"FakeChatModel only answers forced tool calls, got tool_choice={tool_choice!r}")
+        schema = self._schemas[tool_choice]
+        rng = self._rng(tool_choice, messages)
+        args = self._build(schema, rng)
+
+        system_tokens = sum(estimate_tokens(str(m.content)) for m in messages if m.type == "system")
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(str(args))
+        message = AIMessage(
+            content="",
+            tool_calls=[{"name": tool_choice, "args": args, "id": f"call_{rng.getrandbits(32):08x}"}],
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": {"cache_read": cached_prefix_tokens(system_tokens)},
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)]), self._latency(rng)
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_choice=None, **kwargs) -> ChatResult:
+        result, delay = self._respond(messages, tool_choice)
+        if delay:
+            time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tool_choice=None, **kwargs) -> ChatResult:
+        result, delay = self._respond(messages, tool_choice)
+        await asyncio.sleep(delay)
+        return result
@@ -0,0 +1,171 @@
+"""
+Rule Fast Paths: skip rate and agreement with the LLM
+
+Evaluates a sample corpus with the full LLM pipeline (the baseline) and with
+the deterministic rules of core.rules enabled, and reports per rule:
+
+- skip rate: share of segments the rule decides, i.e. whose stage-2 node
+  makes no call, split into errors found and confidently clean
+- agreement: on the decided segments, how often the rule's verdict
+  (probability >= 0.5) matches the baseline stage-2 agent's, and the mean
+  |difference| of the probabilities
+
+plus LLM calls per segment and the mean / max |difference| of
+final_quality_score_100 between the two runs.
+
+--fake runs offline on FakeChatModel. Without --corpus the sample is the
+synthetic corpus with mechanically broken segments mixed in (MT copied from
+the source, mojibake, U+FFFD, changed or missing final marks) and the
+English -> Hindi test case. The fake model's verdicts are random draws, so
+that only exercises the mechanics; agreement numbers mean something only
+against real models.
+
+Usage:
+    python -m benchmarks.rule_agreement --corpus sample.jsonl --model gpt-4.1-mini --json rules.json
+    python -m benchmarks.rule_agreement --fake --segments 100
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+from itertools import islice
+from typing import Dict, List
+
+from benchmarks.cascade_agreement import _run, _score
+from core.corpus import read_segments
+from core.llm_cache import set_response_cache
+from core.rules import RULES, apply_rules
+
+
+HINDI_CASE = {
+    "id": "hindi",
+    "source": "The qualities that determine a subculture as distinct may be linguistic, aesthetic, religious, "
+              "political, sexual, geographical, or a combination of factors.",
+    "mt": "वे गुण जो किसी उप-संस्कृति को अलग बनाते हैं, जैसे कि भाषा, सौंदर्य, धर्म, राजनीति, यौन, भूगोल या "
+          "कई सारे कारकों का मिश्रण हो सकते हैं.",
+    "reference": "उपसंस्कृति को विशिष्ट रूप से निर्धारित करने वाले गुण भाषाई, सौंदर्य, धार्मिक, राजनीतिक, यौन, "
+                 "भौगोलिक या कारकों का संयोजन हो सकते हैं।",
+}
+
+
+def rule_test_segments(n: int, seed: int = 0) -> List[Dict]:
+    """Synthetic segments, four in five broken in a way one of the rules can see."""
+    from benchmarks.suite import synthetic_segments
+
+    rng = random.Random(seed)
+    segments = []
+    for i, segment in enumerate(synthetic_segments(max(n - 1, 0), seed)):
+        mt = segment["mt"]
+        at = rng.randrange(len(mt))
+        kind = i % 5
+        if kind == 1:
+            mt = segment["source"]
+        elif kind == 2:
+            mt = mt[:at] + "é".encode("utf-8").decode("cp1252") + mt[at:]
+        elif kind == 3:
+            mt = mt[:at] + "\ufffd" + mt[at:]
+        elif kind == 4:
+            mt = mt.rstrip(".") + rng.choice(["!", "?", ""])
+        segments.append(dict(segment, mt=mt))
+    return (segments + [HINDI_CASE]) if n else []
+
+
+def rule_report(segments: List[Dict], baseline: List[Dict], with_rules: List[Dict], names: List[str]) -> Dict:
+    n = len(segments)
+    rules = {}
+    for name in names:
+        decided, agree, diffs, errors = 0, 0, [], 0
+        for segment, state in zip(segments, baseline):
+            decision = apply_rules(segment, [name]).get(name)
+            if decision is None:
+                continue
+            decided += 1
+            errors += decision.reEvaluatedProb >= 0.5
+            llm = state.get(name)
+            if llm is not None:
+                agree += (decision.reEvaluatedProb >= 0.5) == (llm.reEvaluatedProb >= 0.5)
+                diffs.append(abs(decision.reEvaluatedProb - llm.reEvaluatedProb))
+        rules[name] = {
+            "skip_rate": decided / n,
+            "decided_errors": errors,
+            "decided_clean": decided - errors,
+            "verdict_agreement": agree / len(diffs) if diffs else None,
+            "prob_abs_diff_mean": statistics.fmean(diffs) if diffs else None,
+        }
+
+    score_diffs = [abs(_score(b) - _score(r)) for b, r in zip(baseline, with_rules)]
+    return {
+        "segments": n,
+        "rules": rules,
+        "calls_per_segment": {
+            "baseline": statistics.fmean(s["runMetrics"]["calls"] for s in baseline),
+            "rules": statistics.fmean(s["runMetrics"]["calls"] for s in with_rules),
+        },
+        "score_abs_diff_mean": statistics.fmean(score_diffs),
+        "score_abs_diff_max": max(score_diffs),
+    }
+
+
+def format_report(report: Dict) -> str:
+    calls = report["calls_per_segment"]
+    lines = [
+        f"Segments: {report['segments']}",
+        f"Calls / segment: baseline {calls['baseline']:.1f}, rules {calls['rules']:.1f}",
+        f"Final score |diff|: mean {report['score_abs_diff_mean']:.2f}, max {report['score_abs_diff_max']:.2f}",
+        f"{'rule':<20} {'skip':>7} {'errors':>7} {'clean':>7} {'agree':>7} {'|dprob|':>8}",
+    ]
+    for name, r in report["rules"].items():
+        agree = "-" if r["verdict_agreement"] is None else f"{r['verdict_agreement']:.1%}"
+        diff = "-" if r["prob_abs_diff_mean"] is None else f"{r['prob_abs_diff_mean']:.2f}"
+        lines.append(
+            f"{name:<20} {r['skip_rate']:>7.1%} {r['decided_errors']:>7} {r['decided_clean']:>7} {agree:>7} {diff:>8}"
+        )
+    return "\n".join(lines)
+
+
+def build_apps(names: List[str], model: str, fake: bool):
+    """(baseline, rules) apps; the baseline runs every stage-2 agent, so each rule has an LLM verdict to meet."""
+    if fake:
+        from benchmarks.fake_llm import FakeChatModel
+        from core.graph import build_graph
+
+        llm = FakeChatModel()
+        return build_graph(llm=llm).compile(), build_graph(llm=llm, rules=names).compile()
+
+    from core.pipeline import PipelineConfig, build_app
+    return build_app(PipelineConfig(model=model)), build_app(PipelineConfig(model=model, rules=tuple(names)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Skip rate and LLM agreement of the deterministic rules.")
+    parser.add_argument("--corpus", default=None, help="sample corpus (default: synthetic segments with broken ones mixed in)")
+    parser.add_argument("--segments", type=int, default=100)
+    parser.add_argument("--rules", nargs="+", choices=list(RULES), default=list(RULES))
+    parser.add_argument("--max-rounds", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--model", default="gpt-4.1-mini")
+    parser.add_argument("--fake", action="store_true", help="offline run on FakeChatModel (mechanics only)")
+    parser.add_argument("--json", default=None, help="write the report here")
+    args = parser.parse_args(argv)
+
+    set_response_cache(None)
+    if args.corpus:
+        segments = list(islice(read_segments(args.corpus), args.segments))
+    else:
+        segments = rule_test_segments(args.segments)
+
+    baseline_app, rules_app = build_apps(args.rules, args.model, args.fake)
+    baseline = asyncio.run(_run(baseline_app, segments, args.max_rounds, args.concurrency))
+    with_rules = asyncio.run(_run(rules_app, segments, args.max_rounds, args.concurrency))
+    report = rule_report(segments, baseline, with_rules, args.rules)
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Stage-2 Drift: merged mode vs. 13-way fan-out
+
+Runs the standard graph on a sample corpus (one round), then re-runs stage 2
+on exactly the same stage-1 outputs with the merged per-super-category agents
+and reports how far every sub-category's reEvaluatedProb moves. The final
+score drift is computed by re-aggregating with the merged stage-2 outputs in
+place of the fan-out ones (stage-3 verdicts kept from the fan-out run).
+
+Usage:
+    python -m benchmarks.stage2_drift corpus.jsonl --limit 50 --json drift.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+from collections import defaultdict
+from itertools import islice
+
+from core.aggregation import aggregate_mt_quality
+from core.corpus import read_segments
+from core.graph import MERGED_STAGE2_MODELS, STAGE2_PROMPTS, app
+from agents.agent_factory import make_merged_error_agent_stage2
+from core.runner import build_input_state
+from core.taxonomy import CATEGORIES, SUB_CATEGORIES, stage1_key
+
+
+def build_merged_agents():
+    return [
+        make_merged_error_agent_stage2(
+            {sub: STAGE2_PROMPTS[sub] for sub in SUB_CATEGORIES[category]},
+            f"{category}Stage2",
+            stage1_key(category),
+            MERGED_STAGE2_MODELS[category],
+        )
+        for category in CATEGORIES
+    ]
+
+
+async def compare_segment(segment, merged_agents):
+    state = await app.ainvoke(build_input_state(segment, max_rounds=1))
+
+    merged = {}
+    for update in await asyncio.gather(*(agent.ainvoke(state) for agent in merged_agents)):
+        update.pop("nodeMetrics", None)
+        merged.update(update)
+
+    drift = {sub: merged[sub].reEvaluatedProb - state[sub].reEvaluatedProb for sub in merged}
+    fanout_score = state["aggregation"]["final_quality_score_100"]
+    merged_score = aggregate_mt_quality({**state, **merged})["aggregation"]["final_quality_score_100"]
+
+    return {
+        "id": segment["id"],
+        "drift": drift,
+        "decision_agrees": {
+            sub: (merged[sub].reEvaluatedProb >= 0.5) == (state[sub].reEvaluatedProb >= 0.5) for sub in merged
+        },
+        "score_drift": merged_score - fanout_score,
+    }
+
+
+def summarize(rows):
+    per_sub = defaultdict(list)
+    per_sub_agree = defaultdict(list)
+    for row in rows:
+        for sub, d in row["drift"].items():
+            per_sub[sub].append(d)
+            per_sub_agree[sub].append(row["decision_agrees"][sub])
+
+    summary = {}
+    for category in CATEGORIES:
+        for sub in SUB_CATEGORIES[category]:
+            diffs = per_sub.get(sub)
+            if not diffs:
+                continue
+            summary[sub] = {
+                "n": len(diffs),
+                "mean_signed": statistics.fmean(diffs),
+                "mean_abs": statistics.fmean(abs(d) for d in diffs),
+                "max_abs": max(abs(d) for d in diffs),
+                "decision_agreement": sum(per_sub_agree[sub]) / len(diffs),
+            }
+
+    score_drifts = [row["score_drift"] for row in rows]
+    if score_drifts:
+        summary["final_quality_score_100"] = {
+            "n": len(score_drifts),
+            "mean_signed": statistics.fmean(score_drifts),
+            "mean_abs": statistics.fmean(abs(d) for d in score_drifts),
+            "max_abs": max(abs(d) for d in score_drifts),
+        }
+    return summary
+
+
+def format_summary(summary) -> str:
+    lines = [f"{'sub-category':<28}{'n':>5}{'mean':>9}{'mean|d|':>9}{'max|d|':>9}{'agree':>8}"]
+    for key, s in summary.items():
+        agree = f"{s['decision_agreement']:>8.1%}" if "decision_agreement" in s else f"{'':>8}"
+        lines.append(
+            f"{key:<28}{s['n']:>5}{s['mean_signed']:>+9.3f}{s['mean_abs']:>9.3f}{s['max_abs']:>9.3f}{agree}"
+        )
+    return "\n".join(lines)
+
+
+async def run(segments, concurrency: int):
+    merged_agents = build_merged_agents()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(segment):
+        async with semaphore:
+            return await compare_segment(segment, merged_agents)
+
+    return await asyncio.gather(*(bounded(s) for s in segments))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure merged stage-2 drift against the fan-out.")
+    parser.add_argument("corpus", help="sample corpus (.jsonl or .tsv)")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--json", default=None, help="write per-segment drift and summary here")
+    args = parser.parse_args(argv)
+
+    segments = list(islice(read_segments(args.corpus), args.limit))
+    rows = asyncio.run(run(segments, args.concurrency))
+    summary = summarize(rows)
+
+    print("reEvaluatedProb drift (merged - fan-out):")
+    print(format_summary(summary))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "segments": rows}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
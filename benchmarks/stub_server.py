@@ -0,0 +1,334 @@
+"""
+OpenAI-Compatible Stub Server
+
+A local HTTP server speaking the chat-completions protocol that ChatOpenAI
+(agents.agent_factory) and the OpenAI SDK (core.llm_client) use, for load
+and failure testing without API spend. Point the pipeline at it with
+
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=stub python -m core.runner ...
+
+Requests are answered according to what they ask for:
+- tools + tool_choice: a tool call whose arguments are generated from the
+  tool's JSON schema (types, enums, minimum/maximum, nested objects, $refs)
+- response_format json_schema / json_object: JSON content for the schema
+- otherwise: a short text answer
+Generated values are derived from a hash of the request messages, so the
+same prompt always gets the same answer.
+
+Production-like behaviour, all configurable:
+- latency: lognormal around --latency-ms (--latency-sigma) plus
+  --ms-per-output-token for every generated token
+- --max-concurrency: requests beyond it queue, like a saturated backend
+- --rpm / --tpm: 60 s sliding-window rate limits, answered with 429, a
+  Retry-After header and x-ratelimit-* headers
+- --error-429 / --error-500: share of requests failed at random
+- token accounting (~4 characters per token); a system prompt seen before
+  counts as prefix-cached, as with the provider's prompt cache
+
+GET /stats returns request, status, token and latency (p50/p95/p99) totals;
+POST /stats/reset clears them.
+
+Usage:
+    python -m benchmarks.stub_server --port 8000 --latency-ms 400 --latency-sigma 0.6
+    python -m benchmarks.stub_server --rpm 500 --tpm 200000 --error-429 0.02 --error-500 0.01
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter, deque
+from typing import Dict, Optional
+
+from aiohttp import web
+
+from benchmarks.fake_llm import cached_prefix_tokens, estimate_tokens
+
+
+LATENCY_SAMPLES = 10_000
+
+
+class SlidingWindow:
+    """Requests and tokens admitted in the last `window` seconds."""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._events = deque()  # (timestamp, tokens)
+        self.tokens = 0
+
+    def _expire(self, now: float):
+        while self._events and self._events[0][0] <= now - self.window:
+            self.tokens -= self._events.popleft()[1]
+
+    def check(self, now: float, tokens: int, rpm: Optional[int], tpm: Optional[int]) -> Optional[float]:
+        """None if the request fits, otherwise seconds until it would."""
+        self._expire(now)
+        if rpm is not None and len(self._events) >= rpm:
+            return self._events[0][0] + self.window - now
+        if tpm is not None and self.tokens + tokens > tpm and self._events:
+            freed, waited = self.tokens + tokens - tpm, 0
+            for ts, t in self._events:
+                waited += t
+                if waited >= freed:
+                    return ts + self.window - now
+        return None
+
+    def add(self, now: float, tokens: int):
+        self._events.append((now, tokens))
+        self.tokens += tokens
+
+    @property
+    def requests(self) -> int:
+        return len(self._events)
+
+
+def generate(schema: Dict, rng: random.Random, defs: Optional[Dict] = None, name: str = ""):
+    """A value that validates against `schema` (the subset pydantic emits)."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return generate(defs[schema["$ref"].rsplit("/", 1)[-1]], rng, defs, name)
+    if "anyOf" in schema:
+        options = [s for s in schema["anyOf"] if s.get("type") != "null"] or schema["anyOf"]
+        return generate(options[0], rng, defs, name)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "const" in schema:
+        return schema["const"]
+
+    kind = schema.get("type", "object")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {key: generate(sub, rng, defs, key) for key, sub in properties.items()}
+    if kind == "array":
+        return [generate(schema.get("items", {}), rng, defs, name) for _ in range(schema.get("minItems", 0))]
+    if kind in ("number", "integer"):
+        low, high = schema.get("minimum", 0), schema.get("maximum", 100)
+        value = rng.uniform(low, high)
+        return round(value) if kind == "integer" else round(value, 2)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    if kind == "null":
+        return None
+    return f"Stub {name or 'text'}."
+
+
+class StubBackend:
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.window = SlidingWindow()
+        self.semaphore = asyncio.Semaphore(args.max_concurrency) if args.max_concurrency else None
+        self.seen_prefixes = set()
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.monotonic()
+        self.status = Counter()
+        self.totals = Counter()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    # helpers
+
+    def _latency(self, completion_tokens: int) -> float:
+        base = 0.0
+        if self.args.latency_ms > 0:
+            base = self.args.latency_ms / 1000 * math.exp(self.args.latency_sigma * self.rng.gauss(0.0, 1.0))
+        return base + completion_tokens * self.args.ms_per_output_token / 1000
+
+    def _error(self, status: int, message: str, kind: str, headers: Optional[Dict] = None) -> web.Response:
+        self.status[status] += 1
+        body = {"error": {"message": message, "type": kind, "param": None, "code": kind}}
+        return web.json_response(body, status=status, headers=headers)
+
+    def _rate_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.args.rpm:
+            headers["x-ratelimit-limit-requests"] = str(self.args.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.args.rpm - self.window.requests))
+        if self.args.tpm:
+            headers["x-ratelimit-limit-tokens"] = str(self.args.tpm)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, self.args.tpm - self.window.tokens))
+        return headers
+
+    @staticmethod
+    def _request_rng(body: Dict) -> random.Random:
+        h = hashlib.sha256(json.dumps(body.get("messages", []), sort_keys=True).encode("utf-8"))
+        return random.Random(int.from_bytes(h.digest()[:8], "big"))
+
+    def _answer(self, body: Dict, rng: random.Random) -> Dict:
+        tools = body.get("tools") or []
+        if tools:
+            choice = body.get("tool_choice")
+            name = choice.get("function", {}).get("name") if isinstance(choice, dict) else None
+            tool = next((t for t in tools if t["function"]["name"] == name), tools[0])["function"]
+            arguments = json.dumps(generate(tool.get("parameters", {}), rng))
+            return {
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [{
+                        "id": f"call_{uuid.uuid4().hex[:24]}",
+                        "type": "function",
+                        "function": {"name": tool["name"], "arguments": arguments},
+                    }],
+                },
+                "finish_reason": "tool_calls",
+                "text": arguments,
+            }
+
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            content = json.dumps(generate(response_format["json_schema"].get("schema", {}), rng))
+        elif response_format.get("type") == "json_object":
+            content = "{}"
+        else:
+            content = "Stub response."
+        return {"message": {"role": "assistant", "content": content}, "finish_reason": "stop", "text": content}
+
+    # handlers
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        self.totals["requests"] += 1
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return self._error(400, "request body is not valid JSON", "invalid_request_error")
+        if body.get("stream"):
+            return self._error(400, "streaming is not supported by the stub server", "invalid_request_error")
+
+        messages = body.get("messages", [])
+        prompt_tokens = sum(estimate_tokens(json.dumps(m.get("content") or "")) for m in messages)
+        prompt_tokens += sum(estimate_tokens(json.dumps(t)) for t in body.get("tools") or [])
+
+        now = time.monotonic()
+        wait = self.window.check(now, prompt_tokens, self.args.rpm, self.args.tpm)
+        if wait is not None:
+            headers = {"retry-after": f"{max(wait, 0.0):.3f}", **self._rate_headers()}
+            return self._error(429, "Rate limit reached for requests", "rate_limit_exceeded", headers)
+        self.window.add(now, prompt_tokens)
+
+        roll = self.rng.random()
+        if roll < self.args.error_429:
+            return self._error(429, "The engine is currently overloaded", "rate_limit_exceeded", {"retry-after": "1"})
+        if roll < self.args.error_429 + self.args.error_500:
+            return self._error(500, "The server had an error while processing your request", "server_error")
+
+        if self.semaphore is None:
+            return await self._complete(body, messages, prompt_tokens, now)
+        async with self.semaphore:
+            return await self._complete(body, messages, prompt_tokens, now)
+
+    async def _complete(self, body: Dict, messages, prompt_tokens: int, received: float) -> web.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            answer = self._answer(body, self._request_rng(body))
+            completion_tokens = estimate_tokens(answer.pop("text"))
+
+            system = "".join(str(m.get("content")) for m in messages if m.get("role") in ("system", "developer"))
+            prefix = hashlib.sha256(system.encode("utf-8")).digest()
+            cached_tokens = cached_prefix_tokens(estimate_tokens(system)) if prefix in self.seen_prefixes else 0
+            self.seen_prefixes.add(prefix)
+
+            await asyncio.sleep(self._latency(completion_tokens))
+        finally:
+            self.in_flight -= 1
+
+        self.status[200] += 1
+        self.totals["prompt_tokens"] += prompt_tokens
+        self.totals["completion_tokens"] += completion_tokens
+        self.totals["cached_tokens"] += cached_tokens
+        self.latencies.append(time.monotonic() - received)
+
+        return web.json_response(
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "logprobs": None, **answer}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                },
+            },
+            headers=self._rate_headers(),
+        )
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+
+    def stats(self) -> Dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "elapsed_s": elapsed,
+            "requests": self.totals["requests"],
+            "requests_per_s": self.totals["requests"] / elapsed if elapsed > 0 else 0.0,
+            "status": {str(k): v for k, v in sorted(self.status.items())},
+            "prompt_tokens": self.totals["prompt_tokens"],
+            "completion_tokens": self.totals["completion_tokens"],
+            "cached_tokens": self.totals["cached_tokens"],
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "latency_s": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def reset_stats(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({"reset": True})
+
+
+def build_app(args) -> web.Application:
+    backend = StubBackend(args)
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", backend.chat_completions)
+    app.router.add_get("/v1/models", backend.models)
+    app.router.add_get("/stats", backend.get_stats)
+    app.router.add_post("/stats/reset", backend.reset_stats)
+    app["backend"] = backend
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for load and failure testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="median latency before generation")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal sigma of the latency")
+    parser.add_argument("--ms-per-output-token", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=None, help="requests served at once; the rest queue")
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute before 429")
+    parser.add_argument("--tpm", type=int, default=None, help="prompt tokens per minute before 429")
+    parser.add_argument("--error-429", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--error-500", type=float, default=0.0, help="share of requests answered with 500")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"Stub OpenAI server on http://{args.host}:{args.port}/v1 (stats: /stats)")
+    web.run_app(build_app(args), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
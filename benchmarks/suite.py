@@ -0,0 +1,277 @@
+"""
+Offline Benchmark Suite
+
+Runs the evaluation graph against the deterministic FakeChatModel (see
+benchmarks.fake_llm), passed to build_graph in place of the ChatOpenAI
+client, so no API key or network is needed and every run sees
+the same verdicts, loop decisions and token counts.
+
+Benchmarks:
+- overhead: sequential app.invoke / app.ainvoke at zero model latency, i.e.
+  the pipeline's own cost per invocation and per LLM call
+- throughput: segments/s of app.ainvoke against the number of pipelines in
+  flight, at the configured model latency
+- loop: LLM calls, tokens and wall time per segment as max_rounds grows,
+  with an audit that always reports missing errors
+- memory: peak traced allocation per in-flight segment (tracemalloc)
+
+Results go to a JSON file together with the git commit and the settings
+used; pass the previous run as --baseline to print the relative change of
+every metric.
+
+Usage:
+    python -m benchmarks.suite --out bench.json
+    python -m benchmarks.suite --out bench.json --baseline bench_prev.json
+    python -m benchmarks.suite --only throughput --concurrency 1 16 64 --latency-ms 200
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, List
+
+from benchmarks.fake_llm import FakeChatModel
+from core.corpus import read_segments
+from core.llm_cache import set_response_cache
+from core.runner import build_input_state
+
+
+BENCHMARKS = ["overhead", "throughput", "loop", "memory"]
+
+_WORDS = (
+    "the a committee report river village market policy engineer signal quietly "
+    "announced delayed measured cultural ancient rapid network budget winter "
+    "students museum harbour railway festival"
+).split()
+
+
+def synthetic_segments(n: int, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+
+    def sentence():
+        return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 24))).capitalize() + "."
+
+    return [
+        {"id": str(i + 1), "source": sentence(), "mt": sentence(), "reference": sentence()}
+        for i in range(n)
+    ]
+
+
+def build_app(llm, merged_stage2: bool = False, gate: bool = False):
+    """Compile a fresh graph whose agents use `llm` instead of the OpenAI client."""
+    from core.gating import CleanGate
+    from core.graph import build_graph
+
+    return build_graph(merged_stage2=merged_stage2, gate=CleanGate() if gate else None, llm=llm).compile()
+
+
+def _per_segment(states: List[Dict], key: str) -> float:
+    return statistics.fmean(s["runMetrics"][key] for s in states)
+
+
+# benchmarks
+
+def bench_overhead(segments, args) -> Dict:
+    # zero model latency: what is left is graph, prompt rendering and
+    # validation cost (plus the fake's own, negligible, response building)
+    app = build_app(FakeChatModel(seed=args.seed, missing_rate=args.missing_rate), args.merged_stage2, args.gate)
+    inputs = [build_input_state(s, args.max_rounds) for s in segments]
+
+    started = time.perf_counter()
+    states = [app.invoke(i) for i in inputs]
+    sync_wall = (time.perf_counter() - started) / len(inputs)
+
+    async def run():
+        return [await app.ainvoke(i) for i in inputs]
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    async_wall = (time.perf_counter() - started) / len(inputs)
+
+    calls = _per_segment(states, "calls")
+    return {
+        "segments": len(inputs),
+        "calls_per_segment": calls,
+        "sync_ms_per_invocation": sync_wall * 1000,
+        "sync_ms_per_call": sync_wall * 1000 / calls,
+        "async_ms_per_invocation": async_wall * 1000,
+        "async_ms_per_call": async_wall * 1000 / calls,
+    }
+
+
+async def _run_concurrent(app, segments, concurrency: int, max_rounds: int) -> List[Dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(segment):
+        async with semaphore:
+            return await app.ainvoke(build_input_state(segment, max_rounds))
+
+    return await asyncio.gather(*(bounded(s) for s in segments))
+
+
+def bench_throughput(segments, args) -> Dict:
+    llm = FakeChatModel(
+        seed=args.seed,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        missing_rate=args.missing_rate,
+    )
+    app = build_app(llm, args.merged_stage2, args.gate)
+
+    results = {}
+    for concurrency in args.concurrency:
+        # at least two waves, so the pool actually stays full
+        batch = segments if len(segments) >= 2 * concurrency else synthetic_segments(2 * concurrency, args.seed)
+        started = time.perf_counter()
+        states = asyncio.run(_run_concurrent(app, batch, concurrency, args.max_rounds))
+        elapsed = time.perf_counter() - started
+        results[str(concurrency)] = {
+            "segments": len(batch),
+            "segments_per_s": len(batch) / elapsed,
+            "calls_per_s": sum(s["runMetrics"]["calls"] for s in states) / elapsed,
+            "mean_call_wall_s": _per_segment(states, "wall_time") / _per_segment(states, "calls"),
+        }
+    return results
+
+
+def bench_loop(segments, args) -> Dict:
+    # every audit reports missing errors, so each segment runs max_rounds rounds
+    app = build_app(FakeChatModel(seed=args.seed, missing_rate=1.0), args.merged_stage2, args.gate)
+
+    results = {}
+    for max_rounds in range(1, args.loop_max_rounds + 1):
+        started = time.perf_counter()
+        states = asyncio.run(_run_concurrent(app, segments, args.loop_concurrency, max_rounds))
+        elapsed = time.perf_counter() - started
+        results[str(max_rounds)] = {
+            "calls_per_segment": _per_segment(states, "calls"),
+            "input_tokens_per_segment": _per_segment(states, "input_tokens"),
+            "output_tokens_per_segment": _per_segment(states, "output_tokens"),
+            "ms_per_segment": elapsed / len(segments) * 1000,
+        }
+    return results
+
+
+def bench_memory(segments, args) -> Dict:
+    # a small latency keeps all segments of the batch in flight together
+    llm = FakeChatModel(seed=args.seed, latency_ms=5.0, missing_rate=args.missing_rate)
+    app = build_app(llm, args.merged_stage2, args.gate)
+    in_flight = min(len(segments), args.memory_in_flight)
+    batch = segments[:in_flight]
+
+    asyncio.run(_run_concurrent(app, batch[:1], 1, args.max_rounds))  # warm-up
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    states = asyncio.run(_run_concurrent(app, batch, in_flight, args.max_rounds))
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "in_flight": in_flight,
+        "peak_kib_per_segment": (peak - baseline) / in_flight / 1024,
+        "retained_kib_per_result": (retained - baseline) / len(states) / 1024,
+    }
+
+
+# results
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+
+def format_comparison(current: Dict, baseline: Dict) -> str:
+    now, before = _flatten(current), _flatten(baseline)
+    lines = [f"{'metric':<60}{'baseline':>14}{'current':>14}{'change':>9}"]
+    for key, value in now.items():
+        if key not in before:
+            continue
+        old = before[key]
+        change = f"{(value - old) / old:>+9.1%}" if old else f"{'':>9}"
+        lines.append(f"{key:<60}{old:>14.3f}{value:>14.3f}{change}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the evaluation graph.")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--baseline", default=None, help="previous results file to compare against")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--corpus", default=None, help="segments to use (default: synthetic)")
+    parser.add_argument("--segments", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-rounds", type=int, default=2)
+    parser.add_argument("--missing-rate", type=float, default=0.1, help="share of audits that trigger a loop")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="median fake model latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal sigma of the latency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--loop-concurrency", type=int, default=16, help="pipelines in flight for the loop benchmark")
+    parser.add_argument("--loop-max-rounds", type=int, default=4)
+    parser.add_argument("--memory-in-flight", type=int, default=32)
+    parser.add_argument("--merged-stage2", action="store_true")
+    parser.add_argument("--gate", action="store_true")
+    args = parser.parse_args(argv)
+
+    set_response_cache(None)
+
+    if args.corpus:
+        segments = list(islice(read_segments(args.corpus), args.segments))
+    else:
+        segments = synthetic_segments(args.segments, args.seed)
+
+    runners = {"overhead": bench_overhead, "throughput": bench_throughput, "loop": bench_loop, "memory": bench_memory}
+    results = {}
+    for name in args.only:
+        print(f"running {name} ...", file=sys.stderr, flush=True)
+        results[name] = runners[name](segments, args)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+
+    print(json.dumps(results, indent=4))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print()
+        print(f"Compared with {args.baseline} (commit {baseline['meta'].get('commit', '?')}):")
+        print(format_comparison(results, baseline["results"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 from core.models import MTState, AggregationOutput
 
 
+#share of each super category in the overall error probability
+CATEGORY_WEIGHTS: Dict[str, float] = {
+    "accuracy": 0.4,
+    "fluency": 0.3,
+    "terminology": 0.2,
+    "style": 0.1,
+}
+
+#a category the stage-3 verifier rejects ("NO") keeps this share of its stage-2 score
+NO_VERDICT_FACTOR = 0.3
+
+
 def weighted_mean(probs: List[float], confs: List[float]) -> float:
    
 #epistemic weighting
@@ -20,7 +32,8 @@ def weighted_mean(probs: List[float], confs: List[float]) -> float:
 def aggregate_super_category(
     state: MTState, 
     sub_keys: List[str], 
-    stage3_key: str
+    stage3_key: str,
+    no_verdict_factor: float = NO_VERDICT_FACTOR,
 ) -> float:
     
     probs = []
@@ -42,31 +55,30 @@ def aggregate_super_category(
     
     
     if stage3.errorsExists == "NO":
-        return base_score * 0.3  
+        return base_score * no_verdict_factor
     
 
     consistency_factor = stage3.consistencyScore / 100.0
     return base_score * consistency_factor
 
 
-def aggregate_mt_quality(state: MTState) -> Dict[str, AggregationOutput]:
+def aggregate_mt_quality(
+    state: MTState,
+    weights: Optional[Dict[str, float]] = None,
+    no_verdict_factor: float = NO_VERDICT_FACTOR,
+) -> Dict[str, AggregationOutput]:
     
     accuracy_subs = ["addition", "omission", "mistranslation", "untranslated_text"]
     fluency_subs = ["punctuation", "spelling", "grammar", "register", "inconsistency", "characterEncoding"]
     terminology_subs = ["inappropriate_for_context", "inconsistent_use"]
     style_subs = ["awkward"]
     
-    acc_score = aggregate_super_category(state, accuracy_subs, "accuracyStage3")
-    flu_score = aggregate_super_category(state, fluency_subs, "fluencyStage3")
-    term_score = aggregate_super_category(state, terminology_subs, "terminologyStage3")
-    style_score = aggregate_super_category(state, style_subs, "styleStage3")
+    acc_score = aggregate_super_category(state, accuracy_subs, "accuracyStage3", no_verdict_factor)
+    flu_score = aggregate_super_category(state, fluency_subs, "fluencyStage3", no_verdict_factor)
+    term_score = aggregate_super_category(state, terminology_subs, "terminologyStage3", no_verdict_factor)
+    style_score = aggregate_super_category(state, style_subs, "styleStage3", no_verdict_factor)
     
-    weights = {
-        "accuracy": 0.4,     
-        "fluency": 0.3,       
-        "terminology": 0.2,   
-        "style": 0.1,        
-    }
+    weights = weights or CATEGORY_WEIGHTS
     
     overall_error_prob = (
         weights["accuracy"] * acc_score +
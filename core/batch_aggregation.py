@@ -0,0 +1,240 @@
+"""
+Batch Aggregation
+
+NumPy counterpart of core.aggregation for re-scoring many stored segment
+results at once, e.g. to calibrate the category weights against human MQM
+scores:
+
+    arrays = AggregationArrays.from_states(results)        # MTState or serialized dicts
+    scores = aggregate_batch(arrays)["final_quality_score_100"]
+    grid = simplex_grid(0.05)                               # (G, 4) weight vectors
+    finals = sweep_scores(arrays, grid)                     # (G, N)
+    r = sweep_pearson(arrays, grid, -mqm)                   # (G,) without materializing (G, N)
+
+Results equal aggregate_mt_quality up to float rounding (sums run in the
+same order as the scalar code, but Python's sum() may round differently
+from numpy), and a missing stage-2 output contributes exact zeros.
+Columns follow core.taxonomy: SUB_KEYS for stage 2, CATEGORIES for stage 3
+and for the weight vectors.
+"""
+
+from dataclasses import dataclass
+from itertools import product
+from typing import Dict, Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+from core.aggregation import CATEGORY_WEIGHTS, NO_VERDICT_FACTOR
+from core.taxonomy import CATEGORIES, SUB_CATEGORIES, stage3_key
+
+
+SUB_KEYS = [sub for category in CATEGORIES for sub in SUB_CATEGORIES[category]]
+
+# stage-3 verdict codes
+VERDICT_MISSING, VERDICT_NO, VERDICT_YES = 0, 1, 2
+
+DEFAULT_CHUNK_SIZE = 65536
+
+
+def _get(output, name: str):
+    return output.get(name) if isinstance(output, dict) else getattr(output, name)
+
+
+@dataclass
+class AggregationArrays:
+    """
+    probs / confs: (N, 13) stage-2 reEvaluatedProb / reEvaluatedConfidence,
+    0 where the output is missing; present: (N, 13) bool
+    verdicts: (N, 4) VERDICT_* codes; consistency: (N, 4) consistencyScore
+    """
+
+    probs: np.ndarray
+    confs: np.ndarray
+    present: np.ndarray
+    verdicts: np.ndarray
+    consistency: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.probs)
+
+    def __getitem__(self, index) -> "AggregationArrays":
+        return AggregationArrays(
+            self.probs[index], self.confs[index], self.present[index], self.verdicts[index], self.consistency[index]
+        )
+
+    @classmethod
+    def from_states(cls, states: Iterable) -> "AggregationArrays":
+        """From MTState dicts or their serialized form (core.corpus.serialize_state)."""
+        states = list(states)
+        n = len(states)
+        probs = np.zeros((n, len(SUB_KEYS)))
+        confs = np.zeros((n, len(SUB_KEYS)))
+        present = np.zeros((n, len(SUB_KEYS)), dtype=bool)
+        verdicts = np.full((n, len(CATEGORIES)), VERDICT_MISSING, dtype=np.int8)
+        consistency = np.zeros((n, len(CATEGORIES)))
+
+        for i, state in enumerate(states):
+            for j, key in enumerate(SUB_KEYS):
+                output = state.get(key)
+                if output is not None:
+                    probs[i, j] = _get(output, "reEvaluatedProb")
+                    confs[i, j] = _get(output, "reEvaluatedConfidence")
+                    present[i, j] = True
+            for j, category in enumerate(CATEGORIES):
+                output = state.get(stage3_key(category))
+                if output is not None:
+                    verdicts[i, j] = VERDICT_NO if _get(output, "errorsExists") == "NO" else VERDICT_YES
+                    consistency[i, j] = _get(output, "consistencyScore")
+        return cls(probs, confs, present, verdicts, consistency)
+
+
+def base_scores(arrays: AggregationArrays) -> np.ndarray:
+    """(N, 4) confidence-weighted mean stage-2 probability per category (weighted_mean)."""
+    weights = np.where(arrays.present, arrays.confs / 100.0, 0.0)
+    terms = np.where(arrays.present, arrays.probs * weights, 0.0)
+    scores = np.zeros((len(arrays), len(CATEGORIES)))
+
+    column = 0
+    for k, category in enumerate(CATEGORIES):
+        total_weight = np.zeros(len(arrays))
+        weighted = np.zeros(len(arrays))
+        for _ in SUB_CATEGORIES[category]:
+            total_weight += weights[:, column]
+            weighted += terms[:, column]
+            column += 1
+        nonzero = total_weight != 0
+        scores[nonzero, k] = weighted[nonzero] / total_weight[nonzero]
+    return scores
+
+
+def _category_score(base, verdicts, consistency, no_verdict_factor):
+    # one category; no_verdict_factor is a float or a (G, 1) column
+    rejected = base * no_verdict_factor
+    verified = base * (consistency / 100.0)
+    return np.where(verdicts == VERDICT_NO, rejected, np.where(verdicts == VERDICT_MISSING, base, verified))
+
+
+def category_scores(arrays: AggregationArrays, no_verdict_factor: float = NO_VERDICT_FACTOR) -> np.ndarray:
+    """(N, 4) per-category error scores (aggregate_super_category)."""
+    base = base_scores(arrays)
+    return np.stack(
+        [
+            _category_score(base[:, k], arrays.verdicts[:, k], arrays.consistency[:, k], no_verdict_factor)
+            for k in range(len(CATEGORIES))
+        ],
+        axis=1,
+    )
+
+
+def weight_vector(weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+    weights = weights or CATEGORY_WEIGHTS
+    return np.array([weights[category] for category in CATEGORIES], dtype=float)
+
+
+def aggregate_batch(
+    arrays: AggregationArrays,
+    weights: Optional[Dict[str, float]] = None,
+    no_verdict_factor: float = NO_VERDICT_FACTOR,
+) -> Dict[str, np.ndarray]:
+    """Column-wise aggregate_mt_quality: the same keys, one array of N values each."""
+    scores = category_scores(arrays, no_verdict_factor)
+    w = weight_vector(weights)
+    overall = w[0] * scores[:, 0]
+    for k in range(1, len(CATEGORIES)):
+        overall = overall + w[k] * scores[:, k]
+    return {
+        "accuracy_error": scores[:, 0],
+        "fluency_error": scores[:, 1],
+        "terminology_error": scores[:, 2],
+        "style_error": scores[:, 3],
+        "overall_error_probability": overall,
+        "final_quality_score_100": (1.0 - overall) * 100.0,
+    }
+
+
+def simplex_grid(step: float = 0.1) -> np.ndarray:
+    """Every weight vector on a `step` lattice with non-negative weights summing to 1, shape (G, 4)."""
+    n = round(1 / step)
+    rows = [ks for ks in product(range(n + 1), repeat=len(CATEGORIES) - 1) if sum(ks) <= n]
+    return np.array([[k / n for k in ks] + [(n - sum(ks)) / n] for ks in rows])
+
+
+def _sweep_chunk(arrays: AggregationArrays, grid: np.ndarray, factors) -> np.ndarray:
+    base = base_scores(arrays)
+    overall = None
+    for k in range(len(CATEGORIES)):
+        score = _category_score(base[:, k], arrays.verdicts[:, k], arrays.consistency[:, k], factors)
+        term = grid[:, k:k + 1] * score
+        overall = term if overall is None else overall + term
+    return (1.0 - overall) * 100.0
+
+
+def _factors(grid: np.ndarray, no_verdict_factors: Union[None, float, Sequence[float]]):
+    if no_verdict_factors is None:
+        return NO_VERDICT_FACTOR
+    if np.ndim(no_verdict_factors) == 0:
+        return float(no_verdict_factors)
+    factors = np.asarray(no_verdict_factors, dtype=float).reshape(-1, 1)
+    if len(factors) != len(grid):
+        raise ValueError(f"{len(factors)} no-verdict factors for {len(grid)} weight vectors")
+    return factors
+
+
+def sweep_scores(
+    arrays: AggregationArrays,
+    grid,
+    no_verdict_factors: Union[None, float, Sequence[float]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> np.ndarray:
+    """
+    Final quality scores for every weight vector in `grid` (G, 4), shape
+    (G, N). no_verdict_factors: one factor for all rows or one per row.
+    """
+    grid = np.atleast_2d(np.asarray(grid, dtype=float))
+    factors = _factors(grid, no_verdict_factors)
+    out = np.empty((len(grid), len(arrays)))
+    for start in range(0, len(arrays), chunk_size):
+        stop = min(start + chunk_size, len(arrays))
+        out[:, start:stop] = _sweep_chunk(arrays[start:stop], grid, factors)
+    return out
+
+
+def sweep_pearson(
+    arrays: AggregationArrays,
+    grid,
+    target,
+    no_verdict_factors: Union[None, float, Sequence[float]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> np.ndarray:
+    """
+    Pearson correlation of the final scores with `target` (N,) for every
+    weight vector, shape (G,). Accumulated chunk by chunk, so memory stays at
+    G x chunk_size. Pass MQM penalties negated to get positive correlations.
+    """
+    grid = np.atleast_2d(np.asarray(grid, dtype=float))
+    factors = _factors(grid, no_verdict_factors)
+    target = np.asarray(target, dtype=float)
+    if len(target) != len(arrays):
+        raise ValueError(f"{len(target)} targets for {len(arrays)} segments")
+
+    n = len(arrays)
+    t_centered = target - target.mean()
+    sum_x = np.zeros(len(grid))
+    sum_xx = np.zeros(len(grid))
+    sum_xt = np.zeros(len(grid))
+    shift = None
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        scores = _sweep_chunk(arrays[start:stop], grid, factors)
+        # sums around the first chunk's mean: scores sit in a narrow band near 100
+        if shift is None:
+            shift = scores.mean(axis=1, keepdims=True)
+        scores -= shift
+        sum_x += scores.sum(axis=1)
+        sum_xx += (scores * scores).sum(axis=1)
+        sum_xt += scores @ t_centered[start:stop]
+
+    var_x = sum_xx - sum_x * sum_x / n
+    var_t = (t_centered * t_centered).sum()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sum_xt / np.sqrt(var_x * var_t)
@@ -0,0 +1,145 @@
+"""
+Model Cascade
+
+Cheap-first evaluation: every stage runs on a cheaper, faster model and
+only uncertain work is redone on the strong model (PipelineConfig.model).
+An output is uncertain when
+
+- stage 1: confidence < min_confidence
+- stage 2: reEvaluatedConfidence < min_confidence (merged stage 2: any
+  sub category)
+- stage 3: consistencyScore < min_consistency
+
+Two escalation levels:
+
+- node: the uncertain node alone is re-requested from the strong model
+  (same messages) and its output replaces the cheap one; later stages read
+  the escalated output. Counted per call in the `escalations` metric.
+- segment: the whole segment runs on the cheap models first; if any output
+  in the final state is uncertain, the segment is evaluated again end to
+  end on the strong model and that result is returned.
+
+The missing-errors audit decides whether another round runs, so it uses
+audit_model (default: the strong model) and never escalates.
+
+    from core.cascade import CascadeConfig
+    from core.pipeline import PipelineConfig, build_app
+
+    app = build_app(PipelineConfig(model="gpt-4.1", cascade=CascadeConfig(stage1_model="gpt-4.1-nano")))
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from core.metrics import summarize_records
+from core.models import AgentOutputStage1, AgentOutputStage2, AgentOutputStage3, MTState
+from core.taxonomy import CATEGORIES, SUB_CATEGORIES, stage1_key, stage3_key
+
+
+@dataclass(frozen=True)
+class CascadeConfig:
+    """
+    stage1/2/3_model: cheap model per stage (None = the strong model)
+    audit_model: model of the missing-errors audit (None = the strong model)
+    min_confidence / min_consistency: escalate below these (0-100)
+    level: "node" or "segment"
+    """
+
+    stage1_model: Optional[str] = "gpt-4.1-nano"
+    stage2_model: Optional[str] = "gpt-4.1-nano"
+    stage3_model: Optional[str] = "gpt-4.1-nano"
+    audit_model: Optional[str] = None
+    min_confidence: float = 70.0
+    min_consistency: float = 70.0
+    level: str = "node"
+
+    def __post_init__(self):
+        if self.level not in ("node", "segment"):
+            raise ValueError(f"Unknown cascade level: {self.level!r}")
+
+    def is_uncertain(self, output) -> bool:
+        if output is None:
+            return False
+        if isinstance(output, AgentOutputStage1):
+            return output.confidence < self.min_confidence
+        if isinstance(output, AgentOutputStage2):
+            return output.reEvaluatedConfidence < self.min_confidence
+        if isinstance(output, AgentOutputStage3):
+            return output.consistencyScore < self.min_consistency
+        # merged stage-2 output: one AgentOutputStage2 per sub category
+        fields = getattr(type(output), "model_fields", {})
+        return any(self.is_uncertain(getattr(output, name)) for name in fields)
+
+
+@dataclass(frozen=True)
+class Escalation:
+    """What a node escalates to: the strong model, and when (the cascade's thresholds)."""
+
+    llm: Any
+    cascade: CascadeConfig
+
+    def should_escalate(self, output) -> bool:
+        return self.cascade.is_uncertain(output)
+
+
+def segment_is_uncertain(state: MTState, cascade: CascadeConfig) -> bool:
+    for category in CATEGORIES:
+        keys = [stage1_key(category), *SUB_CATEGORIES[category], stage3_key(category)]
+        if any(cascade.is_uncertain(state.get(key)) for key in keys):
+            return True
+    return False
+
+
+class SegmentCascade:
+    """
+    Segment-level cascade over two compiled graphs: `cheap_app` first,
+    `strong_app` again for segments whose cheap result is uncertain. The
+    returned state carries the node metrics of both runs, and
+    runMetrics["segment_escalated"] says which result it is.
+    """
+
+    def __init__(self, cheap_app, strong_app, cascade: CascadeConfig):
+        self.cheap_app = cheap_app
+        self.strong_app = strong_app
+        self.cascade = cascade
+        self.segments = 0
+        self.escalated = 0
+        self._lock = threading.Lock()
+
+    def _count(self, escalated: bool):
+        with self._lock:
+            self.segments += 1
+            self.escalated += escalated
+
+    @staticmethod
+    def _merge(cheap: Dict, strong: Optional[Dict]) -> Dict:
+        if strong is None:
+            result = dict(cheap)
+            records = cheap.get("nodeMetrics") or []
+        else:
+            result = dict(strong)
+            records = (cheap.get("nodeMetrics") or []) + (strong.get("nodeMetrics") or [])
+        result["nodeMetrics"] = records
+        result["runMetrics"] = summarize_records(records)
+        result["runMetrics"]["segment_escalated"] = strong is not None
+        return result
+
+    def invoke(self, state: Dict, config=None, **kwargs) -> Dict:
+        cheap = self.cheap_app.invoke(state, config, **kwargs)
+        escalate = segment_is_uncertain(cheap, self.cascade)
+        self._count(escalate)
+        strong = self.strong_app.invoke(state, config, **kwargs) if escalate else None
+        return self._merge(cheap, strong)
+
+    async def ainvoke(self, state: Dict, config=None, **kwargs) -> Dict:
+        cheap = await self.cheap_app.ainvoke(state, config, **kwargs)
+        escalate = segment_is_uncertain(cheap, self.cascade)
+        self._count(escalate)
+        strong = await self.strong_app.ainvoke(state, config, **kwargs) if escalate else None
+        return self._merge(cheap, strong)
+
+    def format_stats(self) -> str:
+        with self._lock:
+            rate = self.escalated / self.segments if self.segments else 0.0
+            return f"{self.escalated} of {self.segments} segments escalated to the strong model ({rate:.1%})"
@@ -0,0 +1,463 @@
+"""
+Run Checkpoints
+
+SQLite-backed LangGraph checkpointer plus a run manifest, so a corpus run
+that dies part way can be restarted: finished segments are skipped and
+unfinished ones resume from their last completed node instead of starting
+over.
+
+- SQLiteCheckpointSaver keeps the latest checkpoint of every thread (one
+  thread per segment) and the pending writes of that checkpoint, i.e. the
+  nodes that completed in the superstep that was running. Older checkpoints
+  are never needed to resume and are overwritten.
+- Writes are batched: put / put_writes update an in-memory copy and queue
+  the row; a background thread writes the queued rows in one transaction
+  every `flush_interval` seconds or every `batch_size` operations. Repeated
+  checkpoints of a thread between two flushes collapse into one row. A crash
+  loses at most the last interval of progress, never consistency.
+- RunManifest records every finished segment in the same database and the
+  same transaction that drops its checkpoint, so a segment is never both
+  marked finished and resumable, or neither. Marks reach the saver only on
+  RunManifest.sync(), which the runner calls once the sink holds no
+  buffered rows. A segment that finished in the last flush interval before
+  a crash, or whose row was still buffered, is still resumable: the restart
+  replays its final checkpoint (no LLM calls) and writes it to the sink a
+  second time, so readers of an appended sink keep the last row per id.
+- The default serializer is allowed to rebuild the agent outputs of
+  MTState (STATE_TYPES), so a resumed segment gets the same pydantic models
+  a fresh one does. langgraph-checkpoint versions without a deserialization
+  allowlist (the pinned 2.1.x) rebuild them without one.
+
+    saver = SQLiteCheckpointSaver("run.sqlite")
+    app = build_app(PipelineConfig(checkpointer=saver))
+    manifest = RunManifest(saver)
+    config = {"configurable": {"thread_id": manifest.key(segment)}}
+    result = app.invoke(None if manifest.resumable(segment) else state, config)
+    sink.write(segment, result=result)
+    manifest.mark(segment)
+    manifest.sync()                       # once the row is durable in the sink
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from core.models import AgentOutputStage1, AgentOutputStage2, AgentOutputStage3, MissingErrorsOutput
+
+# pydantic models stored in MTState
+STATE_TYPES = (AgentOutputStage1, AgentOutputStage2, AgentOutputStage3, MissingErrorsOutput)
+
+
+def state_serializer() -> JsonPlusSerializer:
+    """JsonPlusSerializer with STATE_TYPES on its deserialization allowlist, where it has one."""
+    allowed = [(*cls.__module__.split("."), cls.__name__) for cls in STATE_TYPES]
+    try:
+        return JsonPlusSerializer(allowed_json_modules=allowed)
+    except TypeError:
+        return JsonPlusSerializer()
+
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS checkpoints (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        checkpoint_id TEXT NOT NULL,
+        parent_checkpoint_id TEXT,
+        type TEXT,
+        checkpoint BLOB,
+        metadata_type TEXT,
+        metadata BLOB,
+        PRIMARY KEY (thread_id, checkpoint_ns)
+    )""",
+    """CREATE TABLE IF NOT EXISTS writes (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        checkpoint_id TEXT NOT NULL,
+        task_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        type TEXT,
+        value BLOB,
+        task_path TEXT,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+    )""",
+    """CREATE TABLE IF NOT EXISTS segments (
+        key TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        error TEXT,
+        finished_at REAL NOT NULL
+    )""",
+]
+
+
+class _Saved:
+    """Latest checkpoint of one (thread, namespace), serialized, plus its pending writes."""
+
+    __slots__ = ("checkpoint_id", "parent_id", "checkpoint", "metadata", "writes")
+
+    def __init__(self, checkpoint_id, parent_id, checkpoint, metadata):
+        self.checkpoint_id = checkpoint_id
+        self.parent_id = parent_id
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.writes: Dict[Tuple[str, int], tuple] = {}
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+
+    def __init__(self, path: str, batch_size: int = 512, flush_interval: float = 0.5, serde=None):
+        super().__init__(serde=serde or state_serializer())
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._db_lock = threading.Lock()
+
+        # threads touched by this process; None = finished (dropped)
+        self._latest: Dict[Tuple[str, str], Optional[_Saved]] = {}
+        # (thread, ns) -> queued state, written on the next flush
+        self._dirty: Dict[Tuple[str, str], Optional[_Saved]] = {}
+        self._finished: Dict[str, Tuple[str, Optional[str], float]] = {}
+        self._ops = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+
+        self.flushes = 0
+        self.rows_written = 0
+        self.ops_queued = 0
+        self._flusher = threading.Thread(target=self._flush_loop, name="checkpoint-flush", daemon=True)
+        self._flusher.start()
+
+    # storage
+
+    def _load(self, thread_id: str, checkpoint_ns: str) -> Optional[_Saved]:
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            if key in self._latest:
+                return self._latest[key]
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            writes = self._conn.execute(
+                "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, row[0]),
+            ).fetchall()
+        saved = _Saved(row[0], row[1], (row[2], row[3]), (row[4], row[5]))
+        for task_id, idx, channel, type_, value, task_path in writes:
+            saved.writes[(task_id, idx)] = (task_id, channel, (type_, value), task_path)
+        with self._lock:
+            # a concurrent put wins over what was on disk
+            return self._latest.setdefault(key, saved)
+
+    def _queue(self, key: Tuple[str, str], saved: Optional[_Saved], ops: int = 1):
+        # caller holds self._lock
+        self._latest[key] = saved
+        self._dirty[key] = saved
+        self._ops += ops
+        self.ops_queued += ops
+        if self._ops >= self.batch_size:
+            self._wake.notify()
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, saved: _Saved) -> CheckpointTuple:
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": saved.checkpoint_id,
+            }},
+            checkpoint=self.serde.loads_typed(saved.checkpoint),
+            metadata=self.serde.loads_typed(saved.metadata),
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": saved.parent_id,
+                }}
+                if saved.parent_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value)) for task_id, channel, value, _ in saved.writes.values()],
+        )
+
+    # BaseCheckpointSaver
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = self._load(thread_id, checkpoint_ns)
+        if saved is None:
+            return None
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id and checkpoint_id != saved.checkpoint_id:
+            return None  # only the latest checkpoint is kept
+        return self._tuple(thread_id, checkpoint_ns, saved)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is None:
+            self.flush()
+            with self._db_lock:
+                keys = self._conn.execute("SELECT thread_id, checkpoint_ns FROM checkpoints").fetchall()
+        else:
+            keys = [(config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))]
+        before_id = get_checkpoint_id(before) if before else None
+        for thread_id, checkpoint_ns in keys:
+            if limit is not None and limit <= 0:
+                return
+            saved = self._load(thread_id, checkpoint_ns)
+            if saved is None or (before_id and saved.checkpoint_id >= before_id):
+                continue
+            item = self._tuple(thread_id, checkpoint_ns, saved)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = _Saved(
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            self.serde.dumps_typed(checkpoint),
+            self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+        )
+        with self._lock:
+            self._queue((thread_id, checkpoint_ns), saved)
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = self._load(thread_id, checkpoint_ns)
+        if saved is None or saved.checkpoint_id != config["configurable"]["checkpoint_id"]:
+            return  # writes of a checkpoint that has been superseded
+        serialized = [(channel, self.serde.dumps_typed(value)) for channel, value in writes]
+        with self._lock:
+            for idx, (channel, value) in enumerate(serialized):
+                inner = (task_id, WRITES_IDX_MAP.get(channel, idx))
+                if inner[1] >= 0 and inner in saved.writes:
+                    continue
+                saved.writes[inner] = (task_id, channel, value, task_path)
+            self._queue((thread_id, checkpoint_ns), saved, ops=len(serialized))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._latest if k[0] == thread_id] or [(thread_id, "")]:
+                self._queue(key, None)
+
+    def get_next_version(self, current, channel) -> str:
+        return InMemorySaver.get_next_version(self, current, channel)
+
+    # reads of a thread not touched yet in this process hit SQLite: keep them off the event loop
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        key = (config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        if key in self._latest:
+            return self.get_tuple(config)
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    # manifest
+
+    def finish_thread(self, thread_id: str, status: str, error: Optional[str] = None, keep_checkpoint: bool = False):
+        """Record a finished segment; unless kept, its checkpoint is dropped in the same transaction."""
+        with self._lock:
+            self._finished[thread_id] = (status, error, time.time())
+            if keep_checkpoint:
+                self._ops += 1
+            else:
+                # leaves a None tombstone in memory: the state itself is released
+                for key in [k for k in self._latest if k[0] == thread_id] or [(thread_id, "")]:
+                    self._queue(key, None)
+
+    def finished(self) -> Dict[str, str]:
+        self.flush()
+        with self._db_lock:
+            return dict(self._conn.execute("SELECT key, status FROM segments").fetchall())
+
+    # batching
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                self._wake.wait_for(lambda: self._closed or self._ops >= self.batch_size, timeout=self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Write every queued row in one transaction."""
+        with self._db_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                finished, self._finished = self._finished, {}
+                self._ops = 0
+                # snapshot writes under the lock: put_writes may add to them meanwhile
+                dirty = {key: (saved, dict(saved.writes) if saved else None) for key, saved in dirty.items()}
+            if not dirty and not finished:
+                return
+
+            checkpoints, writes, dropped = [], [], []
+            for (thread_id, checkpoint_ns), (saved, saved_writes) in dirty.items():
+                dropped.append((thread_id, checkpoint_ns))
+                if saved is None:
+                    continue
+                checkpoints.append((
+                    thread_id, checkpoint_ns, saved.checkpoint_id, saved.parent_id,
+                    saved.checkpoint[0], saved.checkpoint[1], saved.metadata[0], saved.metadata[1],
+                ))
+                for (task_id, idx), (_, channel, value, task_path) in saved_writes.items():
+                    writes.append((
+                        thread_id, checkpoint_ns, saved.checkpoint_id, task_id, idx, channel, value[0], value[1], task_path,
+                    ))
+
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?", dropped)
+                conn.executemany("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ?", dropped)
+                conn.executemany("INSERT INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)", checkpoints)
+                conn.executemany("INSERT INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", writes)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?)",
+                    [(key, status, error, at) for key, (status, error, at) in finished.items()],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.flushes += 1
+            self.rows_written += len(checkpoints) + len(writes) + len(finished)
+
+    def format_stats(self) -> str:
+        mean = self.rows_written / self.flushes if self.flushes else 0.0
+        return (
+            f"{self.ops_queued} checkpoint operations, {self.rows_written} rows written in "
+            f"{self.flushes} transactions ({mean:.1f} rows each)"
+        )
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+        self._flusher.join()
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+class RunManifest:
+    """
+    Which segments of a run are finished, stored next to their checkpoints.
+    Segments are identified by their "id", or by a hash of source / mt /
+    reference when they have none, so ids must be unique within a corpus.
+    """
+
+    def __init__(self, saver: SQLiteCheckpointSaver):
+        self.saver = saver
+        self._finished = saver.finished()
+        self._unsynced: List[Tuple[str, str, Optional[str]]] = []
+
+    @staticmethod
+    def key(segment: Dict) -> str:
+        if segment.get("id") is not None:
+            return f"id:{segment['id']}"
+        text = "\x00".join(str(segment.get(k)) for k in ("source", "mt", "reference"))
+        return "sha1:" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def is_done(self, segment: Dict) -> bool:
+        return self._finished.get(self.key(segment)) == "done"
+
+    def pending(self, segments: Sequence[Dict]) -> List[Dict]:
+        """Segments still to run, in order: everything not finished successfully."""
+        return [s for s in segments if not self.is_done(s)]
+
+    def config(self, segment: Dict) -> RunnableConfig:
+        return {"configurable": {"thread_id": self.key(segment)}}
+
+    def resumable(self, segment: Dict) -> bool:
+        return self.saver.get_tuple(self.config(segment)) is not None
+
+    def mark(self, segment: Dict, error: Optional[str] = None):
+        """Record a finished segment; it is handed to the saver on the next sync()."""
+        key = self.key(segment)
+        status = "done" if error is None else "failed"
+        self._unsynced.append((key, status, error))
+        self._finished[key] = status
+
+    def sync(self):
+        """
+        Hand the segments marked since the last sync to the saver. Call it
+        only once their results are durable in the sink: until then a crash
+        leaves them resumable, and the restart replays their final
+        checkpoint instead of skipping a row that never reached the sink.
+        """
+        unsynced, self._unsynced = self._unsynced, []
+        for key, status, error in unsynced:
+            # a failed segment keeps its checkpoint, so a restart retries only the node that failed
+            self.saver.finish_thread(key, status, error, keep_checkpoint=status != "done")
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for status in self._finished.values():
+            counts[status] = counts.get(status, 0) + 1
+        return counts
@@ -0,0 +1,476 @@
+"""
+Columnar Results Store
+
+On-disk format for evaluation results with one row per segment result
+written (its final state; `round` is the round it stopped at), split into
+two column groups:
+
+- numeric: typed columns for every stage-1/2/3 score and verdict, the audit
+  verdict, the aggregation scores and the run metrics. Loaded memory-mapped,
+  so analytics and re-aggregation (core.batch_aggregation) over millions of
+  segments read only the columns they touch.
+- text: id, source / mt / reference, error, and every reasoning string,
+  stored apart so the numeric group never pays for them.
+
+A store is a directory. With pyarrow installed each writer session adds one
+numeric and one text Arrow IPC file (uncompressed), and closing the sink
+compacts the numeric group into a single file holding a single record
+batch, so numeric columns memory-map without copying. Text parts are
+read one after the other. Without pyarrow, numeric columns are raw
+little-endian files appended in place and read with numpy.memmap, and text
+rows go to text.jsonl. schema.json records the backend, columns, parts and
+committed row count.
+
+Missing outputs are NaN (floats) or VERDICT_MISSING (verdict columns); a
+segment that failed has failed=True and its error in the text group.
+
+    sink = ColumnarSink("results.cols")          # same interface as the runner's sinks
+    store = open_store("results.cols")
+    scores = store.numeric(["aggregation.final_quality_score_100"])
+    arrays = store.aggregation_arrays()          # for core.batch_aggregation
+
+Existing JSONL results convert with:
+
+    python -m core.columnar results.jsonl results.cols
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from core.batch_aggregation import SUB_KEYS, VERDICT_MISSING, VERDICT_NO, VERDICT_YES, AggregationArrays
+from core.taxonomy import CATEGORIES, stage1_key, stage3_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+
+
+AGGREGATION_KEYS = [
+    "accuracy_error",
+    "fluency_error",
+    "terminology_error",
+    "style_error",
+    "overall_error_probability",
+    "final_quality_score_100",
+]
+RUN_METRIC_COUNTS = ["calls", "cache_hits", "input_tokens", "cached_tokens", "output_tokens", "retries", "escalations"]
+
+
+def _numeric_schema() -> List[tuple]:
+    columns = [("round", "int16"), ("failed", "bool")]
+    for category in CATEGORIES:
+        columns += [(f"{stage1_key(category)}.probability", "float64"), (f"{stage1_key(category)}.confidence", "float64")]
+    for sub in SUB_KEYS:
+        columns += [(f"{sub}.reEvaluatedProb", "float64"), (f"{sub}.reEvaluatedConfidence", "float64")]
+    for category in CATEGORIES:
+        columns += [(f"{stage3_key(category)}.consistencyScore", "float64"), (f"{stage3_key(category)}.errorsExists", "int8")]
+    columns.append(("missingErrors.missingErrorsExists", "int8"))
+    columns += [(f"aggregation.{key}", "float64") for key in AGGREGATION_KEYS]
+    columns += [(f"runMetrics.{key}", "int64") for key in RUN_METRIC_COUNTS]
+    columns.append(("runMetrics.llm_time", "float64"))
+    return columns
+
+
+def _text_schema() -> List[str]:
+    columns = ["id", "source", "mt", "reference", "error"]
+    columns += [f"{stage1_key(category)}.reason" for category in CATEGORIES]
+    for sub in SUB_KEYS:
+        columns += [f"{sub}.reason", f"{sub}.thoughtsOnStage1"]
+    columns += [f"{stage3_key(category)}.existanceReasoning" for category in CATEGORIES]
+    columns += ["missingErrors.reasoning", "missingErrors.missingErrorTypes"]
+    return columns
+
+
+NUMERIC_COLUMNS = _numeric_schema()
+TEXT_COLUMNS = _text_schema()
+_MISSING = {"float64": np.nan, "int8": VERDICT_MISSING, "int16": 0, "int64": 0, "bool": False}
+
+
+def _get(output, name: str):
+    return output.get(name) if isinstance(output, dict) else getattr(output, name, None)
+
+
+def _verdict(value) -> int:
+    if value is None:
+        return VERDICT_MISSING
+    return VERDICT_NO if value == "NO" else VERDICT_YES
+
+
+def flatten_state(segment: Dict, result: Optional[Dict] = None, error: Optional[str] = None):
+    """(numeric, text) row dicts for one result; MTState or its serialized form."""
+    state = result or {}
+    numeric = {"round": state.get("round") or 1, "failed": error is not None}
+    text = {
+        "id": segment.get("id"),
+        "source": segment.get("source", state.get("source")),
+        "mt": segment.get("mt", state.get("mt")),
+        "reference": segment.get("reference", state.get("reference")),
+        "error": error,
+    }
+
+    def copy(key: str, numeric_fields=(), text_fields=(), verdict_fields=()):
+        output = state.get(key)
+        if output is None:
+            return
+        for name in numeric_fields:
+            numeric[f"{key}.{name}"] = _get(output, name)
+        for name in verdict_fields:
+            numeric[f"{key}.{name}"] = _verdict(_get(output, name))
+        for name in text_fields:
+            text[f"{key}.{name}"] = _get(output, name)
+
+    for category in CATEGORIES:
+        copy(stage1_key(category), ("probability", "confidence"), ("reason",))
+        copy(stage3_key(category), ("consistencyScore",), ("existanceReasoning",), ("errorsExists",))
+    for sub in SUB_KEYS:
+        copy(sub, ("reEvaluatedProb", "reEvaluatedConfidence"), ("reason", "thoughtsOnStage1"))
+    copy("missingErrors", text_fields=("reasoning",), verdict_fields=("missingErrorsExists",))
+    if state.get("missingErrors") is not None:
+        text["missingErrors.missingErrorTypes"] = ",".join(_get(state["missingErrors"], "missingErrorTypes") or [])
+
+    aggregation = state.get("aggregation") or {}
+    for key in AGGREGATION_KEYS:
+        numeric[f"aggregation.{key}"] = aggregation.get(key)
+    run_metrics = state.get("runMetrics") or {}
+    for key in RUN_METRIC_COUNTS + ["llm_time"]:
+        numeric[f"runMetrics.{key}"] = run_metrics.get(key)
+    return numeric, text
+
+
+def _schema_path(path: str) -> str:
+    return os.path.join(path, "schema.json")
+
+
+def _read_schema(path: str) -> Optional[Dict]:
+    if not os.path.exists(_schema_path(path)):
+        return None
+    with open(_schema_path(path), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_schema(path: str, schema: Dict):
+    tmp = _schema_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(schema, f, indent=2)
+    os.replace(tmp, _schema_path(path))
+
+
+class ColumnarSink:
+    """
+    Append-only columnar sink (write(segment, result=None, error=None) /
+    close(), like core.corpus sinks). Rows are buffered and written every
+    `batch_rows` rows. Raw-backend rows are readable once their batch is
+    written; an Arrow part becomes visible when the sink is closed, which
+    also compacts the numeric group (compact=False leaves that to a later
+    session or compact_numeric()). `buffered` counts the rows that are not
+    readable yet.
+    """
+
+    def __init__(self, path: str, backend: Optional[str] = None, batch_rows: int = 4096, compact: bool = True):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.compact = compact
+        os.makedirs(path, exist_ok=True)
+
+        existing = _read_schema(path)
+        if existing is not None:
+            if [tuple(c) for c in existing["numeric"]] != NUMERIC_COLUMNS or existing["text"] != TEXT_COLUMNS:
+                raise ValueError(f"{path} was written with different columns")
+            backend = backend or existing["backend"]
+            if backend != existing["backend"]:
+                raise ValueError(f"{path} uses the {existing['backend']} backend, not {backend}")
+        backend = backend or ("arrow" if pa is not None else "raw")
+        if backend == "arrow" and pa is None:
+            raise ImportError("the arrow backend needs pyarrow")
+        if backend not in ("arrow", "raw"):
+            raise ValueError(f"Unknown columnar backend: {backend}")
+
+        self.backend = backend
+        self.schema = existing or {
+            "backend": backend,
+            "rows": 0,
+            "parts": [],
+            "numeric": [list(c) for c in NUMERIC_COLUMNS],
+            "text": TEXT_COLUMNS,
+        }
+        self._numeric: Dict[str, list] = {name: [] for name, _ in NUMERIC_COLUMNS}
+        self._text: List[Dict] = []
+        self._writers = None
+        if backend == "arrow":
+            self._open_arrow_part()
+        else:
+            self._truncate_raw()
+        _write_schema(path, self.schema)
+
+    def _truncate_raw(self):
+        """Drop bytes past the committed row count, left by a flush that died before its schema write."""
+        rows = self.schema["rows"]
+        for name, dtype in NUMERIC_COLUMNS:
+            file = os.path.join(self.path, "numeric", name + ".bin")
+            if os.path.exists(file) and os.path.getsize(file) > rows * np.dtype(dtype).itemsize:
+                os.truncate(file, rows * np.dtype(dtype).itemsize)
+        file = os.path.join(self.path, "text.jsonl")
+        if not os.path.exists(file):
+            return
+        with open(file, "rb+") as f:
+            for _ in range(rows):
+                if not f.readline():
+                    break
+            f.truncate()
+
+    @property
+    def buffered(self) -> int:
+        unpublished = self._part["rows"] if self._writers is not None else 0
+        return len(self._text) + unpublished
+
+    def _open_arrow_part(self):
+        part = len(self.schema["parts"])
+        self._part = {"numeric": f"numeric-{part:05d}.arrow", "text": f"text-{part:05d}.arrow", "rows": 0}
+        self._arrow_numeric_schema = pa.schema([(name, pa.from_numpy_dtype(np.dtype(t))) for name, t in NUMERIC_COLUMNS])
+        self._arrow_text_schema = pa.schema([(name, pa.string()) for name in TEXT_COLUMNS])
+        self._writers = (
+            pa_ipc.new_file(os.path.join(self.path, self._part["numeric"]), self._arrow_numeric_schema),
+            pa_ipc.new_file(os.path.join(self.path, self._part["text"]), self._arrow_text_schema),
+        )
+
+    def write(self, segment: Dict, result: Optional[Dict] = None, error: Optional[str] = None):
+        numeric, text = flatten_state(segment, result, error)
+        for name, dtype in NUMERIC_COLUMNS:
+            value = numeric.get(name)
+            self._numeric[name].append(_MISSING[dtype] if value is None else value)
+        self._text.append(text)
+        if len(self._text) >= self.batch_rows:
+            self.flush()
+
+    def _columns(self) -> Dict[str, np.ndarray]:
+        return {name: np.asarray(self._numeric[name], dtype=dtype) for name, dtype in NUMERIC_COLUMNS}
+
+    def flush(self):
+        rows = len(self._text)
+        if not rows:
+            return
+        columns = self._columns()
+        if self.backend == "arrow":
+            numeric_writer, text_writer = self._writers
+            numeric_writer.write_batch(pa.record_batch([pa.array(v) for v in columns.values()], schema=self._arrow_numeric_schema))
+            text_writer.write_batch(pa.record_batch(
+                [pa.array([_text_value(row.get(name)) for row in self._text], pa.string()) for name in TEXT_COLUMNS],
+                schema=self._arrow_text_schema,
+            ))
+            self._part["rows"] += rows
+        else:
+            os.makedirs(os.path.join(self.path, "numeric"), exist_ok=True)
+            for name, values in columns.items():
+                with open(os.path.join(self.path, "numeric", name + ".bin"), "ab") as f:
+                    f.write(values.astype(values.dtype.newbyteorder("<"), copy=False).tobytes())
+            with open(os.path.join(self.path, "text.jsonl"), "a", encoding="utf-8") as f:
+                for row in self._text:
+                    f.write(json.dumps([_text_value(row.get(name)) for name in TEXT_COLUMNS], ensure_ascii=False) + "\n")
+            # committed only after every column has its bytes
+            self.schema["rows"] += rows
+            _write_schema(self.path, self.schema)
+
+        self._numeric = {name: [] for name, _ in NUMERIC_COLUMNS}
+        self._text = []
+
+    def close(self):
+        self.flush()
+        if self._writers is not None:
+            for writer in self._writers:
+                writer.close()
+            self._writers = None
+            if self._part["rows"]:
+                self.schema["parts"].append(self._part)
+                self.schema["rows"] += self._part["rows"]
+                _write_schema(self.path, self.schema)
+            else:
+                for name in (self._part["numeric"], self._part["text"]):
+                    os.remove(os.path.join(self.path, name))
+            if self.compact:
+                compact_numeric(self.path)
+
+
+def _arrow_numeric_files(schema: Dict) -> List[str]:
+    """Numeric Arrow files in row order: the compacted file, then parts written since."""
+    files = [schema["numeric_file"]] if schema.get("numeric_file") else []
+    return files + [part["numeric"] for part in schema["parts"] if "numeric" in part]
+
+
+def _read_arrow(path: str, name: str):
+    return pa_ipc.open_file(pa.memory_map(os.path.join(path, name), "r"))
+
+
+def compact_numeric(path: str) -> bool:
+    """
+    Rewrite the numeric group of an Arrow store as one file with one record
+    batch, so ColumnarStore.numeric() maps it without copying. Reads the
+    numeric group into memory once; text parts are left alone. Returns
+    whether anything was rewritten.
+    """
+    schema = _read_schema(path)
+    if schema is None or schema["backend"] != "arrow":
+        return False
+    files = _arrow_numeric_files(schema)
+    if not files or (len(files) == 1 and _read_arrow(path, files[0]).num_record_batches <= 1):
+        return False
+
+    table = pa.concat_tables([_read_arrow(path, name).read_all() for name in files]).combine_chunks()
+    target = f"numeric-all-{len(schema['parts']):05d}.arrow"
+    tmp = os.path.join(path, target + ".tmp")
+    with pa_ipc.new_file(tmp, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, os.path.join(path, target))
+
+    schema["numeric_file"] = target
+    for part in schema["parts"]:
+        part.pop("numeric", None)
+    _write_schema(path, schema)
+    for name in files:
+        if name != target:
+            os.remove(os.path.join(path, name))
+    return True
+
+
+def _text_value(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+class ColumnarStore:
+    """Read side of a store written by ColumnarSink."""
+
+    def __init__(self, path: str):
+        schema = _read_schema(path)
+        if schema is None:
+            raise FileNotFoundError(f"no columnar store at {path}")
+        self.path = path
+        self.schema = schema
+        self.backend = schema["backend"]
+        self.numeric_columns = [name for name, _ in schema["numeric"]]
+        self.text_columns = list(schema["text"])
+        self._dtypes = {name: dtype for name, dtype in schema["numeric"]}
+
+    def __len__(self) -> int:
+        return self.schema["rows"]
+
+    def numeric(self, columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Numeric columns by name, memory-mapped. An Arrow store whose numeric
+        group is not compacted (a session that closed with compact=False or
+        died before compacting) is concatenated instead.
+        """
+        columns = list(columns or self.numeric_columns)
+        unknown = set(columns) - set(self._dtypes)
+        if unknown:
+            raise KeyError(f"Unknown numeric columns: {sorted(unknown)}")
+
+        if self.backend == "raw":
+            out = {}
+            for name in columns:
+                dtype = np.dtype(self._dtypes[name]).newbyteorder("<")
+                file = os.path.join(self.path, "numeric", name + ".bin")
+                out[name] = np.memmap(file, dtype=dtype, mode="r", shape=(len(self),)) if len(self) else np.empty(0, dtype)
+            return out
+
+        if pa is None:
+            raise ImportError("reading an arrow store needs pyarrow")
+        tables = [_read_arrow(self.path, name).read_all().select(columns) for name in _arrow_numeric_files(self.schema)]
+        if not tables:
+            return {name: np.empty(0, self._dtypes[name]) for name in columns}
+        table = tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+        out = {}
+        for name in columns:
+            column = table.column(name)
+            # a single chunk is a view of the mapped file (bool columns are bit-packed and still copied)
+            out[name] = column.chunk(0).to_numpy(zero_copy_only=False) if column.num_chunks == 1 else column.to_numpy()
+        return out
+
+    def text(self, columns: Optional[Sequence[str]] = None) -> Dict[str, List[Optional[str]]]:
+        columns = list(columns or self.text_columns)
+        unknown = set(columns) - set(self.text_columns)
+        if unknown:
+            raise KeyError(f"Unknown text columns: {sorted(unknown)}")
+
+        if self.backend == "raw":
+            index = [self.text_columns.index(name) for name in columns]
+            out = {name: [] for name in columns}
+            with open(os.path.join(self.path, "text.jsonl"), encoding="utf-8") as f:
+                for _, line in zip(range(len(self)), f):
+                    row = json.loads(line)
+                    for name, i in zip(columns, index):
+                        out[name].append(row[i])
+            return out
+
+        if pa is None:
+            raise ImportError("reading an arrow store needs pyarrow")
+        out = {name: [] for name in columns}
+        for part in self.schema["parts"]:
+            table = _read_arrow(self.path, part["text"]).read_all().select(columns)
+            for name in columns:
+                out[name].extend(table.column(name).to_pylist())
+        return out
+
+    def aggregation_arrays(self) -> AggregationArrays:
+        """Stage-2 / stage-3 inputs of aggregate_mt_quality for core.batch_aggregation."""
+        names = (
+            [f"{sub}.reEvaluatedProb" for sub in SUB_KEYS]
+            + [f"{sub}.reEvaluatedConfidence" for sub in SUB_KEYS]
+            + [f"{stage3_key(c)}.errorsExists" for c in CATEGORIES]
+            + [f"{stage3_key(c)}.consistencyScore" for c in CATEGORIES]
+        )
+        cols = self.numeric(names)
+        probs = np.column_stack([cols[f"{sub}.reEvaluatedProb"] for sub in SUB_KEYS])
+        confs = np.column_stack([cols[f"{sub}.reEvaluatedConfidence"] for sub in SUB_KEYS])
+        present = ~np.isnan(probs)
+        verdicts = np.column_stack([cols[f"{stage3_key(c)}.errorsExists"] for c in CATEGORIES])
+        consistency = np.column_stack([cols[f"{stage3_key(c)}.consistencyScore"] for c in CATEGORIES])
+        return AggregationArrays(
+            np.where(present, probs, 0.0),
+            np.where(present, confs, 0.0),
+            present,
+            verdicts,
+            np.nan_to_num(consistency),
+        )
+
+
+def open_store(path: str) -> ColumnarStore:
+    return ColumnarStore(path)
+
+
+def convert_jsonl(source: str, target: str, backend: Optional[str] = None) -> int:
+    """Convert a JSONL results file (core.corpus.JsonlSink) into a columnar store."""
+    sink = ColumnarSink(target, backend=backend)
+    rows = 0
+    try:
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                segment = dict(record.get("input") or {}, id=record.get("id"))
+                sink.write(segment, result=record.get("result"), error=record.get("error"))
+                rows += 1
+    finally:
+        sink.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert JSONL evaluation results into a columnar store.")
+    parser.add_argument("source", help="results .jsonl written by the corpus runner")
+    parser.add_argument("target", help="store directory (created or appended to)")
+    parser.add_argument("--backend", choices=["arrow", "raw"], default=None, help="default: arrow if pyarrow is installed")
+    args = parser.parse_args(argv)
+
+    rows = convert_jsonl(args.source, args.target, args.backend)
+    store = open_store(args.target)
+    print(f"Wrote {rows} rows to {args.target} ({store.backend}, {len(store)} rows in total)")
+
+
+if __name__ == "__main__":
+    main()
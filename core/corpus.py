@@ -0,0 +1,277 @@
+"""
+Corpus I/O
+
+Readers for (source, mt, reference) corpora and append-only result sinks used
+by the corpus runner.
+
+Input formats:
+- JSONL: one object per line with "source", "mt", "reference" and optional
+  "id", "lang_pair" (e.g. "en-hi") or "src_lang"/"tgt_lang"
+- TSV: source<TAB>mt<TAB>reference, optional header row
+
+Sinks write every result as soon as it is available so a run never holds the
+whole corpus of results in memory. Output formats: JSONL, CSV, and the
+columnar store of core.columnar (a directory, e.g. results.cols).
+"""
+
+import csv
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.text import dominant_script, normalize_text
+
+
+SEGMENT_FIELDS = ["source", "mt", "reference"]
+
+CSV_FIELDS = [
+    "id",
+    "source",
+    "mt",
+    "reference",
+    "accuracy_error",
+    "fluency_error",
+    "terminology_error",
+    "style_error",
+    "overall_error_probability",
+    "final_quality_score_100",
+    "rounds",
+    "calls",
+    "input_tokens",
+    "cached_tokens",
+    "output_tokens",
+    "retries",
+    "escalations",
+    "llm_time",
+    "error",
+]
+
+
+def serialize_state(obj):
+    """
+    Convert Pydantic models to JSON-serializable dict.
+    Recursively handles nested models.
+    """
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    elif isinstance(obj, dict):
+        return {k: serialize_state(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [serialize_state(v) for v in obj]
+    else:
+        return obj
+
+
+def _read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            missing = [k for k in SEGMENT_FIELDS if k not in record]
+            if missing:
+                raise ValueError(f"{path}:{line_no}: missing fields {missing}")
+            record.setdefault("id", str(line_no))
+            yield record
+
+
+def _read_tsv(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+        for line_no, row in enumerate(reader, start=1):
+            if not row:
+                continue
+            if line_no == 1 and [c.strip().lower() for c in row[:3]] == SEGMENT_FIELDS:
+                continue
+            if len(row) < 3:
+                raise ValueError(f"{path}:{line_no}: expected 3 tab-separated columns, got {len(row)}")
+            yield {
+                "id": str(line_no),
+                "source": row[0],
+                "mt": row[1],
+                "reference": row[2],
+            }
+
+
+def read_segments(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Yield segment records from a JSONL or TSV corpus file.
+    The format is taken from the file extension unless fmt is given.
+    """
+    if fmt is None:
+        fmt = "tsv" if path.endswith((".tsv", ".txt")) else "jsonl"
+
+    if fmt == "jsonl":
+        return _read_jsonl(path)
+    if fmt == "tsv":
+        return _read_tsv(path)
+    raise ValueError(f"Unknown corpus format: {fmt}")
+
+
+def language_pair(segment: Dict) -> str:
+    """
+    Language pair of a segment from its metadata, falling back to the
+    dominant Unicode scripts of source and MT (e.g. "LATIN-DEVANAGARI").
+    """
+    if segment.get("lang_pair"):
+        return segment["lang_pair"]
+    if segment.get("src_lang") and segment.get("tgt_lang"):
+        return f"{segment['src_lang']}-{segment['tgt_lang']}"
+    return f"{dominant_script(segment['source'])}-{dominant_script(segment['mt'])}"
+
+
+def group_by_language_pair(segments: Iterable[Dict]) -> List[Dict]:
+    """
+    Stable reorder so segments of the same language pair are dispatched back
+    to back. In-flight segments then send each node the same static prompt
+    prefix in quick succession, which is what the provider's prompt cache
+    needs to produce hits.
+    """
+    return sorted(segments, key=language_pair)
+
+
+DEDUP_MODES = ("exact", "normalized")
+
+
+def triple_key(segment: Dict, mode: str = "exact") -> tuple:
+    """
+    What makes two segments duplicates: the (source, mt, reference) text.
+    "normalized" normalizes source and reference (core.text.normalize_text)
+    but keeps the MT as is: NFKC folds exactly the characters the
+    punctuation and characterEncoding agents judge (full-width marks,
+    compatibility forms), so two MTs only share a result when they are the
+    same string. A document (core.document.as_document) is keyed by the keys
+    of its segments, not by its joined texts, which can collide.
+    """
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Unknown dedup mode: {mode}")
+    if "segments" in segment:
+        return tuple(triple_key(s, mode) for s in segment["segments"])
+    source, mt, reference = (segment.get(k) or "" for k in SEGMENT_FIELDS)
+    if mode == "normalized":
+        return normalize_text(source), mt, normalize_text(reference)
+    return source, mt, reference
+
+
+def dedupe_segments(segments: Iterable[Dict], mode: str = "exact") -> Tuple[List[Dict], Dict[tuple, List[Dict]]]:
+    """
+    Unique segments (first occurrence of every triple, in input order) and
+    all occurrences of each, keyed by triple_key. Normalized duplicates are
+    evaluated on the text of their first occurrence.
+    """
+    unique: List[Dict] = []
+    occurrences: Dict[tuple, List[Dict]] = {}
+    for segment in segments:
+        key = triple_key(segment, mode)
+        if key not in occurrences:
+            occurrences[key] = []
+            unique.append(segment)
+        occurrences[key].append(segment)
+    return unique, occurrences
+
+
+class FanOutSink:
+    """Writes the result of a unique segment once for every occurrence of it (see dedupe_segments)."""
+
+    def __init__(self, sink, occurrences: Dict[tuple, List[Dict]], mode: str = "exact"):
+        self.sink = sink
+        self.occurrences = occurrences
+        self.mode = mode
+
+    def write(self, segment: Dict, result: Optional[Dict] = None, error: Optional[str] = None):
+        for occurrence in self.occurrences.get(triple_key(segment, self.mode), [segment]):
+            self.sink.write(occurrence, result=result, error=error)
+
+    @property
+    def buffered(self) -> int:
+        return getattr(self.sink, "buffered", 0)
+
+    def flush(self):
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+
+def _flatten_result(segment: Dict, result: Optional[Dict], error: Optional[str]) -> Dict:
+    row = {
+        "id": segment.get("id"),
+        "source": segment.get("source"),
+        "mt": segment.get("mt"),
+        "reference": segment.get("reference"),
+        "error": error or "",
+    }
+    agg = (result or {}).get("aggregation") or {}
+    for key in CSV_FIELDS:
+        if key in agg:
+            row[key] = agg[key]
+    run_metrics = (result or {}).get("runMetrics") or {}
+    for key in ("calls", "input_tokens", "cached_tokens", "output_tokens", "retries", "escalations", "llm_time"):
+        if key in run_metrics:
+            row[key] = run_metrics[key]
+    if result is not None:
+        row["rounds"] = result.get("round")
+    return row
+
+
+class JsonlSink:
+    """Append-only JSONL sink; one line per finished segment."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "a", encoding="utf-8")
+
+    def write(self, segment: Dict, result: Optional[Dict] = None, error: Optional[str] = None):
+        record = {"id": segment.get("id")}
+        if error is not None:
+            record["error"] = error
+            record["input"] = {k: segment.get(k) for k in SEGMENT_FIELDS}
+        else:
+            record["result"] = serialize_state(result)
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class CsvSink:
+    """Append-only CSV sink with the aggregation scores flattened into columns."""
+
+    def __init__(self, path: str):
+        self.path = path
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, "a", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        if write_header:
+            self._writer.writeheader()
+            self._f.flush()
+
+    def write(self, segment: Dict, result: Optional[Dict] = None, error: Optional[str] = None):
+        self._writer.writerow(_flatten_result(segment, result, error))
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def open_sink(path: str, fmt: Optional[str] = None):
+    if fmt is None:
+        if path.endswith(".csv"):
+            fmt = "csv"
+        elif path.endswith(".cols"):
+            fmt = "columnar"
+        else:
+            fmt = "jsonl"
+
+    if fmt == "jsonl":
+        return JsonlSink(path)
+    if fmt == "csv":
+        return CsvSink(path)
+    if fmt == "columnar":
+        from core.columnar import ColumnarSink
+        return ColumnarSink(path)
+    raise ValueError(f"Unknown sink format: {fmt}")
+
@@ -0,0 +1,379 @@
+"""
+Document Mode
+
+Evaluates a document (its segments, in order), with the cross-segment
+error types judged once per document instead of once per segment:
+
+- the stage-2 agents of taxonomy.CROSS_SEGMENT_SUBS (inconsistency,
+  inconsistent_use) run once, in one document-level unit whose source /
+  mt / reference are the numbered segments, each shortened so a text stays
+  near `context_chars`; that unit skips every other sub-category, and
+  every segment gets its document-level outputs for these types
+- every other sub-category is evaluated in segment units, where the
+  cross-segment agents make no call (state["deferredSubs"]):
+  - by default one unit per segment
+  - with window_chars > 0 (opt-in), consecutive short segments are packed
+    into windows of up to `window_chars` characters, numbered "[n] ..."
+    inside the unit's source / mt / reference, and evaluated together;
+    every segment of a window gets the window's outputs, so its scores are
+    window-level, not its own
+  - a segment longer than `chunk_chars` is split into overlapping chunks
+    that are evaluated in parallel and merged back into one output per key,
+    the most severe chunk winning (merge_outputs)
+
+So the document is sent once per cross-segment category and document, and the cross-segment calls per document stay constant however
+many segments it has. By default every segment is its own unit for the
+other types (window_chars=0), so their calls grow with the segments; with
+windows they grow with characters / window_chars instead, at the price of
+window-level resolution for short segments. Every segment state says where
+its outputs came from: state["documentUnit"]["segments"] lists the
+(1-based) segments evaluated together with it (more than one for a
+window), "document_level" the sub-categories judged for the whole
+document. A single-segment document is one unit with every agent. The app
+must be built with PipelineConfig(document=True).
+
+    evaluator = DocumentEvaluator(build_app(PipelineConfig(document=True)))
+    result = evaluator.invoke(build_input_state(as_document("doc-1", segments), max_rounds=2))
+    result["segments"]                                  # one MTState per segment
+
+In the corpus runner (--document-key) documents take the place of segments
+and DocumentSink writes one row per segment.
+"""
+
+import asyncio
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.aggregation import aggregate_mt_quality
+from core.corpus import SEGMENT_FIELDS
+from core.encoding import truncate
+from core.metrics import summarize_records
+from core.models import AgentOutputStage1, AgentOutputStage2, AgentOutputStage3, MissingErrorsOutput
+from core.taxonomy import CATEGORIES, CROSS_SEGMENT_SUBS, SUB_CATEGORIES, stage1_key, stage3_key
+
+
+OUTPUT_KEYS = (
+    [stage1_key(c) for c in CATEGORIES]
+    + [s for c in CATEGORIES for s in SUB_CATEGORIES[c]]
+    + [stage3_key(c) for c in CATEGORIES]
+    + ["missingErrors"]
+)
+# what the document-level unit evaluates, and what it leaves to the segment units
+DOCUMENT_SUBS = [s for c in CATEGORIES for s in SUB_CATEGORIES[c] if s in CROSS_SEGMENT_SUBS]
+SEGMENT_SUBS = [s for c in CATEGORIES for s in SUB_CATEGORIES[c] if s not in CROSS_SEGMENT_SUBS]
+DOCUMENT_UNIT_NOTE = "The source, MT and reference above are the whole document, one numbered line per segment."
+
+
+@dataclass(frozen=True)
+class DocumentConfig:
+    """
+    window_chars: max source + mt + reference characters packed into one unit
+    (0 = one segment per unit); window_segments: max segments per unit
+    chunk_chars / chunk_overlap: segments whose longest text exceeds
+    chunk_chars are split into chunks of about that size overlapping by
+    chunk_overlap characters
+    context_chars: size budget of each text of the document-level unit
+    max_concurrency: units of one document evaluated in parallel
+    """
+
+    window_chars: int = 0
+    window_segments: int = 10
+    chunk_chars: int = 1200
+    chunk_overlap: int = 200
+    context_chars: int = 3000
+    max_concurrency: int = 8
+
+
+@dataclass(frozen=True)
+class DocumentUnit:
+    """
+    One pipeline invocation: segment numbers (0-based) and the texts sent;
+    part = (k, n) for chunk k of n; document = the document-level unit of
+    the cross-segment sub-categories.
+    """
+
+    indices: Tuple[int, ...]
+    source: str
+    mt: str
+    reference: str
+    part: Optional[Tuple[int, int]] = None
+    document: bool = False
+
+
+def as_document(doc_id, segments: List[Dict]) -> Dict:
+    """A document as the corpus runner dispatches it: an id, the joined texts and its segments."""
+    document = {"id": doc_id, "segments": list(segments)}
+    for key in SEGMENT_FIELDS:
+        document[key] = "\n".join(segment.get(key) or "" for segment in segments)
+    return document
+
+
+def group_documents(segments: Iterable[Dict], key: str = "doc_id") -> List[Dict]:
+    """Documents (as_document) in order of first appearance; segments keep their input order."""
+    groups: Dict[str, List[Dict]] = {}
+    for segment in segments:
+        doc_id = segment.get(key)
+        if doc_id is None:
+            raise ValueError(f"segment {segment.get('id')} has no {key!r} field")
+        groups.setdefault(str(doc_id), []).append(segment)
+    return [as_document(doc_id, group) for doc_id, group in groups.items()]
+
+
+def document_unit(segments: List[Dict], max_chars: int = 3000) -> DocumentUnit:
+    """The document-level unit: every segment numbered, each text shortened so one field stays near max_chars."""
+    per_text = max(24, max_chars // max(len(segments), 1))
+    return DocumentUnit(
+        tuple(range(len(segments))),
+        *(
+            "\n".join(f"[{n}] {truncate(segment.get(key) or '', per_text)}" for n, segment in enumerate(segments, start=1))
+            for key in SEGMENT_FIELDS
+        ),
+        document=True,
+    )
+
+
+def _split(text: str, parts: int, overlap: int) -> List[str]:
+    # words where the text has enough of them, characters otherwise (CJK, Thai)
+    tokens = text.split()
+    joiner = " "
+    if len(tokens) < 2 * parts:
+        tokens, joiner = list(text), ""
+    if not tokens:
+        return [""] * parts
+    size = len(tokens) / parts
+    extra = math.ceil(overlap * len(tokens) / max(len(text), 1))
+    pieces = []
+    for k in range(parts):
+        start = max(0, int(k * size) - extra)
+        stop = len(tokens) if k == parts - 1 else min(len(tokens), int((k + 1) * size) + extra)
+        pieces.append(joiner.join(tokens[start:stop]))
+    return pieces
+
+
+def chunk_segment(segment: Dict, index: int, chunk_chars: int, overlap: int) -> List[DocumentUnit]:
+    """
+    Overlapping chunks of one long segment. Source, mt and reference are cut
+    at the same relative positions, so chunk k of each covers roughly the
+    same content; the overlap absorbs the drift.
+    """
+    longest = max(len(segment.get(key) or "") for key in SEGMENT_FIELDS)
+    parts = max(1, math.ceil(longest / chunk_chars))
+    texts = {key: _split(segment.get(key) or "", parts, overlap) for key in SEGMENT_FIELDS}
+    return [
+        DocumentUnit(
+            (index,),
+            *(f"[{index + 1} part {k + 1}/{parts}] {texts[key][k]}" for key in SEGMENT_FIELDS),
+            part=(k + 1, parts),
+        )
+        for k in range(parts)
+    ]
+
+
+def plan_units(segments: List[Dict], config: DocumentConfig) -> List[DocumentUnit]:
+    units: List[DocumentUnit] = []
+    window: List[int] = []
+    window_size = 0
+
+    def flush():
+        nonlocal window, window_size
+        if window:
+            units.append(DocumentUnit(
+                tuple(window),
+                *("\n".join(f"[{i + 1}] {segments[i].get(key) or ''}" for i in window) for key in SEGMENT_FIELDS),
+            ))
+        window, window_size = [], 0
+
+    for i, segment in enumerate(segments):
+        size = sum(len(segment.get(key) or "") for key in SEGMENT_FIELDS)
+        if max(len(segment.get(key) or "") for key in SEGMENT_FIELDS) > config.chunk_chars:
+            flush()
+            units.extend(chunk_segment(segment, i, config.chunk_chars, config.chunk_overlap))
+            continue
+        if window and (window_size + size > config.window_chars or len(window) >= config.window_segments):
+            flush()
+        window.append(i)
+        window_size += size
+    flush()
+    if len(segments) > 1:
+        units.append(document_unit(segments, config.context_chars))
+    return units
+
+
+def _severity(output):
+    if isinstance(output, AgentOutputStage1):
+        return output.probability, output.confidence
+    if isinstance(output, AgentOutputStage2):
+        return output.reEvaluatedProb, output.reEvaluatedConfidence
+    if isinstance(output, AgentOutputStage3):
+        return output.errorsExists == "YES", output.consistencyScore
+    if isinstance(output, MissingErrorsOutput):
+        return output.missingErrorsExists == "YES", len(output.missingErrorTypes)
+    return 0, 0
+
+
+def merge_outputs(outputs: List):
+    """
+    One output from the chunks of a segment: an error found in any chunk is
+    an error of the segment, so the most severe chunk wins (highest
+    probability; a YES verdict over NO). Missing-error types are united.
+    """
+    outputs = [o for o in outputs if o is not None]
+    if not outputs:
+        return None
+    worst = max(outputs, key=_severity)
+    if isinstance(worst, MissingErrorsOutput):
+        types = []
+        for output in outputs:
+            types.extend(t for t in output.missingErrorTypes if t not in types)
+        return worst.model_copy(update={"missingErrorTypes": types})
+    return worst
+
+
+def merge_units(segments: List[Dict], units: List[DocumentUnit], results: List[Dict]) -> List[Dict]:
+    """
+    One state per segment from the unit results. Node metrics of a unit go
+    to its first segment only, so summing runMetrics over the segments of a
+    document counts every call once. The cross-segment sub-categories come
+    from the document-level unit when there is one. documentUnit records
+    the segments a segment shared its units with (window-level scores when
+    more than one), the number of chunks it was split into and the
+    sub-categories judged for the whole document.
+    """
+    covering: List[List[Dict]] = [[] for _ in segments]
+    records: List[List[dict]] = [[] for _ in segments]
+    shared: List[List[int]] = [[] for _ in segments]
+    chunks = [1] * len(segments)
+    document: Optional[Dict] = None
+    for unit, result in zip(units, results):
+        if unit.document:
+            document = result
+            records[0].extend(result.get("nodeMetrics") or [])
+            continue
+        for i in unit.indices:
+            covering[i].append(result)
+            shared[i].extend(j + 1 for j in unit.indices if j + 1 not in shared[i])
+            if unit.part is not None:
+                chunks[i] = unit.part[1]
+        records[unit.indices[0]].extend(result.get("nodeMetrics") or [])
+
+    states = []
+    for i, (segment, results_i, records_i) in enumerate(zip(segments, covering, records)):
+        state = {key: segment.get(key) for key in SEGMENT_FIELDS}
+        for key in OUTPUT_KEYS:
+            if document is not None and key in DOCUMENT_SUBS:
+                state[key] = document.get(key)
+            else:
+                state[key] = merge_outputs([r.get(key) for r in results_i])
+        state["round"] = max((r.get("round") or 1 for r in results_i), default=1)
+        state.update(aggregate_mt_quality(state))
+        state["nodeMetrics"] = records_i
+        state["runMetrics"] = summarize_records(records_i)
+        state["runMetrics"]["document_units"] = len(results_i)
+        state["documentUnit"] = {
+            "segments": shared[i],
+            "chunks": chunks[i],
+            "document_level": DOCUMENT_SUBS if document is not None else [],
+        }
+        states.append(state)
+    return states
+
+
+class DocumentEvaluator:
+    """
+    Runs a document through `app` (compiled with PipelineConfig(document=True);
+    any app with invoke / ainvoke works, e.g. a SegmentCascade): plans its
+    units, evaluates them in parallel and merges the results per segment.
+    Input: a state from runner.build_input_state for an as_document() dict.
+    """
+
+    def __init__(self, app, config: DocumentConfig = DocumentConfig()):
+        self.app = app
+        self.config = config
+        self.documents = 0
+        self.segments = 0
+        self.units = 0
+        self._lock = threading.Lock()
+
+    def _plan(self, state: Dict):
+        segments = state["segments"]
+        units = plan_units(segments, self.config)
+        has_document_unit = any(unit.document for unit in units)
+        inputs = []
+        for unit in units:
+            unit_input = {
+                "source": unit.source,
+                "mt": unit.mt,
+                "reference": unit.reference,
+                "round": 1,
+                "max_rounds": state.get("max_rounds") or 1,
+            }
+            if unit.document:
+                unit_input["documentContext"] = DOCUMENT_UNIT_NOTE
+                unit_input["deferredSubs"] = SEGMENT_SUBS
+            elif has_document_unit:
+                unit_input["deferredSubs"] = DOCUMENT_SUBS
+            inputs.append(unit_input)
+        with self._lock:
+            self.documents += 1
+            self.segments += len(segments)
+            self.units += len(units)
+        return segments, units, inputs
+
+    @staticmethod
+    def _result(segments, units, results) -> Dict:
+        rounds = max((r.get("round") or 1 for r in results), default=1)
+        return {"segments": merge_units(segments, units, results), "round": rounds}
+
+    def invoke(self, state: Dict, config=None, **kwargs) -> Dict:
+        segments, units, inputs = self._plan(state)
+        with ThreadPoolExecutor(max_workers=min(self.config.max_concurrency, len(inputs) or 1)) as pool:
+            results = list(pool.map(lambda unit_input: self.app.invoke(unit_input, config, **kwargs), inputs))
+        return self._result(segments, units, results)
+
+    async def ainvoke(self, state: Dict, config=None, **kwargs) -> Dict:
+        segments, units, inputs = self._plan(state)
+        semaphore = asyncio.Semaphore(self.config.max_concurrency)
+
+        async def run(unit_input):
+            async with semaphore:
+                return await self.app.ainvoke(unit_input, config, **kwargs)
+
+        results = await asyncio.gather(*(run(unit_input) for unit_input in inputs))
+        return self._result(segments, units, results)
+
+    def format_stats(self) -> str:
+        with self._lock:
+            per_segment = self.units / self.segments if self.segments else 0.0
+            return (
+                f"{self.documents} documents, {self.segments} segments evaluated as {self.units} units "
+                f"({per_segment:.2f} pipeline runs per segment)"
+            )
+
+
+class DocumentSink:
+    """Writes a document result (DocumentEvaluator) as one row per segment to `sink`."""
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def write(self, document: Dict, result: Optional[Dict] = None, error: Optional[str] = None):
+        segments = document["segments"]
+        states = (result or {}).get("segments") or [None] * len(segments)
+        if len(states) != len(segments):
+            raise ValueError(f"document {document.get('id')}: {len(states)} results for {len(segments)} segments")
+        for segment, state in zip(segments, states):
+            self.sink.write(segment, result=state, error=error)
+
+    @property
+    def buffered(self) -> int:
+        return getattr(self.sink, "buffered", 0)
+
+    def flush(self):
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()
+
+    def close(self):
+        self.sink.close()
@@ -0,0 +1,77 @@
+"""
+Inter-Stage Encoding
+
+Compact, deterministic text for agent outputs that later stages read
+(stage 1 -> stage 2, stage 1+2 -> stage 3, everything -> audit). Replaces
+interpolating pydantic reprs, which repeat every field name and every
+reasoning string in full.
+
+One line per output, fields in a fixed order, numbers rounded:
+
+    fluencyStage1: prob=0.30 conf=80 reason="Verb agreement error in ..."
+    grammar: prob=0.65 conf=85 reason="..."
+    fluencyStage3: errors=YES consistency=90 reason="..."
+    missingErrors: exists=YES types=fluency:grammar reason="..."
+
+Only the decision fields and the reason are kept (a stage-2 output's
+thoughtsOnStage1 is dropped); reasons are cut at a word boundary after
+`reasoning_chars` characters when set (0 drops them; the default, None,
+keeps them whole).
+ENCODING_LEGEND explains the format and goes at the end of the system prompt
+of every agent that reads encoded context, so it stays in the cached prefix.
+"""
+
+from typing import Iterable, Optional
+
+from core.models import AgentOutputStage1, AgentOutputStage2, AgentOutputStage3, MissingErrorsOutput
+
+
+DEFAULT_REASONING_CHARS = None
+
+ENCODING_LEGEND = (
+    "Previous agent outputs are given one per line as `name: fields`: "
+    "prob = error probability (0-1), conf = confidence (0-100), "
+    "errors = verified error verdict (YES/NO), consistency = agreement between agents (0-100), "
+    "exists/types = missing-errors audit verdict and error types, "
+    "reason = the agent's justification (may be shortened). A name followed by '-' has no output yet."
+)
+
+
+def truncate(text: str, limit: Optional[int]) -> str:
+    text = " ".join(text.split())
+    if limit is None or len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0] if " " in text[:limit] else text[:limit]
+    return cut + "..."
+
+
+def _reason(text: str, limit: Optional[int]) -> str:
+    if limit == 0:
+        return ""
+    return ' reason="' + truncate(text, limit).replace('"', "'") + '"'
+
+
+def encode_output(output, reasoning_chars: Optional[int] = DEFAULT_REASONING_CHARS) -> str:
+    if output is None:
+        return "-"
+    if isinstance(output, AgentOutputStage1):
+        return f"prob={output.probability:.2f} conf={output.confidence:.0f}" + _reason(output.reason, reasoning_chars)
+    if isinstance(output, AgentOutputStage2):
+        return (
+            f"prob={output.reEvaluatedProb:.2f} conf={output.reEvaluatedConfidence:.0f}"
+            + _reason(output.reason, reasoning_chars)
+        )
+    if isinstance(output, AgentOutputStage3):
+        return (
+            f"errors={output.errorsExists} consistency={output.consistencyScore:.0f}"
+            + _reason(output.existanceReasoning, reasoning_chars)
+        )
+    if isinstance(output, MissingErrorsOutput):
+        types = ",".join(output.missingErrorTypes) or "-"
+        return f"exists={output.missingErrorsExists} types={types}" + _reason(output.reasoning, reasoning_chars)
+    return truncate(str(output), reasoning_chars)
+
+
+def encode_outputs(state, keys: Iterable[str], reasoning_chars: Optional[int] = DEFAULT_REASONING_CHARS) -> str:
+    """`key: encoded output` lines for `keys`, in the given order."""
+    return "\n".join(f"{key}: {encode_output(state.get(key), reasoning_chars)}" for key in keys)
@@ -0,0 +1,98 @@
+"""
+Confidence-Gated Pruning
+
+When a stage-1 agent reports a category as confidently clean, its stage-2
+sub-category agents and its stage-3 verifier are skipped. A single skip node
+writes synthesized outputs instead, so the rest of the pipeline (audit,
+aggregation) sees a complete state:
+
+- every stage-2 key gets the stage-1 probability/confidence, marked as not
+  re-evaluated
+- stage 3 gets errorsExists = "NO" with consistency 100, i.e. the verdict a
+  clean category receives from the verifier, so aggregate_super_category
+  scores the category exactly like a verified-clean one
+
+A category can also have evidence that forces it through regardless of
+stage 1, e.g. glossary matches for terminology (core.glossary).
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.models import AgentOutputStage1, AgentOutputStage2, AgentOutputStage3, MTState
+from core.rules import decided_subs
+from core.taxonomy import SUB_CATEGORIES, stage1_key, stage3_key
+
+
+@dataclass(frozen=True)
+class CleanGate:
+    """A stage-1 output counts as confidently clean at or below max_probability
+    and at or above min_confidence."""
+
+    max_probability: float = 0.1
+    min_confidence: float = 80.0
+
+    def is_clean(self, output: AgentOutputStage1) -> bool:
+        if output is None:
+            return False
+        return output.probability <= self.max_probability and output.confidence >= self.min_confidence
+
+
+def skip_node_name(category: str) -> str:
+    return f"{category}Skip_node"
+
+
+def synthesize_clean_outputs(category: str, stage1: AgentOutputStage1) -> Dict:
+    note = (
+        f"Not re-evaluated: stage-1 reported {category} as confidently clean "
+        f"(probability={stage1.probability:.2f}, confidence={stage1.confidence:.0f})."
+    )
+    update = {
+        sub: AgentOutputStage2(
+            reEvaluatedProb=stage1.probability,
+            thoughtsOnStage1=note,
+            reason=stage1.reason,
+            reEvaluatedConfidence=stage1.confidence,
+        )
+        for sub in SUB_CATEGORIES[category]
+    }
+    update[stage3_key(category)] = AgentOutputStage3(
+        consistencyScore=100.0,
+        errorsExists="NO",
+        existanceReasoning=note + " Verdict inferred from stage 1, not verified.",
+    )
+    return update
+
+
+def make_skip_node(category: str) -> Callable[[MTState], Dict]:
+
+    def skip_fn(state: MTState) -> Dict:
+        update = synthesize_clean_outputs(category, state[stage1_key(category)])
+        # deterministic rule decisions (core.rules) stand; deferred sub-categories are not this run's
+        for key in decided_subs(state):
+            update.pop(key, None)
+        return update
+
+    return skip_fn
+
+
+def make_stage1_router(
+    category: str,
+    stage2_nodes: List[str],
+    gate: CleanGate,
+    has_evidence: Optional[Callable[[MTState], bool]] = None,
+) -> Tuple[Callable, List[str]]:
+    """
+    Conditional edge for a stage-1 node: its stage-2 nodes, or the skip node
+    when the category is confidently clean and `has_evidence` (if given)
+    finds nothing in the state. Returns the router and the list of possible
+    destinations for add_conditional_edges.
+    """
+    skip = skip_node_name(category)
+
+    def route(state: MTState):
+        if gate.is_clean(state.get(stage1_key(category))) and not (has_evidence and has_evidence(state)):
+            return skip
+        return stage2_nodes
+
+    return route, stage2_nodes + [skip]
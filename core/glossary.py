@@ -0,0 +1,226 @@
+"""
+Glossary Index
+
+Client glossaries (source term -> approved target renderings) matched
+against every segment with two Aho-Corasick automata, one over the source
+terms and one over the renderings. A segment costs one linear pass over its
+source and one over its MT, whatever the glossary size:
+
+    glossary = load_glossary("client.tsv")            # 50k+ entries are fine
+    hits = glossary.scan(source, mt)
+    # [{"term": "file", "approved": ["Datei"], "count": 2, "found": "Datei"}, ...]
+
+Matching is on tokens: NFKC + casefold, words for scripts written with
+spaces and single characters for those written without (CJK, Thai, ...),
+so "file" never matches inside "profile" and punctuation does not matter.
+Overlapping source terms resolve leftmost-longest ("file system" wins
+over "file"). "found" is the first approved rendering present verbatim in
+the MT, None when there is none; inflected forms are left to the
+terminology agents, which get the hits as evidence (encode_hits).
+
+Glossary files: TSV (source<TAB>target, optional header), CSV with
+source,target columns, or JSONL with "source" and "target" / "targets";
+several renderings of one term go in one field separated by "|" or in
+separate rows.
+"""
+
+import csv
+import json
+import re
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.text import char_script, normalize_text
+
+
+# scripts written without spaces between words: matched character by character
+_UNSPACED_SCRIPTS = {"CJK", "HIRAGANA", "KATAKANA", "KATAKANA-HIRAGANA", "THAI", "LAO", "KHMER", "MYANMAR", "TIBETAN"}
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for word in _WORD.findall(normalize_text(text).casefold()):
+        if char_script(word[0]) in _UNSPACED_SCRIPTS:
+            tokens.extend(word)
+        else:
+            tokens.append(word)
+    return tokens
+
+
+class TokenAutomaton:
+    """Aho-Corasick over token sequences; patterns are identified by their index."""
+
+    def __init__(self, patterns: Iterable[Sequence[str]]):
+        self._goto: Dict[Tuple[int, str], int] = {}
+        self._children: List[List[str]] = [[]]
+        self._out: List[Tuple[int, ...]] = [()]
+        self.lengths: List[int] = []
+
+        for index, tokens in enumerate(patterns):
+            self.lengths.append(len(tokens))
+            if not tokens:
+                continue
+            node = 0
+            for token in tokens:
+                child = self._goto.get((node, token))
+                if child is None:
+                    child = len(self._out)
+                    self._goto[(node, token)] = child
+                    self._children[node].append(token)
+                    self._children.append([])
+                    self._out.append(())
+                node = child
+            self._out[node] += (index,)
+
+        # failure links breadth first; outputs of the failure chain are folded in
+        self._fail = [0] * len(self._out)
+        queue = deque(self._goto[(0, token)] for token in self._children[0])
+        while queue:
+            node = queue.popleft()
+            for token in self._children[node]:
+                child = self._goto[(node, token)]
+                fallback = self._fail[node]
+                while fallback and (fallback, token) not in self._goto:
+                    fallback = self._fail[fallback]
+                target = self._goto.get((fallback, token), 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] += self._out[self._fail[child]]
+                queue.append(child)
+
+    def __len__(self) -> int:
+        return len(self._out)
+
+    def matches(self, tokens: Sequence[str]) -> List[Tuple[int, int]]:
+        """(end token index exclusive, pattern index) for every occurrence, overlaps included."""
+        found = []
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for position, token in enumerate(tokens):
+            while node and (node, token) not in goto:
+                node = fail[node]
+            node = goto.get((node, token), 0)
+            for index in out[node]:
+                found.append((position + 1, index))
+        return found
+
+
+class Glossary:
+
+    def __init__(self, entries: Iterable[Tuple[str, Sequence[str]]]):
+        targets: Dict[str, List[str]] = {}
+        forms: Dict[Tuple[str, ...], str] = {}
+        for term, renderings in entries:
+            key = tuple(tokenize(term))
+            if not key:
+                continue
+            term = forms.setdefault(key, term.strip())
+            approved = targets.setdefault(term, [])
+            approved.extend(r.strip() for r in renderings if r.strip() and r.strip() not in approved)
+
+        self.terms: List[str] = list(targets)
+        self.approved: List[List[str]] = [targets[t] for t in self.terms]
+        self._source = TokenAutomaton(tokenize(t) for t in self.terms)
+
+        renderings = sorted({r for approved in self.approved for r in approved})
+        self._renderings = renderings
+        self._target = TokenAutomaton(tokenize(r) for r in renderings)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def find_terms(self, source: str) -> Dict[int, int]:
+        """Glossary term index -> occurrences in `source`, overlapping terms resolved leftmost-longest."""
+        lengths = self._source.lengths
+        spans = sorted(
+            ((end - lengths[index], end, index) for end, index in self._source.matches(tokenize(source))),
+            key=lambda span: (span[0], span[0] - span[1]),
+        )
+        counts: Dict[int, int] = {}
+        covered = 0
+        for start, end, index in spans:
+            if start >= covered:
+                counts[index] = counts.get(index, 0) + 1
+                covered = end
+        return counts
+
+    def find_renderings(self, mt: str) -> set:
+        """Approved renderings present in `mt`."""
+        return {self._renderings[index] for _, index in self._target.matches(tokenize(mt))}
+
+    def scan(self, source: str, mt: str) -> List[Dict]:
+        """One hit per glossary term in the source, in glossary order."""
+        counts = self.find_terms(source)
+        if not counts:
+            return []
+        present = self.find_renderings(mt)
+        hits = []
+        for index in sorted(counts):
+            approved = self.approved[index]
+            hits.append({
+                "term": self.terms[index],
+                "approved": approved,
+                "count": counts[index],
+                "found": next((r for r in approved if r in present), None),
+            })
+        return hits
+
+    def format_stats(self) -> str:
+        return (
+            f"{len(self.terms)} terms, {len(self._renderings)} approved renderings, "
+            f"{len(self._source) + len(self._target)} automaton states"
+        )
+
+
+def make_glossary_node(glossary: Glossary) -> Callable[[Dict], Dict]:
+    """Graph node writing the segment's glossary matches to state["glossaryHits"]."""
+
+    def glossary_fn(state: Dict) -> Dict:
+        return {"glossaryHits": glossary.scan(state["source"], state["mt"])}
+
+    return glossary_fn
+
+
+def has_glossary_hits(state: Dict) -> bool:
+    return bool(state.get("glossaryHits"))
+
+
+def encode_hits(hits: Optional[List[Dict]]) -> str:
+    """One line per hit for the terminology agents."""
+    if not hits:
+        return "no glossary term occurs in the source"
+    lines = []
+    for hit in hits:
+        approved = " | ".join(hit["approved"]) or "-"
+        status = f'found "{hit["found"]}"' if hit["found"] else "NO approved rendering in the MT"
+        count = f" x{hit['count']}" if hit["count"] > 1 else ""
+        lines.append(f'"{hit["term"]}"{count} -> {approved}: {status}')
+    return "\n".join(lines)
+
+
+def _split_targets(value) -> List[str]:
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return str(value or "").split("|")
+
+
+def _read_entries(path: str) -> Iterable[Tuple[str, List[str]]]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["source"], _split_targets(record.get("targets", record.get("target")))
+        elif path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield row["source"], _split_targets(row.get("target"))
+        else:
+            for line_no, line in enumerate(f, start=1):
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) < 2 or (line_no == 1 and parts[0].strip().lower() == "source"):
+                    continue
+                yield parts[0], _split_targets(parts[1])
+
+
+def load_glossary(path: str) -> Glossary:
+    return Glossary(_read_entries(path))
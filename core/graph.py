@@ -1,8 +1,17 @@
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence
 from langgraph.graph import StateGraph, START, END
-from core.models import MTState
+from core.models import (
+    MTState,
+    AccuracyStage2Output,
+    FluencyStage2Output,
+    TerminologyStage2Output,
+    StyleStage2Output,
+)
 from agents.agent_factory import(
     make_error_agent_stage1,
     make_error_agent_stage2,
+    make_merged_error_agent_stage2,
     make_error_agent_stage3,
     make_missing_errors_audit_agent
 )
@@ -39,44 +48,109 @@ from prompts.stage3_prompts import (
     STYLE_STAGE3_PROMPT
 )
 from core.aggregation import aggregate_mt_quality
-
-
-#parallel
-accuracy_agent = make_error_agent_stage1(ACCURACY_PROMPT, "accuracyStage1")
-fluency_agent = make_error_agent_stage1(FLUENCY_PROMPT, "fluencyStage1")
-terminology_agent = make_error_agent_stage1(TERMINOLOGY_PROMPT, "terminologyStage1")
-style_agent = make_error_agent_stage1(STYLE_PROMPT, "styleStage1")
-
-
-addition_agent = make_error_agent_stage2(ADDITION_PROMPT, "addition", "accuracyStage1")
-omission_agent = make_error_agent_stage2(OMISSION_PROMPT, "omission", "accuracyStage1")
-mistranslation_agent = make_error_agent_stage2(MISTRANSLATION_PROMPT, "mistranslation", "accuracyStage1")
-untranslated_text_agent = make_error_agent_stage2(UNTRANSLATED_TEXT_PROMPT, "untranslated_text", "accuracyStage1")
-
-punctuation_agent = make_error_agent_stage2(PUNCTUATION_PROMPT, "punctuation", "fluencyStage1")
-spelling_agent = make_error_agent_stage2(SPELLING_PROMPT, "spelling", "fluencyStage1")
-grammar_agent = make_error_agent_stage2(GRAMMAR_PROMPT, "grammar", "fluencyStage1")
-register_agent = make_error_agent_stage2(REGISTER_PROMPT, "register", "fluencyStage1")
-inconsistency_agent = make_error_agent_stage2(INCONSISTENCY_PROMPT, "inconsistency", "fluencyStage1")
-characterEncoding_agent = make_error_agent_stage2(CHARACTER_ENCODING_PROMPT, "characterEncoding", "fluencyStage1")
-
-inappropriate_for_context_agent = make_error_agent_stage2(INAPPROPRIATE_FOR_CONTEXT_PROMPT, "inappropriate_for_context", "terminologyStage1")
-inconsistent_use_agent = make_error_agent_stage2(INCONSISTENT_USE_PROMPT, "inconsistent_use", "terminologyStage1")
-
-awkward_agent = make_error_agent_stage2(AWKWARD_PROMPT, "awkward", "styleStage1")
-
-
-
-accuracy_stage3_agent = make_error_agent_stage3(ACCURACY_STAGE3_PROMPT, "accuracyStage3", "accuracyStage1")
-fluency_stage3_agent = make_error_agent_stage3(FLUENCY_STAGE3_PROMPT, "fluencyStage3", "fluencyStage1")
-terminology_stage3_agent = make_error_agent_stage3(TERMINOLOGY_STAGE3_PROMPT, "terminologyStage3", "terminologyStage1")
-style_stage3_agent = make_error_agent_stage3(STYLE_STAGE3_PROMPT, "styleStage3", "styleStage1")
-
+from core.encoding import DEFAULT_REASONING_CHARS
+from core.metrics import summarize_records
+from core.gating import CleanGate, make_skip_node, make_stage1_router, skip_node_name
+from core.glossary import has_glossary_hits, make_glossary_node
+from core.rules import guard_stage2_node, make_rule_evidence, make_rules_node
+from core.taxonomy import CATEGORIES, CROSS_SEGMENT_SUBS, SUB_CATEGORIES, resolve_error_types, stage1_key, stage3_key
+
+
+STAGE1_PROMPTS = {
+    "accuracy": ACCURACY_PROMPT,
+    "fluency": FLUENCY_PROMPT,
+    "terminology": TERMINOLOGY_PROMPT,
+    "style": STYLE_PROMPT,
+}
+
+STAGE2_PROMPTS = {
+    #Accuracy
+    "addition": ADDITION_PROMPT,
+    "omission": OMISSION_PROMPT,
+    "mistranslation": MISTRANSLATION_PROMPT,
+    "untranslated_text": UNTRANSLATED_TEXT_PROMPT,
+    #Fluency
+    "punctuation": PUNCTUATION_PROMPT,
+    "spelling": SPELLING_PROMPT,
+    "grammar": GRAMMAR_PROMPT,
+    "register": REGISTER_PROMPT,
+    "inconsistency": INCONSISTENCY_PROMPT,
+    "characterEncoding": CHARACTER_ENCODING_PROMPT,
+    #Terminology
+    "inappropriate_for_context": INAPPROPRIATE_FOR_CONTEXT_PROMPT,
+    "inconsistent_use": INCONSISTENT_USE_PROMPT,
+    #Style
+    "awkward": AWKWARD_PROMPT,
+}
+
+STAGE3_PROMPTS = {
+    "accuracy": ACCURACY_STAGE3_PROMPT,
+    "fluency": FLUENCY_STAGE3_PROMPT,
+    "terminology": TERMINOLOGY_STAGE3_PROMPT,
+    "style": STYLE_STAGE3_PROMPT,
+}
+
+def prompt_keys():
+    """Every prompt build_graph accepts an override for."""
+    return (
+        [f"stage1.{c}" for c in STAGE1_PROMPTS]
+        + [f"stage2.{s}" for s in STAGE2_PROMPTS]
+        + [f"stage3.{c}" for c in STAGE3_PROMPTS]
+        + ["missing_errors"]
+    )
+
+
+MERGED_STAGE2_MODELS = {
+    "accuracy": AccuracyStage2Output,
+    "fluency": FluencyStage2Output,
+    "terminology": TerminologyStage2Output,
+    "style": StyleStage2Output,
+}
 
 
 def loop_controller(state: MTState) -> dict:
     current = state.get("round") or 1
-    return {"round": current + 1}
+
+    # re-run only what the audit names; fall back to a full pass when it
+    # names nothing or something outside the taxonomy
+    missing = state.get("missingErrors")
+    categories, subs, unresolved = resolve_error_types(missing.missingErrorTypes if missing else [])
+    if unresolved or not (categories or subs):
+        targets = list(CATEGORIES)
+    else:
+        targets = sorted(categories) + sorted(subs)
+
+    return {"round": current + 1, "reevaluationTargets": targets}
+
+
+def make_loop_router(stage2_node_of: dict):
+    """
+    Conditional edge out of loop_controller_node: every targeted sub-category
+    restarts at its stage-2 node (which in turn re-triggers the category's
+    stage-3 verifier); a targeted category restarts all of its stage-2 nodes.
+    Everything else is carried forward unchanged in the state.
+
+    Stage 1 never re-runs: its prompt sees only source/mt/reference, so a
+    second round would re-send byte-identical requests at temperature 0.
+    The audit-aware stage-2 agents do the re-evaluation instead.
+    """
+    def route(state: MTState):
+        nodes = []
+        for target in state.get("reevaluationTargets") or CATEGORIES:
+            subs = SUB_CATEGORIES.get(target, [target])
+            for sub in subs:
+                node = stage2_node_of[sub]
+                if node not in nodes:
+                    nodes.append(node)
+        return nodes
+
+    destinations = sorted(set(stage2_node_of.values()))
+    return route, destinations
+
+def finalize_run(state: MTState) -> dict:
+    update = aggregate_mt_quality(state)
+    update["runMetrics"] = summarize_records(state.get("nodeMetrics") or [])
+    return update
 
 def should_loop(state: MTState) -> str:
     missing = state.get("missingErrors")
@@ -87,107 +161,201 @@ def should_loop(state: MTState) -> str:
         return "loop"
     return "done"
 
-missing_errors_agent = make_missing_errors_audit_agent(MISSING_ERRORS_PROMPT, "missingErrors")
-graph = StateGraph(MTState)
-
-
-
-graph.add_node("accuracyStage1_node", accuracy_agent)
-graph.add_node("fluencyStage1_node", fluency_agent)
-graph.add_node("terminologyStage1_node", terminology_agent)
-graph.add_node("styleStage1_node", style_agent)
-
-graph.add_node("addition_node", addition_agent)
-graph.add_node("omission_node", omission_agent)
-graph.add_node("mistranslation_node", mistranslation_agent)
-graph.add_node("untranslated_text_node", untranslated_text_agent)
-
-graph.add_node("punctuation_node", punctuation_agent)
-graph.add_node("spelling_node", spelling_agent)
-graph.add_node("grammar_node", grammar_agent)
-graph.add_node("register_node", register_agent)
-graph.add_node("inconsistency_node", inconsistency_agent)
-graph.add_node("characterEncoding_node", characterEncoding_agent)
-
-graph.add_node("inappropriate_for_context_node", inappropriate_for_context_agent)
-graph.add_node("inconsistent_use_node", inconsistent_use_agent)
-
-graph.add_node("awkward_node", awkward_agent)
-
-graph.add_node("accuracyStage3_node", accuracy_stage3_agent)
-graph.add_node("fluencyStage3_node", fluency_stage3_agent)
-graph.add_node("terminologyStage3_node", terminology_stage3_agent)
-graph.add_node("styleStage3_node", style_stage3_agent)
-
-graph.add_node("aggregation_node", aggregate_mt_quality)
-
-graph.add_node("missing_errors_node", missing_errors_agent)
-graph.add_node("loop_controller_node", loop_controller)
-
-
-graph.add_edge(START, "accuracyStage1_node")
-graph.add_edge(START, "fluencyStage1_node")
-graph.add_edge(START, "terminologyStage1_node")
-graph.add_edge(START, "styleStage1_node")
-
-graph.add_edge("accuracyStage1_node", "addition_node")
-graph.add_edge("accuracyStage1_node", "omission_node")
-graph.add_edge("accuracyStage1_node", "mistranslation_node")
-graph.add_edge("accuracyStage1_node", "untranslated_text_node")
-
-graph.add_edge("fluencyStage1_node", "punctuation_node")
-graph.add_edge("fluencyStage1_node", "spelling_node")
-graph.add_edge("fluencyStage1_node", "grammar_node")
-graph.add_edge("fluencyStage1_node", "register_node")
-graph.add_edge("fluencyStage1_node", "inconsistency_node")
-graph.add_edge("fluencyStage1_node", "characterEncoding_node")
-
-graph.add_edge("terminologyStage1_node", "inappropriate_for_context_node")
-graph.add_edge("terminologyStage1_node", "inconsistent_use_node")
-
-
-graph.add_edge("styleStage1_node", "awkward_node")
-
-
-graph.add_edge("addition_node", "accuracyStage3_node")
-graph.add_edge("omission_node", "accuracyStage3_node")
-graph.add_edge("mistranslation_node", "accuracyStage3_node")
-graph.add_edge("untranslated_text_node", "accuracyStage3_node")
-
-graph.add_edge("punctuation_node", "fluencyStage3_node")
-graph.add_edge("spelling_node", "fluencyStage3_node")
-graph.add_edge("grammar_node", "fluencyStage3_node")
-graph.add_edge("register_node", "fluencyStage3_node")
-graph.add_edge("inconsistency_node", "fluencyStage3_node")
-graph.add_edge("characterEncoding_node", "fluencyStage3_node")
-
-graph.add_edge("inappropriate_for_context_node", "terminologyStage3_node")
-graph.add_edge("inconsistent_use_node", "terminologyStage3_node")
-
-graph.add_edge("awkward_node", "styleStage3_node")
-
-graph.add_edge("accuracyStage3_node", "missing_errors_node")
-graph.add_edge("fluencyStage3_node", "missing_errors_node")
-graph.add_edge("terminologyStage3_node", "missing_errors_node")
-graph.add_edge("styleStage3_node", "missing_errors_node")
-
-graph.add_edge("aggregation_node", END)
-
-graph.add_conditional_edges(
-    "missing_errors_node",
-    should_loop,
-    {
-        "loop": "loop_controller_node",
-        "done": "aggregation_node",
-
-    },
-)
-graph.add_edge("loop_controller_node", "accuracyStage1_node")
-graph.add_edge("loop_controller_node", "fluencyStage1_node")
-graph.add_edge("loop_controller_node", "terminologyStage1_node")
-graph.add_edge("loop_controller_node", "styleStage1_node")
-
-
 
-app = graph.compile()
-print("Graph compiled successfully!")
\ No newline at end of file
+def build_graph(
+    merged_stage2: bool = False,
+    gate: Optional[CleanGate] = None,
+    llm=None,
+    prompts: Optional[Dict[str, str]] = None,
+    reasoning_chars: Optional[int] = DEFAULT_REASONING_CHARS,
+    stage_llms: Optional[Dict[str, Any]] = None,
+    escalation=None,
+    document: bool = False,
+    glossary=None,
+    rules: Optional[Sequence[str]] = None,
+) -> StateGraph:
+    """
+    Build the evaluation graph.
+
+    merged_stage2: replace the 13-way stage-2 fan-out with one merged call per
+    super category (accuracyStage2_node, fluencyStage2_node, ...), cutting
+    stage-2 requests from 13 to 4 per segment.
+
+    gate: when set, a category whose stage-1 output is confidently clean skips
+    its stage-2 and stage-3 nodes (see core.gating).
+
+    llm: chat model for every agent (default: agents.agent_factory.get_llm()).
+
+    prompts: prompt overrides keyed "stage1.<category>", "stage2.<sub>",
+    "stage3.<category>" or "missing_errors"; anything not listed keeps the
+    prompt from prompts/.
+
+    reasoning_chars: how much of each earlier agent's reason later stages see
+    (see core.encoding; 0 = none, None = all).
+
+    stage_llms: per-stage chat models keyed "stage1", "stage2", "stage3" or
+    "audit", overriding `llm` for that stage (model cascade, core.cascade).
+
+    escalation: core.cascade.Escalation for the stage 1-3 agents; uncertain
+    outputs are re-requested from its stronger model.
+
+    document: document mode (core.document); the stage-2 agents of
+    CROSS_SEGMENT_SUBS - with merged_stage2, the merged call of their
+    category - also read state["documentContext"], and every stage-2 node
+    skips the sub-categories in state["deferredSubs"].
+
+    glossary: core.glossary.Glossary; a glossary_node scans every segment
+    before terminology stage 1, and the terminology agents get the matches
+    as evidence. Terminology stage 2/3 is skipped when no glossary term
+    occurs and stage 1 is clean (by `gate`, or CleanGate() without one).
+
+    rules: sub-categories decided by deterministic rules when they are
+    confident (core.rules.RULES); their stage-2 nodes then make no call.
+    """
+    prompts = prompts or {}
+    unknown = set(prompts) - set(prompt_keys())
+    if unknown:
+        raise ValueError(f"Unknown prompt keys: {sorted(unknown)}")
+
+    def prompt(stage: str, name: str, default: str) -> str:
+        return prompts.get(f"{stage}.{name}", default)
+
+    stage_llms = stage_llms or {}
+    stage1_llm, stage2_llm, stage3_llm, audit_llm = (
+        stage_llms.get(stage, llm) for stage in ("stage1", "stage2", "stage3", "audit")
+    )
+
+    graph = StateGraph(MTState)
+
+    graph.add_node("aggregation_node", finalize_run)
+    # deferred: branches may have different lengths (gated categories skip
+    # stage 2/3), and the audit must run once, after all of them
+    graph.add_node(
+        "missing_errors_node",
+        make_missing_errors_audit_agent(
+            prompts.get("missing_errors", MISSING_ERRORS_PROMPT), "missingErrors", llm=audit_llm,
+            reasoning_chars=reasoning_chars,
+        ),
+        defer=True,
+    )
+    graph.add_node("loop_controller_node", loop_controller)
+
+    # the rules run before everything else, so stage-1 routers already see their decisions
+    rules = list(rules or [])
+    entry = START
+    if rules:
+        graph.add_node("rules_node", make_rules_node(rules))
+        graph.add_edge(START, "rules_node")
+        entry = "rules_node"
+    if glossary is not None:
+        graph.add_node("glossary_node", make_glossary_node(glossary))
+        graph.add_edge(entry, "glossary_node")
+
+    def stage2_node(node, subs):
+        return guard_stage2_node(node, subs) if document or any(sub in rules for sub in subs) else node
+
+    stage2_node_of = {}
+    for category in CATEGORIES:
+        stage1_node = f"{stage1_key(category)}_node"
+        stage3_node = f"{stage3_key(category)}_node"
+        uses_glossary = glossary is not None and category == "terminology"
+
+        graph.add_node(stage1_node, make_error_agent_stage1(
+            prompt("stage1", category, STAGE1_PROMPTS[category]), stage1_key(category),
+            llm=stage1_llm, escalation=escalation, glossary=uses_glossary,
+        ))
+        graph.add_node(stage3_node, make_error_agent_stage3(
+            prompt("stage3", category, STAGE3_PROMPTS[category]), stage3_key(category), stage1_key(category),
+            llm=stage3_llm, reasoning_chars=reasoning_chars, escalation=escalation, glossary=uses_glossary,
+        ))
+
+        if merged_stage2:
+            merged_node = f"{category}Stage2_node"
+            sub_prompts = {sub: prompt("stage2", sub, STAGE2_PROMPTS[sub]) for sub in SUB_CATEGORIES[category]}
+            graph.add_node(merged_node, stage2_node(make_merged_error_agent_stage2(
+                sub_prompts, f"{category}Stage2", stage1_key(category), MERGED_STAGE2_MODELS[category],
+                llm=stage2_llm, reasoning_chars=reasoning_chars, escalation=escalation,
+                document_context=document and any(sub in CROSS_SEGMENT_SUBS for sub in SUB_CATEGORIES[category]),
+                glossary=uses_glossary,
+            ), SUB_CATEGORIES[category]))
+            stage2_nodes = [merged_node]
+            stage2_node_of.update({sub: merged_node for sub in SUB_CATEGORIES[category]})
+        else:
+            stage2_nodes = []
+            for sub in SUB_CATEGORIES[category]:
+                graph.add_node(f"{sub}_node", stage2_node(make_error_agent_stage2(
+                    prompt("stage2", sub, STAGE2_PROMPTS[sub]), sub, stage1_key(category),
+                    llm=stage2_llm, reasoning_chars=reasoning_chars, escalation=escalation,
+                    document_context=document and sub in CROSS_SEGMENT_SUBS,
+                    glossary=uses_glossary,
+                ), [sub]))
+                stage2_nodes.append(f"{sub}_node")
+                stage2_node_of[sub] = f"{sub}_node"
+
+        for node in stage2_nodes:
+            graph.add_edge(node, stage3_node)
+
+        # what keeps a category out of the gate's skip path despite a clean stage 1
+        evidence = [has_glossary_hits] if uses_glossary else []
+        if gate is not None and any(sub in rules for sub in SUB_CATEGORIES[category]):
+            evidence.append(make_rule_evidence(category))
+
+        if gate is None and not uses_glossary:
+            for node in stage2_nodes:
+                graph.add_edge(stage1_node, node)
+        else:
+            router, destinations = make_stage1_router(
+                category, stage2_nodes, gate or CleanGate(),
+                (lambda state, evidence=evidence: any(check(state) for check in evidence)) if evidence else None,
+            )
+            graph.add_node(skip_node_name(category), make_skip_node(category))
+            graph.add_conditional_edges(stage1_node, router, destinations)
+            graph.add_edge(skip_node_name(category), "missing_errors_node")
+
+        graph.add_edge("glossary_node" if uses_glossary else entry, stage1_node)
+        graph.add_edge(stage3_node, "missing_errors_node")
+
+    loop_router, loop_destinations = make_loop_router(stage2_node_of)
+    graph.add_conditional_edges("loop_controller_node", loop_router, loop_destinations)
+
+    graph.add_edge("aggregation_node", END)
+
+    graph.add_conditional_edges(
+        "missing_errors_node",
+        should_loop,
+        {
+            "loop": "loop_controller_node",
+            "done": "aggregation_node",
+
+        },
+    )
+
+    return graph
+
+
+def __getattr__(name: str):
+    # `from core.graph import app` keeps working, but the default graph is
+    # only built (through the pipeline cache) when somebody asks for it
+    if name == "app":
+        from core.pipeline import build_app
+        return build_app()
+    if name == "graph":
+        return _default_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@lru_cache(maxsize=1)
+def _default_graph() -> StateGraph:
+    return build_graph()
+
+
+async def aevaluate_batch(states, max_concurrency=None):
+    """
+    Evaluate many input states on the current event loop via app.abatch.
+    Every agent node runs its native async implementation, so at most
+    `max_concurrency` pipelines are in flight without a thread per LLM call.
+    Failed segments come back as exception objects in their slot.
+    """
+    config = {"max_concurrency": max_concurrency} if max_concurrency else None
+    from core.pipeline import build_app
+    return await build_app().abatch(states, config=config, return_exceptions=True)
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Persistent LLM Response Cache
+
+Content-addressed SQLite store for structured agent outputs. The key is a
+hash of everything that determines the response at temperature 0:
+model, system prompt, rendered human message and output schema. Re-running a
+corpus after a crash, or after changing only the deterministic aggregation,
+then replays stored outputs instead of paying for every call again.
+
+The store is bounded by size: when the payload total exceeds max_bytes the
+least recently used entries are evicted.
+
+Enable it with set_response_cache(...) or the LLM_CACHE_PATH environment
+variable.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Sequence
+
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def make_cache_key(model: str, messages: Sequence, schema) -> str:
+    """Hash of model, rendered messages (system + human) and the output schema."""
+    payload = {
+        "model": model,
+        "messages": [[m.type, m.content] for m in messages],
+        "schema": schema.model_json_schema(),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                node TEXT,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self._hits: Dict[str, int] = defaultdict(int)
+        self._misses: Dict[str, int] = defaultdict(int)
+
+    def get(self, key: str, node: str = "") -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._misses[node] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._hits[node] += 1
+            return row[0]
+
+    def put(self, key: str, value: str, node: str = ""):
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, node, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, node, value, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # shrink to 90% of the budget so eviction does not run on every put
+        target = int(self.max_bytes * 0.9)
+        self._conn.execute("BEGIN")
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall():
+            if self._total_bytes <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._total_bytes -= size
+        self._conn.execute("COMMIT")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counts per node since this cache was opened."""
+        with self._lock:
+            nodes = sorted(set(self._hits) | set(self._misses))
+            return {n: {"hits": self._hits[n], "misses": self._misses[n]} for n in nodes}
+
+    def format_stats(self) -> str:
+        lines = [f"{'node':<28}{'hits':>8}{'misses':>8}{'hit rate':>10}"]
+        total_hits = total_misses = 0
+        for node, s in self.stats().items():
+            calls = s["hits"] + s["misses"]
+            lines.append(f"{node:<28}{s['hits']:>8}{s['misses']:>8}{s['hits'] / calls:>10.1%}")
+            total_hits += s["hits"]
+            total_misses += s["misses"]
+        calls = total_hits + total_misses
+        if calls:
+            lines.append(f"{'TOTAL':<28}{total_hits:>8}{total_misses:>8}{total_hits / calls:>10.1%}")
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_active_cache: Optional[LLMResponseCache] = None
+_env_checked = False
+
+
+def set_response_cache(cache: Optional[LLMResponseCache]):
+    global _active_cache, _env_checked
+    _active_cache = cache
+    _env_checked = True
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    global _active_cache, _env_checked
+    if not _env_checked:
+        _env_checked = True
+        path = os.getenv("LLM_CACHE_PATH")
+        if path:
+            max_bytes = int(os.getenv("LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+            _active_cache = LLMResponseCache(path, max_bytes=max_bytes)
+    return _active_cache
@@ -1,8 +1,9 @@
 from openai import OpenAI
 
 class LLMClient:
-    def __init__(self, api_key, model="gpt-4.1-mini"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key, model="gpt-4.1-mini", base_url=None):
+        # base_url=None falls back to $OPENAI_BASE_URL, then the OpenAI API
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
         self.model = model
 
     def call(self, system_prompt: str, user_prompt: str) -> str:
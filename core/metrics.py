@@ -0,0 +1,167 @@
+"""
+Node Metrics
+
+Per-call instrumentation for the agent chains. Every StructuredChain call
+produces one record:
+
+- node, round
+- wall_time: node entry to parsed output
+- queue_wait: node entry to request dispatch (prompt rendering, cache lookup
+  and any wait before the request is sent)
+- llm_time: time spent in the provider call(s), retries included
+- validation_time: structured-output parsing and validation
+- input_tokens / output_tokens / cached_tokens (cached = input tokens served
+  from the provider's prompt cache)
+- retries, cache_hit
+- failed: the call ended without an output (invalid after correction, a
+  provider error that was not retried away, cancellation); its times and
+  tokens up to that point are still recorded
+- validation_failures: responses that failed schema validation;
+  local_repairs: of those, fixed without another call (core.repair);
+  correction_calls: follow-up requests sent for the rest
+- escalations: the output was re-requested from the stronger model of a
+  cascade (core.cascade)
+
+Records travel with the graph state (MTState.nodeMetrics) so each run gets
+its own totals, and are also fed to a process-wide collector that produces
+the corpus-level summary table.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, List
+
+
+RECORD_SUMS = [
+    "wall_time",
+    "queue_wait",
+    "llm_time",
+    "validation_time",
+    "input_tokens",
+    "output_tokens",
+    "cached_tokens",
+    "retries",
+    "validation_failures",
+    "local_repairs",
+    "correction_calls",
+    "escalations",
+]
+
+
+def new_record(node: str) -> dict:
+    record = {key: 0 for key in RECORD_SUMS}
+    record.update({"node": node, "round": 1, "cache_hit": False, "failed": False})
+    return record
+
+
+def add_usage(record: dict, usage) -> None:
+    usage = usage or {}
+    details = usage.get("input_token_details") or {}
+    record["input_tokens"] += usage.get("input_tokens", 0)
+    record["output_tokens"] += usage.get("output_tokens", 0)
+    record["cached_tokens"] += int(details.get("cache_read") or 0)
+
+
+def summarize_records(records: List[dict]) -> dict:
+    """Per-run totals: sums over all calls plus the number of LLM calls made."""
+    totals = {key: 0 for key in RECORD_SUMS}
+    totals["calls"] = 0
+    totals["cache_hits"] = 0
+    totals["failures"] = 0
+    for record in records:
+        for key in RECORD_SUMS:
+            totals[key] += record.get(key, 0)
+        if record.get("failed"):
+            totals["failures"] += 1
+        if record.get("cache_hit"):
+            totals["cache_hits"] += 1
+        else:
+            totals["calls"] += 1
+    totals["rounds"] = max((r.get("round", 1) for r in records), default=0)
+    return totals
+
+
+class MetricsCollector:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def record(self, record: dict):
+        with self._lock:
+            n = self._nodes[record["node"]]
+            n["calls"] += 1
+            for key in RECORD_SUMS:
+                n[key] += record.get(key, 0)
+            n["max_wall_time"] = max(n["max_wall_time"], record.get("wall_time", 0))
+            if record.get("failed"):
+                n["failures"] += 1
+            if record.get("cache_hit"):
+                n["cache_hits"] += 1
+            elif record.get("cached_tokens"):
+                n["prefix_cached_calls"] += 1
+                n["prefix_cached_llm_time"] += record.get("llm_time", 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {node: dict(values) for node, values in sorted(self._nodes.items())}
+
+    def reset(self):
+        with self._lock:
+            self._nodes.clear()
+
+    def format_table(self) -> str:
+        header = (
+            f"{'node':<28}{'calls':>7}{'hits':>6}{'wall':>8}{'max':>8}{'queue':>8}{'llm':>8}{'valid':>8}"
+            f"{'in tok':>10}{'cached':>9}{'out tok':>9}{'retries':>8}{'llm hit':>9}{'llm miss':>9}"
+            f"{'invalid':>8}{'fixed':>6}{'corr':>7}{'esc':>6}"
+        )
+        lines = [header]
+        totals = defaultdict(float)
+        for node, n in self.snapshot().items():
+            calls = n["calls"]
+            llm_calls = calls - n.get("cache_hits", 0)
+            hit_calls = n.get("prefix_cached_calls", 0)
+            miss_calls = llm_calls - hit_calls
+            hit_time = n.get("prefix_cached_llm_time", 0.0)
+            lat_hit = hit_time / hit_calls if hit_calls else 0.0
+            lat_miss = (n["llm_time"] - hit_time) / miss_calls if miss_calls else 0.0
+            lines.append(
+                f"{node:<28}{int(calls):>7}{int(n.get('cache_hits', 0)):>6}"
+                f"{n['wall_time'] / calls:>7.2f}s{n['max_wall_time']:>7.2f}s"
+                f"{n['queue_wait'] / calls:>7.2f}s{n['llm_time'] / calls:>7.2f}s"
+                f"{n['validation_time'] / calls * 1000:>6.1f}ms"
+                f"{int(n['input_tokens']):>10}{int(n['cached_tokens']):>9}{int(n['output_tokens']):>9}"
+                f"{int(n['retries']):>8}{lat_hit:>8.2f}s{lat_miss:>8.2f}s"
+                f"{int(n['validation_failures']):>8}{int(n['local_repairs']):>6}{int(n['correction_calls']):>7}"
+                f"{int(n['escalations']):>6}"
+            )
+            for key in ("calls", "input_tokens", "cached_tokens", "output_tokens", "retries", "wall_time", "llm_time",
+                        "validation_failures", "local_repairs", "correction_calls", "escalations", "failures"):
+                totals[key] += n.get(key, 0)
+
+        if totals["calls"]:
+            share = totals["cached_tokens"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+            lines.append(
+                f"TOTAL: {int(totals['calls'])} calls, {int(totals['input_tokens'])} input tokens "
+                f"({share:.1%} prefix-cached), {int(totals['output_tokens'])} output tokens, "
+                f"{int(totals['retries'])} retries, {totals['llm_time']:.1f}s in LLM calls"
+            )
+            if totals["escalations"]:
+                lines.append(
+                    f"CASCADE: {int(totals['escalations'])} of {int(totals['calls'])} calls escalated "
+                    f"({totals['escalations'] / totals['calls']:.1%})"
+                )
+            if totals["failures"]:
+                lines.append(f"FAILED: {int(totals['failures'])} calls ended without an output")
+            if totals["validation_failures"]:
+                lines.append(
+                    f"VALIDATION: {int(totals['validation_failures'])} invalid outputs "
+                    f"({totals['validation_failures'] / totals['calls']:.1%} of calls), "
+                    f"{int(totals['local_repairs'])} repaired locally, "
+                    f"{int(totals['correction_calls'])} correction requests"
+                )
+        return "\n".join(lines)
+
+
+node_metrics = MetricsCollector()
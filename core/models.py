@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Literal
-from typing_extensions import TypedDict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Literal
+from typing_extensions import Annotated, TypedDict
+import operator
 
 class AgentOutputStage1(BaseModel):
    
@@ -45,6 +46,32 @@ class AgentOutputStage2(BaseModel):
         le=100.0,
     )
 
+#merged stage 2: one structured call per super category,
+#one AgentOutputStage2 per sub category
+class AccuracyStage2Output(BaseModel):
+    addition: AgentOutputStage2
+    omission: AgentOutputStage2
+    mistranslation: AgentOutputStage2
+    untranslated_text: AgentOutputStage2
+
+class FluencyStage2Output(BaseModel):
+    #"register" would shadow BaseModel.register, so it is exposed through an alias
+    model_config = ConfigDict(populate_by_name=True)
+
+    punctuation: AgentOutputStage2
+    spelling: AgentOutputStage2
+    grammar: AgentOutputStage2
+    register_: AgentOutputStage2 = Field(..., alias="register")
+    inconsistency: AgentOutputStage2
+    characterEncoding: AgentOutputStage2
+
+class TerminologyStage2Output(BaseModel):
+    inappropriate_for_context: AgentOutputStage2
+    inconsistent_use: AgentOutputStage2
+
+class StyleStage2Output(BaseModel):
+    awkward: AgentOutputStage2
+
 class AgentOutputStage3(BaseModel):
    
     consistencyScore: float = Field(
@@ -118,4 +145,19 @@ class MTState(TypedDict):
     round: Optional[int]
     max_rounds: Optional[int]
     missingErrors: Optional[MissingErrorsOutput]
+    #categories / sub-categories the current loop round re-evaluates
+    reevaluationTargets: Optional[List[str]]
+    #document mode: the other segments of the document, shortened (core.document)
+    documentContext: Optional[str]
+    #glossary terms found in the source and whether an approved rendering is in the MT (core.glossary)
+    glossaryHits: Optional[List[dict]]
+    #sub-categories decided by deterministic rules instead of their stage-2 agent (core.rules)
+    ruleDecisions: Optional[List[str]]
+    #sub-categories evaluated outside this run, whose stage-2 nodes make no call (core.document)
+    deferredSubs: Optional[List[str]]
+
+    #one record per LLM call (see core.metrics), appended by every agent node
+    nodeMetrics: Annotated[List[dict], operator.add]
+    #per-run totals over nodeMetrics, written next to aggregation
+    runMetrics: Optional[dict]
 
@@ -0,0 +1,134 @@
+"""
+Pipeline Factory
+
+build_app(config) returns the compiled evaluation graph for a
+PipelineConfig. Nothing heavy happens at import: langchain, langgraph, the
+agents and the chat client are only imported / created on the first
+build_app call, and compiled graphs are cached per configuration, so a
+process that builds the same pipeline twice (or never) pays for it at most
+once.
+
+    from core.pipeline import PipelineConfig, build_app
+
+    app = build_app()                                     # default pipeline
+    app = build_app(PipelineConfig(model="gpt-4.1", merged_stage2=True))
+    app = build_app(PipelineConfig(model="gpt-4.1", cascade=CascadeConfig()))
+
+With a cascade (core.cascade), `model` is the strong model that uncertain
+nodes or segments escalate to; a segment-level cascade is returned as a
+SegmentCascade over two compiled graphs rather than a compiled graph.
+"""
+
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from core.encoding import DEFAULT_REASONING_CHARS
+
+if TYPE_CHECKING:
+    from core.cascade import CascadeConfig
+    from core.gating import CleanGate
+    from core.glossary import Glossary
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    """
+    model / temperature / base_url: chat client every agent uses
+    merged_stage2, gate: graph variants (see core.graph.build_graph)
+    max_concurrency: max nodes run in parallel within one invocation
+    (None = all ready nodes, i.e. up to the 13-way stage-2 fan-out)
+    reasoning_chars: reason length later stages see (core.encoding;
+    None = whole reasons)
+    prompts: prompt overrides as (key, prompt) pairs, keys as in
+    core.graph.prompt_keys(); a tuple so the config stays hashable
+    cascade: cheap-first model cascade (core.cascade.CascadeConfig)
+    checkpointer: LangGraph checkpointer the graph is compiled with (e.g.
+    core.checkpoint.SQLiteCheckpointSaver); invocations then need a
+    thread_id in config["configurable"]
+    document: compile for document mode (core.document), where the
+    cross-segment agents also read the document context
+    glossary: core.glossary.Glossary for the terminology agents
+    rules: sub-categories decided by deterministic rules when confident
+    (core.rules.RULES)
+    """
+
+    model: str = "gpt-4.1-mini"
+    temperature: float = 0.0
+    base_url: Optional[str] = None
+    merged_stage2: bool = False
+    gate: Optional["CleanGate"] = None
+    max_concurrency: Optional[int] = None
+    reasoning_chars: Optional[int] = DEFAULT_REASONING_CHARS
+    prompts: Tuple[Tuple[str, str], ...] = field(default_factory=tuple)
+    cascade: Optional["CascadeConfig"] = None
+    checkpointer: Optional[Any] = None
+    document: bool = False
+    glossary: Optional["Glossary"] = None
+    rules: Tuple[str, ...] = ()
+
+    @classmethod
+    def with_prompts(cls, prompts: Dict[str, str], **kwargs) -> "PipelineConfig":
+        return cls(prompts=tuple(sorted(prompts.items())), **kwargs)
+
+
+DEFAULT_CONFIG = PipelineConfig()
+
+
+def build_app(config: Optional[PipelineConfig] = None):
+    """Compiled graph for `config` (default: DEFAULT_CONFIG), built on first use and cached."""
+    # one cache key per configuration: build_app() and build_app(PipelineConfig()) share a graph
+    return _build_app(config if config is not None else DEFAULT_CONFIG)
+
+
+@lru_cache(maxsize=16)
+def _build_app(config: PipelineConfig):
+    from agents.agent_factory import get_llm
+    from core.graph import build_graph
+
+    cascade = config.cascade
+    if cascade is not None and cascade.level == "segment":
+        from core.cascade import SegmentCascade
+
+        if config.checkpointer is not None:
+            raise ValueError("a segment-level cascade runs two graphs per segment and cannot be checkpointed")
+
+        # the cheap pass: cascade models, thresholds of 0 so no node escalates on its own
+        cheap = replace(cascade, level="node", min_confidence=0.0, min_consistency=0.0)
+        cheap_app = build_app(replace(config, cascade=cheap))
+        strong_app = build_app(replace(config, cascade=None))
+        return SegmentCascade(cheap_app, strong_app, cascade)
+
+    def llm_for(model: Optional[str]):
+        return get_llm(model or config.model, config.temperature, config.base_url)
+
+    llm = llm_for(config.model)
+    stage_llms, escalation = None, None
+    if cascade is not None:
+        from core.cascade import Escalation
+
+        stage_llms = {
+            "stage1": llm_for(cascade.stage1_model),
+            "stage2": llm_for(cascade.stage2_model),
+            "stage3": llm_for(cascade.stage3_model),
+            "audit": llm_for(cascade.audit_model),
+        }
+        if cascade.min_confidence > 0 or cascade.min_consistency > 0:
+            escalation = Escalation(llm, cascade)
+
+    app = build_graph(
+        merged_stage2=config.merged_stage2,
+        gate=config.gate,
+        llm=llm,
+        prompts=dict(config.prompts),
+        reasoning_chars=config.reasoning_chars,
+        stage_llms=stage_llms,
+        escalation=escalation,
+        document=config.document,
+        glossary=config.glossary,
+        rules=config.rules,
+    ).compile(checkpointer=config.checkpointer)
+
+    if config.max_concurrency:
+        app = app.with_config(max_concurrency=config.max_concurrency)
+    return app
@@ -0,0 +1,376 @@
+"""
+Shared Rate Limiter
+
+One process-wide gate in front of every LLM call (stage 1/2/3, merged stage
+2 and the audit all go through StructuredChain, which consults it):
+
+- token buckets on requests per minute and on estimated tokens per minute,
+  so many concurrent pipelines stay under the provider's RPM/TPM limits
+  instead of discovering them through 429s
+- an AIMD concurrency controller: the number of calls in flight grows by one
+  per window of successful calls while there is headroom, and is cut
+  multiplicatively on a 429 or when latency rises well above its baseline
+- a 429 with Retry-After pauses new calls from every caller, so one
+  rate-limit response does not turn into a synchronized retry storm
+
+Both blocking (thread mode) and async acquisition are supported; waiters are
+served in FIFO order across both.
+
+Enable it with set_rate_limiter(...) or the LLM_RPM / LLM_TPM /
+LLM_MAX_CONCURRENCY environment variables.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Sequence
+
+
+CHARS_PER_TOKEN = 4
+DEFAULT_OUTPUT_TOKENS = 300
+
+
+def estimate_request_tokens(messages: Sequence, output_tokens: int = DEFAULT_OUTPUT_TOKENS) -> int:
+    """Rough token count of a request (~4 characters per token) plus its expected output."""
+    return sum(len(str(m.content)) for m in messages) // CHARS_PER_TOKEN + output_tokens
+
+
+class TokenBucket:
+    """
+    `rate` units per second, bursts up to `capacity`. reserve() takes the
+    units immediately and returns how long the caller must wait before using
+    them, so concurrent callers queue up in reservation order.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._level -= min(amount, self.capacity)
+            return -self._level / self.rate if self._level < 0 else 0.0
+
+    def refund(self, amount: float):
+        """Give back over-reserved units (estimate above actual usage); negative amounts charge more."""
+        with self._lock:
+            self._level = min(self.capacity, self._level + amount)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._level
+
+
+class _Waiter:
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AIMDController:
+    """
+    Adaptive limit on concurrent calls. Additive increase: +1 after `limit`
+    consecutive successful calls. Multiplicative decrease: limit * `backoff`
+    on a rate-limit response or when the latency EWMA exceeds
+    `latency_tolerance` x its baseline; at most one decrease per `cooldown`
+    seconds so one burst of 429s counts once.
+    """
+
+    def __init__(
+        self,
+        initial: int = 16,
+        minimum: int = 1,
+        maximum: int = 256,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        cooldown: float = 2.0,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.latency_baseline: Optional[float] = None
+        self.increases = 0
+        self.decreases = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def _try_acquire(self, waiter: Optional[_Waiter] = None) -> bool:
+        # caller holds the lock; FIFO: only the head waiter (or nobody queued) may take a slot
+        if self._has_slot() and (not self._waiters or self._waiters[0] is waiter):
+            if waiter is not None:
+                self._waiters.popleft()
+            self.in_flight += 1
+            return True
+        return False
+
+    def _wake_next(self):
+        # caller holds the lock
+        if self._waiters and self._has_slot():
+            self._waiters[0].wake()
+
+    def acquire(self):
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        while True:
+            waiter.event.wait()
+            with self._lock:
+                if self._try_acquire(waiter):
+                    self._wake_next()
+                    return
+                waiter.event.clear()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+        while True:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    self._wake_next()
+                raise
+            with self._lock:
+                if self._try_acquire(waiter):
+                    self._wake_next()
+                    return
+                waiter.future = loop.create_future()
+
+    def _decrease(self, now: float):
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * self.backoff)
+        self._successes = 0
+        self.decreases += 1
+
+    def release(self, latency: Optional[float] = None, rate_limited: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if rate_limited:
+                self._decrease(now)
+            elif latency is not None:
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                if self.latency_baseline is None or self.latency_ewma < self.latency_baseline:
+                    self.latency_baseline = self.latency_ewma
+
+                if self.latency_ewma > self.latency_tolerance * self.latency_baseline:
+                    self._decrease(now)
+                    # latency stays high at the new level: re-anchor instead of cutting again and again
+                    self.latency_baseline = self.latency_ewma / self.latency_tolerance
+                else:
+                    self._successes += 1
+                    if self._successes >= int(self.limit) and self.limit < self.maximum:
+                        self.limit += 1
+                        self._successes = 0
+                        self.increases += 1
+            self._wake_next()
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    return getattr(exc, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+class RateLimiter:
+    """
+    rpm / tpm: provider limits (None = unlimited); initial/max_concurrency
+    bound the AIMD controller. acquire() returns the seconds spent waiting.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        initial_concurrency: int = 16,
+        max_concurrency: int = 256,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        # a one-second burst allowance keeps the start of a run from firing a minute's budget at once
+        self.requests = TokenBucket(rpm / 60.0, max(1.0, rpm / 60.0)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60.0, max(tpm / 60.0, DEFAULT_OUTPUT_TOKENS * 4)) if tpm else None
+        self.concurrency = AIMDController(initial=min(initial_concurrency, max_concurrency), maximum=max_concurrency)
+
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.calls = 0
+        self.rate_limited = 0
+        self.wait_time = 0.0
+
+    def pause(self, seconds: float):
+        """Hold back every new call for `seconds` (provider asked us to via Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _bucket_wait(self, tokens: int) -> float:
+        with self._lock:
+            wait = max(0.0, self._paused_until - time.monotonic())
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def _abandon(self, tokens: int):
+        """The call will not be made (cancelled while waiting): give back its slot and reservations."""
+        if self.requests is not None:
+            self.requests.refund(1)
+        if self.tokens is not None:
+            self.tokens.refund(min(tokens, self.tokens.capacity))
+        self.concurrency.release()
+
+    def _count_wait(self, waited: float):
+        with self._lock:
+            self.calls += 1
+            self.wait_time += waited
+
+    def acquire(self, tokens: int) -> float:
+        started = time.monotonic()
+        self.concurrency.acquire()
+        delay = self._bucket_wait(tokens)
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            except BaseException:
+                self._abandon(tokens)
+                raise
+        waited = time.monotonic() - started
+        self._count_wait(waited)
+        return waited
+
+    async def aacquire(self, tokens: int) -> float:
+        started = time.monotonic()
+        await self.concurrency.aacquire()
+        delay = self._bucket_wait(tokens)
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                self._abandon(tokens)
+                raise
+        waited = time.monotonic() - started
+        self._count_wait(waited)
+        return waited
+
+    def release(
+        self,
+        latency: float,
+        error: Optional[Exception] = None,
+        estimated_tokens: int = 0,
+        actual_tokens: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        limited = error is not None and is_rate_limited(error)
+        if limited:
+            with self._lock:
+                self.rate_limited += 1
+            if retry_after:
+                self.pause(retry_after)
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+        # failures other than 429 say nothing about headroom
+        self.concurrency.release(None if error is not None else latency, rate_limited=limited)
+
+    def snapshot(self) -> Dict[str, float]:
+        c = self.concurrency
+        with c._lock:
+            state = {
+                "concurrency_limit": int(c.limit),
+                "in_flight": c.in_flight,
+                "waiting": len(c._waiters),
+                "increases": c.increases,
+                "decreases": c.decreases,
+                "latency_ewma": c.latency_ewma or 0.0,
+                "latency_baseline": c.latency_baseline or 0.0,
+            }
+        with self._lock:
+            state.update({
+                "calls": self.calls,
+                "rate_limited": self.rate_limited,
+                "wait_time": self.wait_time,
+            })
+        if self.requests is not None:
+            state["requests_available"] = self.requests.available
+        if self.tokens is not None:
+            state["tokens_available"] = self.tokens.available
+        return state
+
+    def format_stats(self) -> str:
+        s = self.snapshot()
+        mean_wait = s["wait_time"] / s["calls"] if s["calls"] else 0.0
+        limits = f"rpm={self.rpm or '-'} tpm={self.tpm or '-'}"
+        return (
+            f"{limits} concurrency limit={s['concurrency_limit']} "
+            f"(+{s['increases']}/-{s['decreases']}), {s['calls']} calls, "
+            f"{s['rate_limited']} rate-limited, mean wait {mean_wait:.2f}s, "
+            f"latency ewma {s['latency_ewma']:.2f}s (baseline {s['latency_baseline']:.2f}s)"
+        )
+
+
+_active_limiter: Optional[RateLimiter] = None
+_env_checked = False
+
+
+def set_rate_limiter(limiter: Optional[RateLimiter]):
+    global _active_limiter, _env_checked
+    _active_limiter = limiter
+    _env_checked = True
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    global _active_limiter, _env_checked
+    if not _env_checked:
+        _env_checked = True
+        rpm, tpm, concurrency = os.getenv("LLM_RPM"), os.getenv("LLM_TPM"), os.getenv("LLM_MAX_CONCURRENCY")
+        if rpm or tpm or concurrency:
+            _active_limiter = RateLimiter(
+                rpm=float(rpm) if rpm else None,
+                tpm=float(tpm) if tpm else None,
+                max_concurrency=int(concurrency) if concurrency else 256,
+            )
+    return _active_limiter
@@ -0,0 +1,168 @@
+"""
+Structured-Output Repair
+
+Cheap fixes for tool arguments that fail schema validation, tried before
+anything is re-requested:
+
+- malformed JSON: code fences, trailing commas, single quotes, unclosed
+  braces, text around the object
+- key spelling: "reevaluated_prob" -> reEvaluatedProb (case, _ and - ignored)
+- numbers: numeric strings and "85%" are coerced; a 0-1 field given on a
+  0-100 scale (85 -> 0.85) is rescaled; anything else out of range is clamped
+  to the ge/le bounds in core.models
+- literals: "yes", "Yes." or true -> "YES"
+- lists: a single string becomes a one-element list
+
+When local repair is not enough, correction_messages() builds a short
+follow-up that carries only the schema, the rejected arguments and the
+validation error, not the original prompt.
+"""
+
+import json
+import re
+import typing
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, ValidationError
+
+
+def _norm(name: str) -> str:
+    return "".join(ch for ch in name.lower() if ch.isalnum())
+
+
+def parse_json_loosely(text: str) -> Optional[dict]:
+    """Best-effort parse of a JSON object out of model output."""
+    text = text.strip()
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    start = text.find("{")
+    if start < 0:
+        return None
+    end = text.rfind("}")
+    text = text[start:end + 1] if end > start else text[start:]
+
+    candidates = [text]
+    fixed = re.sub(r",\s*([}\]])", r"\1", text)
+    candidates.append(fixed)
+    if "'" in fixed and '"' not in fixed:
+        candidates.append(fixed.replace("'", '"'))
+    # unclosed strings / objects: close them in order
+    if fixed.count('"') % 2:
+        fixed += '"'
+    fixed += "]" * max(0, fixed.count("[") - fixed.count("]"))
+    fixed += "}" * max(0, fixed.count("{") - fixed.count("}"))
+    candidates.append(re.sub(r",\s*([}\]])", r"\1", fixed))
+
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def _bounds(field) -> tuple:
+    ge = le = None
+    for m in field.metadata:
+        ge = getattr(m, "ge", ge)
+        le = getattr(m, "le", le)
+    return ge, le
+
+
+def _coerce_number(value: Any, ge, le) -> Any:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        match = re.search(r"-?\d+(?:\.\d+)?", value)
+        if match is None:
+            return value
+        number = float(match.group())
+        if "%" in value and le is not None and le <= 1:
+            number /= 100
+        value = number
+    if not isinstance(value, (int, float)):
+        return value
+    if le == 1 and 2 < value <= 100:
+        value = value / 100  # a probability given as a percentage
+    if ge is not None and value < ge:
+        value = ge
+    if le is not None and value > le:
+        value = le
+    return value
+
+
+def _coerce(annotation, field, value: Any) -> Any:
+    origin = typing.get_origin(annotation)
+    if origin is typing.Literal:
+        options = typing.get_args(annotation)
+        if isinstance(value, bool) and {"YES", "NO"} <= set(options):
+            return "YES" if value else "NO"
+        if isinstance(value, str):
+            by_name = {_norm(o): o for o in options if isinstance(o, str)}
+            return by_name.get(_norm(value), value)
+        return value
+    if origin in (list, List):
+        if isinstance(value, str):
+            return [value] if value.strip() else []
+        return value
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return repair_arguments(annotation, value) if isinstance(value, (dict, str)) else value
+    if annotation in (float, int):
+        return _coerce_number(value, *_bounds(field))
+    if annotation is str and value is not None and not isinstance(value, str):
+        return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+    return value
+
+
+def repair_arguments(schema, raw) -> Optional[Dict[str, Any]]:
+    """
+    Repaired copy of `raw` (dict or JSON text) for `schema`, or None when
+    there is nothing to work with. The result still has to be validated.
+    """
+    if isinstance(raw, str):
+        raw = parse_json_loosely(raw)
+    if not isinstance(raw, dict):
+        return None
+
+    keys = {}
+    for name, field in schema.model_fields.items():
+        key = field.alias or name
+        keys[_norm(key)] = (key, field)
+        keys.setdefault(_norm(name), (key, field))
+
+    repaired = {}
+    for raw_key, value in raw.items():
+        match = keys.get(_norm(str(raw_key)))
+        if match is None:
+            continue
+        key, field = match
+        repaired[key] = _coerce(field.annotation, field, value)
+    return repaired
+
+
+def validation_summary(error: Exception) -> str:
+    if not isinstance(error, ValidationError):
+        return str(error)
+    lines = []
+    for e in error.errors():
+        line = f"- {'.'.join(str(p) for p in e['loc']) or '(root)'}: {e['msg']}"
+        if e["type"] != "missing":
+            line += f" (got {repr(e.get('input'))[:200]})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def correction_messages(schema, raw, error: Exception) -> list:
+    """Follow-up request carrying only the rejected output and what is wrong with it."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    previous = raw if isinstance(raw, str) else json.dumps(raw, ensure_ascii=False)
+    return [
+        SystemMessage(
+            f"Your previous {schema.__name__} tool call was rejected by schema validation. "
+            "Call the tool again with corrected arguments. Keep every value that was valid "
+            "and change only what the errors point at."
+        ),
+        HumanMessage(f"Rejected arguments:\n{previous}\n\nValidation errors:\n{validation_summary(error)}"),
+    ]
@@ -0,0 +1,216 @@
+"""
+Deterministic Fast Paths
+
+Rules that decide a stage-2 sub-category without an LLM when the evidence
+is mechanical:
+
+- characterEncoding: U+FFFD replacement characters, mojibake (UTF-8 read as
+  cp1252 / Latin-1, e.g. "Ã©" for "é") or control characters in the MT;
+  an MT with none of them is confidently clean
+- untranslated_text: the MT equals the source, or, for language pairs in
+  different scripts, the MT is written in the source's script; an MT with
+  no letter of the source's script is confidently clean
+- punctuation: the sentence-final mark of the MT differs from the
+  reference's ("." vs "।") or is missing; an MT whose punctuation matches
+  the reference mark for mark is confidently clean
+
+A rule returns an AgentOutputStage2 when it is confident and None
+otherwise, in which case the LLM agent runs as usual. With rules enabled
+(build_graph(rules=...)) the rules_node runs first and writes its decisions
+into the state before any agent starts. The decided
+sub-categories' nodes make no call (guard_stage2_node), and their category
+is not gated as clean when a rule found an error. benchmarks.rule_agreement
+measures each rule's skip rate and its agreement with the LLM.
+"""
+
+import re
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from core.models import AgentOutputStage2, MTState
+from core.taxonomy import SUB_CATEGORIES
+from core.text import char_script, dominant_script, normalize_text
+
+
+# a lead byte of a 2-4 byte UTF-8 sequence read as cp1252 / Latin-1, followed by continuation bytes
+_MOJIBAKE = re.compile(
+    "[\u00c2-\u00f4]"
+    "[\u0080-\u00bf\u0152\u0153\u0160\u0161\u0178\u017d\u017e\u0192\u02c6\u02dc"
+    "\u2013\u2014\u2018-\u201e\u2020-\u2022\u2026\u2030\u2039\u203a\u20ac\u2122]{1,3}"
+)
+REPLACEMENT_CHAR = "\ufffd"
+
+FINAL_MARKS = {
+    ".": "full stop", "।": "full stop", "。": "full stop", "．": "full stop", "۔": "full stop",
+    "?": "question", "？": "question", "؟": "question",
+    "!": "exclamation", "！": "exclamation",
+}
+
+
+def _decision(rule: str, probability: float, confidence: float, reason: str) -> AgentOutputStage2:
+    return AgentOutputStage2(
+        reEvaluatedProb=probability,
+        thoughtsOnStage1=f"Decided by the {rule} rule without an LLM call; stage 1 was not consulted.",
+        reason=reason,
+        reEvaluatedConfidence=confidence,
+    )
+
+
+def _unmangle(run: str) -> Optional[str]:
+    """The text `run` was before UTF-8 got decoded as cp1252 / Latin-1, None if it is not such a run."""
+    for encoding in ("cp1252", "latin-1"):
+        try:
+            return run.encode(encoding).decode("utf-8")
+        except UnicodeError:
+            continue
+    return None
+
+
+def _control_chars(text: str) -> List[str]:
+    return [ch for ch in text if unicodedata.category(ch) in ("Cc", "Co") and ch not in "\t\n\r"]
+
+
+def check_character_encoding(source: str, mt: str, reference: str) -> Optional[AgentOutputStage2]:
+    rule = "characterEncoding"
+    if REPLACEMENT_CHAR in mt and REPLACEMENT_CHAR not in source:
+        return _decision(rule, 0.97, 95.0, f"The MT contains {mt.count(REPLACEMENT_CHAR)} U+FFFD replacement character(s).")
+    mojibake = [(run, _unmangle(run)) for run in _MOJIBAKE.findall(mt) if run not in source]
+    mojibake = [(run, fixed) for run, fixed in mojibake if fixed is not None]
+    if mojibake:
+        run, fixed = mojibake[0]
+        return _decision(rule, 0.95, 95.0, f'Mojibake in the MT: "{run}" is "{fixed}" decoded with the wrong encoding.')
+    control = [ch for ch in _control_chars(mt) if ch not in source]
+    if control:
+        return _decision(rule, 0.9, 90.0, f"The MT contains control / private-use characters {sorted(set(map(hex, map(ord, control))))}.")
+    if REPLACEMENT_CHAR in source or _control_chars(source):
+        return None
+    return _decision(rule, 0.02, 90.0, "No replacement, mojibake, control or private-use characters in the MT.")
+
+
+def _letter_scripts(text: str) -> List[str]:
+    return [char_script(ch) for ch in text if ch.isalpha()]
+
+
+def check_untranslated_text(source: str, mt: str, reference: str) -> Optional[AgentOutputStage2]:
+    rule = "untranslated_text"
+    if not _letter_scripts(source) or not _letter_scripts(mt):
+        return None
+    source_norm, mt_norm = normalize_text(source).casefold(), normalize_text(mt).casefold()
+    if mt_norm == source_norm and normalize_text(reference).casefold() != source_norm:
+        return _decision(rule, 0.97, 95.0, "The MT is identical to the source.")
+
+    source_script, reference_script = dominant_script(source), dominant_script(reference)
+    if reference_script in ("UNKNOWN", source_script):
+        # same-script pair: scripts cannot tell a translation from a copy
+        return None
+    mt_scripts = _letter_scripts(mt)
+    in_source_script = sum(script == source_script for script in mt_scripts)
+    if dominant_script(mt) == source_script:
+        return _decision(
+            rule, 0.9, 90.0,
+            f"{in_source_script} of {len(mt_scripts)} MT letters are {source_script}, the source script; "
+            f"the reference is written in {reference_script}.",
+        )
+    if in_source_script == 0:
+        return _decision(rule, 0.03, 90.0, f"The MT contains no {source_script} letters (source script).")
+    return None
+
+
+def _final_mark(text: str) -> Optional[str]:
+    text = text.rstrip().rstrip("\"'”’»)")
+    return text[-1] if text and text[-1] in FINAL_MARKS else None
+
+
+def _punctuation(text: str) -> List[str]:
+    return [ch for ch in text if unicodedata.category(ch).startswith("P")]
+
+
+def check_punctuation(source: str, mt: str, reference: str) -> Optional[AgentOutputStage2]:
+    rule = "punctuation"
+    mt_mark, reference_mark = _final_mark(mt), _final_mark(reference)
+    if reference_mark is not None:
+        if mt_mark is not None and mt_mark != reference_mark:
+            return _decision(
+                rule, 0.9, 90.0,
+                f'The MT ends with "{mt_mark}" ({FINAL_MARKS[mt_mark]}) where the reference ends with '
+                f'"{reference_mark}" ({FINAL_MARKS[reference_mark]}).',
+            )
+        if mt_mark is None and _final_mark(source) is not None:
+            return _decision(
+                rule, 0.85, 85.0, f'The MT has no sentence-final mark; source and reference end with one ("{reference_mark}").',
+            )
+    if _punctuation(mt) == _punctuation(reference):
+        return _decision(rule, 0.05, 85.0, "The MT's punctuation matches the reference mark for mark.")
+    return None
+
+
+RULES: Dict[str, Callable[[str, str, str], Optional[AgentOutputStage2]]] = {
+    "characterEncoding": check_character_encoding,
+    "untranslated_text": check_untranslated_text,
+    "punctuation": check_punctuation,
+}
+
+
+def apply_rules(state: Dict, names: Optional[Iterable[str]] = None) -> Dict[str, AgentOutputStage2]:
+    """Confident rule decisions for a segment, keyed by sub-category."""
+    decisions = {}
+    for name in names if names is not None else RULES:
+        output = RULES[name](state["source"], state["mt"], state["reference"])
+        if output is not None:
+            decisions[name] = output
+    return decisions
+
+
+def make_rules_node(names: Sequence[str]) -> Callable[[MTState], Dict]:
+    unknown = set(names) - set(RULES)
+    if unknown:
+        raise ValueError(f"Unknown rules: {sorted(unknown)}")
+
+    def rules_fn(state: MTState) -> Dict:
+        decisions = apply_rules(state, names)
+        return {**decisions, "ruleDecisions": list(decisions)}
+
+    return rules_fn
+
+
+def decided_subs(state: MTState) -> set:
+    """Sub-categories no stage-2 agent evaluates in this run: rule decisions and deferredSubs (core.document)."""
+    return set(state.get("ruleDecisions") or ()) | set(state.get("deferredSubs") or ())
+
+
+def guard_stage2_node(node, subs: Sequence[str]):
+    """
+    Wrap a stage-2 node so it leaves decided sub-categories (decided_subs)
+    alone: no call when every one of `subs` is decided, otherwise (merged
+    stage 2) the decided keys are dropped from its update.
+    """
+    # imported here so that importing RULES (core.runner) does not load langchain
+    from langchain_core.runnables import RunnableLambda
+
+    def keep(update: Dict, decided: set) -> Dict:
+        return {key: value for key, value in update.items() if key not in decided}
+
+    def guarded_fn(state: MTState, config=None) -> Dict:
+        decided = decided_subs(state)
+        if decided.issuperset(subs):
+            return {}
+        return keep(node.invoke(state, config), decided)
+
+    async def aguarded_fn(state: MTState, config=None) -> Dict:
+        decided = decided_subs(state)
+        if decided.issuperset(subs):
+            return {}
+        return keep(await node.ainvoke(state, config), decided)
+
+    return RunnableLambda(guarded_fn, afunc=aguarded_fn, name=node.name)
+
+
+def make_rule_evidence(category: str) -> Callable[[MTState], bool]:
+    """True when a rule found an error in `category` (the gate must not skip it)."""
+    subs = SUB_CATEGORIES[category]
+
+    def has_evidence(state: MTState) -> bool:
+        decided = state.get("ruleDecisions") or ()
+        return any(state[sub].reEvaluatedProb >= 0.5 for sub in decided if sub in subs)
+
+    return has_evidence
@@ -0,0 +1,485 @@
+"""
+Corpus Runner
+
+Runs the evaluation graph over a whole corpus of (source, mt, reference)
+triples with a bounded number of pipeline invocations in flight. Every result
+is written to the sink as soon as its segment finishes, and throughput / ETA
+are reported while the run is in progress.
+
+Two execution modes:
+- async (default): app.ainvoke on one event loop; agent nodes use their
+  native async implementations and share one HTTP connection pool
+- thread: app.invoke on a thread pool, one worker per in-flight segment
+
+Usage:
+    python -m core.runner corpus.jsonl results.jsonl --concurrency 64
+    python -m core.runner corpus.tsv results.csv --max-rounds 1 --mode thread
+    python -m core.runner corpus.jsonl results.jsonl --cache llm_cache.sqlite
+    python -m core.runner corpus.jsonl results.jsonl --rpm 5000 --tpm 2000000
+    python -m core.runner corpus.jsonl results.jsonl --model gpt-4.1 --cascade node --stage1-model gpt-4.1-nano
+    python -m core.runner corpus.jsonl results.jsonl --checkpoint run.sqlite   # re-run the same command to resume
+    python -m core.runner corpus.jsonl results.jsonl --document-key doc_id    # document mode (core.document)
+    python -m core.runner corpus.jsonl results.jsonl --glossary client_terms.tsv
+    python -m core.runner corpus.jsonl results.jsonl --rules           # rule fast paths (core.rules)
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from core.cascade import CascadeConfig, SegmentCascade
+from core.corpus import DEDUP_MODES, FanOutSink, dedupe_segments, group_by_language_pair, open_sink, read_segments
+from core.document import DocumentConfig, DocumentEvaluator, DocumentSink, group_documents
+from core.llm_cache import LLMResponseCache, get_response_cache, set_response_cache
+from core.metrics import node_metrics
+from core.pipeline import PipelineConfig, build_app
+from core.rules import RULES
+from core.rate_limit import RateLimiter, get_rate_limiter, set_rate_limiter
+
+if TYPE_CHECKING:
+    # langgraph / langchain_core: imported only when --checkpoint is used
+    from core.checkpoint import RunManifest
+
+
+@dataclass
+class RunStats:
+    total: Optional[int]  # None: streamed input of unknown length
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    resumed: int = 0
+    duplicates: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        rate = self.throughput
+        if rate == 0 or self.total is None:
+            return None
+        return (self.total - self.done) / rate
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Share of input segments answered by another occurrence's evaluation."""
+        segments = (self.total or 0) + self.skipped + self.duplicates
+        return self.duplicates / segments if segments else 0.0
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressReporter:
+    """Prints a one-line progress report at most every `interval` seconds."""
+
+    def __init__(self, stats: RunStats, interval: float = 5.0, stream=None):
+        self.stats = stats
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self._last = 0.0
+
+    def update(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        s = self.stats
+        print(
+            f"[{s.done}/{'?' if s.total is None else s.total}] failed={s.failed} "
+            f"{s.throughput:.2f} seg/s elapsed={_format_seconds(s.elapsed)} "
+            f"eta={_format_seconds(s.eta)}",
+            file=self.stream,
+            flush=True,
+        )
+
+
+def build_input_state(segment: Dict, max_rounds: int) -> Dict:
+    state = {
+        "source": segment["source"],
+        "mt": segment["mt"],
+        "reference": segment["reference"],
+        "round": 1,
+        "max_rounds": max_rounds,
+    }
+    # a document (core.document.as_document) is evaluated segment by segment
+    if "segments" in segment:
+        state["segments"] = segment["segments"]
+    return state
+
+
+def _prepare(segments: Iterable[Dict], sink, manifest: Optional["RunManifest"], dedup: Optional[str]):
+    """
+    (segments to run, sink, stats). The input is only materialized when
+    dedup or the manifest needs all of it; otherwise the dispatcher pulls
+    segments from the iterable as slots free up, and stats.total is None
+    unless the input has a length.
+    """
+    if not dedup and manifest is None:
+        return segments, sink, RunStats(total=len(segments) if hasattr(segments, "__len__") else None)
+    segments: List[Dict] = list(segments)
+    duplicates = 0
+    if dedup:
+        unique, occurrences = dedupe_segments(segments, dedup)
+        duplicates = len(segments) - len(unique)
+        segments, sink = unique, FanOutSink(sink, occurrences, dedup)
+    pending = manifest.pending(segments) if manifest is not None else segments
+    stats = RunStats(total=len(pending), skipped=len(segments) - len(pending), duplicates=duplicates)
+    return pending, sink, stats
+
+
+def _invocation(segment: Dict, max_rounds: int, manifest: Optional["RunManifest"], stats: RunStats):
+    """(input, config) for one segment; input None resumes the segment's checkpoint."""
+    if manifest is None:
+        return build_input_state(segment, max_rounds), None
+    if manifest.resumable(segment):
+        stats.resumed += 1
+        return None, manifest.config(segment)
+    return build_input_state(segment, max_rounds), manifest.config(segment)
+
+
+def _record(sink, segment: Dict, manifest: Optional["RunManifest"], stats: RunStats, result=None, error=None):
+    if error is not None:
+        stats.failed += 1
+    sink.write(segment, result=result, error=error)
+    if manifest is not None:
+        manifest.mark(segment, error)
+        _sync(sink, manifest)
+    stats.done += 1
+
+
+def _sync(sink, manifest: Optional["RunManifest"], final: bool = False):
+    """
+    Commit the manifest's finished segments once the sink holds no buffered
+    rows, so a segment is never marked done while its row could still be
+    lost (a ColumnarSink buffers up to a batch, an Arrow part is only
+    readable once the sink is closed). At the end of a run the sink is
+    flushed first; what is still buffered then is synced after close().
+    """
+    if manifest is None:
+        return
+    if final and hasattr(sink, "flush"):
+        sink.flush()
+    if not getattr(sink, "buffered", 0):
+        manifest.sync()
+
+
+def run_corpus(
+    segments: Iterable[Dict],
+    sink,
+    app=None,
+    concurrency: int = 8,
+    max_rounds: int = 2,
+    progress_interval: float = 5.0,
+    manifest: Optional["RunManifest"] = None,
+    dedup: Optional[str] = None,
+) -> RunStats:
+    """
+    Evaluate every segment with `app.invoke`, keeping at most `concurrency`
+    invocations in flight, and stream each result to `sink` on completion.
+    A failing segment is recorded in the sink and does not stop the run.
+
+    With a manifest (core.checkpoint; `app` compiled with its checkpointer)
+    segments finished by an earlier run are skipped and interrupted ones
+    resume from their checkpoint.
+
+    dedup ("exact" / "normalized", see core.corpus.dedupe_segments):
+    evaluate each distinct triple once and write its result for every
+    occurrence.
+    """
+    if app is None:
+        app = build_app()
+
+    segments, sink, stats = _prepare(segments, sink, manifest, dedup)
+    progress = ProgressReporter(stats, interval=progress_interval)
+
+    pending = {}
+    it = iter(segments)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+
+        def submit_next() -> bool:
+            segment = next(it, None)
+            if segment is None:
+                return False
+            future = pool.submit(app.invoke, *_invocation(segment, max_rounds, manifest, stats))
+            pending[future] = segment
+            return True
+
+        for _ in range(concurrency):
+            if not submit_next():
+                break
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                segment = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    _record(sink, segment, manifest, stats, error=f"{type(e).__name__}: {e}")
+                else:
+                    _record(sink, segment, manifest, stats, result=result)
+                submit_next()
+            progress.update()
+
+    _sync(sink, manifest, final=True)
+    progress.update(force=True)
+    return stats
+
+
+async def arun_corpus(
+    segments: Iterable[Dict],
+    sink,
+    app=None,
+    concurrency: int = 64,
+    max_rounds: int = 2,
+    progress_interval: float = 5.0,
+    manifest: Optional["RunManifest"] = None,
+    dedup: Optional[str] = None,
+) -> RunStats:
+    """
+    Async counterpart of run_corpus: keeps at most `concurrency` app.ainvoke
+    calls in flight on the running event loop.
+    """
+    if app is None:
+        app = build_app()
+
+    segments, sink, stats = _prepare(segments, sink, manifest, dedup)
+    progress = ProgressReporter(stats, interval=progress_interval)
+
+    pending = {}
+    it = iter(segments)
+
+    def submit_next() -> bool:
+        segment = next(it, None)
+        if segment is None:
+            return False
+        task = asyncio.ensure_future(app.ainvoke(*_invocation(segment, max_rounds, manifest, stats)))
+        pending[task] = segment
+        return True
+
+    for _ in range(concurrency):
+        if not submit_next():
+            break
+
+    while pending:
+        finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            segment = pending.pop(task)
+            try:
+                result = task.result()
+            except Exception as e:
+                _record(sink, segment, manifest, stats, error=f"{type(e).__name__}: {e}")
+            else:
+                _record(sink, segment, manifest, stats, result=result)
+            submit_next()
+        progress.update()
+
+    _sync(sink, manifest, final=True)
+    progress.update(force=True)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a corpus of MT segments.")
+    parser.add_argument("corpus", help="input corpus (.jsonl or .tsv)")
+    parser.add_argument("output", help="output sink (.jsonl, .csv or a .cols columnar store), appended to")
+    parser.add_argument("--input-format", choices=["jsonl", "tsv"], default=None)
+    parser.add_argument("--output-format", choices=["jsonl", "csv", "columnar"], default=None)
+    parser.add_argument("--mode", choices=["async", "thread"], default="async")
+    parser.add_argument("--concurrency", type=int, default=None, help="max pipelines in flight (default: 64 async, 8 thread)")
+    parser.add_argument("--max-rounds", type=int, default=2)
+    parser.add_argument("--model", default=PipelineConfig.model, help="chat model used by every agent")
+    parser.add_argument("--reasoning-chars", type=int, default=PipelineConfig.reasoning_chars,
+                        help="characters of earlier agents' reasons shown to later stages (default / -1 = all, 0 = none)")
+    parser.add_argument("--node-concurrency", type=int, default=None,
+                        help="max agent calls in flight per segment (default: no limit)")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--merged-stage2", action="store_true",
+                        help="one stage-2 call per super category instead of the 13-way fan-out")
+    parser.add_argument("--gate", action="store_true",
+                        help="skip stage 2/3 of categories that stage 1 reports as confidently clean")
+    parser.add_argument("--gate-max-prob", type=float, default=0.1)
+    parser.add_argument("--gate-min-confidence", type=float, default=80.0)
+    parser.add_argument("--group-by-language-pair", action="store_true",
+                        help="dispatch segments of the same language pair back to back (prompt-cache locality)")
+    parser.add_argument("--rpm", type=float, default=None, help="provider requests/minute to stay under")
+    parser.add_argument("--tpm", type=float, default=None, help="provider tokens/minute to stay under")
+    parser.add_argument("--max-llm-concurrency", type=int, default=None,
+                        help="upper bound of the adaptive limit on LLM calls in flight (enables the limiter)")
+    parser.add_argument("--cascade", choices=["node", "segment"], default=None,
+                        help="run stages on cheaper models first and escalate uncertain nodes / segments to --model")
+    parser.add_argument("--stage1-model", default=CascadeConfig.stage1_model)
+    parser.add_argument("--stage2-model", default=CascadeConfig.stage2_model)
+    parser.add_argument("--stage3-model", default=CascadeConfig.stage3_model)
+    parser.add_argument("--audit-model", default=CascadeConfig.audit_model, help="default: --model")
+    parser.add_argument("--escalate-below-confidence", type=float, default=CascadeConfig.min_confidence)
+    parser.add_argument("--escalate-below-consistency", type=float, default=CascadeConfig.min_consistency)
+    parser.add_argument("--dedup", choices=["off", *DEDUP_MODES], default="exact",
+                        help="evaluate repeated (source, mt, reference) triples once; normalized = NFKC + whitespace "
+                             "on source and reference, the MT must match exactly")
+    parser.add_argument("--document-key", default=None,
+                        help="document mode: evaluate segments sharing this field together, in input order")
+    parser.add_argument("--window-chars", type=int, default=DocumentConfig.window_chars,
+                        help="document mode: pack short segments into shared pipeline runs of up to this many "
+                             "characters; their scores are then window-level (default 0: each segment on its own)")
+    parser.add_argument("--chunk-chars", type=int, default=DocumentConfig.chunk_chars,
+                        help="document mode: longer segments are split into overlapping chunks of this size")
+    parser.add_argument("--chunk-overlap", type=int, default=DocumentConfig.chunk_overlap)
+    parser.add_argument("--glossary", default=None,
+                        help="client glossary (.tsv, .csv or .jsonl, see core.glossary) given to the terminology agents")
+    parser.add_argument("--rules", nargs="*", choices=list(RULES), default=None,
+                        help="decide these sub-categories by deterministic rules when confident (no names = all)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="SQLite checkpoint / run manifest; re-running with it skips finished segments and resumes the rest")
+    parser.add_argument("--cache", default=None, help="SQLite response cache path (default: $LLM_CACHE_PATH)")
+    parser.add_argument("--cache-max-mb", type=int, default=1024, help="cache size budget before LRU eviction")
+    args = parser.parse_args(argv)
+    if args.document_key and args.checkpoint:
+        parser.error("--document-key runs several graphs per document and cannot be combined with --checkpoint")
+
+    if args.rpm or args.tpm or args.max_llm_concurrency:
+        set_rate_limiter(RateLimiter(rpm=args.rpm, tpm=args.tpm, max_concurrency=args.max_llm_concurrency or 256))
+
+    if args.cache:
+        set_response_cache(LLMResponseCache(args.cache, max_bytes=args.cache_max_mb * 1024 * 1024))
+
+    gate = None
+    if args.gate:
+        from core.gating import CleanGate
+        gate = CleanGate(args.gate_max_prob, args.gate_min_confidence)
+    glossary = None
+    if args.glossary:
+        from core.glossary import load_glossary
+        glossary = load_glossary(args.glossary)
+        print(f"Glossary: {glossary.format_stats()}")
+    saver = manifest = None
+    if args.checkpoint:
+        from core.checkpoint import RunManifest, SQLiteCheckpointSaver
+        saver = SQLiteCheckpointSaver(args.checkpoint)
+        manifest = RunManifest(saver)
+    cascade = None
+    if args.cascade:
+        cascade = CascadeConfig(
+            stage1_model=args.stage1_model,
+            stage2_model=args.stage2_model,
+            stage3_model=args.stage3_model,
+            audit_model=args.audit_model,
+            min_confidence=args.escalate_below_confidence,
+            min_consistency=args.escalate_below_consistency,
+            level=args.cascade,
+        )
+    app = build_app(PipelineConfig(
+        model=args.model,
+        merged_stage2=args.merged_stage2,
+        gate=gate,
+        max_concurrency=args.node_concurrency,
+        reasoning_chars=None if args.reasoning_chars is None or args.reasoning_chars < 0 else args.reasoning_chars,
+        cascade=cascade,
+        checkpointer=saver,
+        document=args.document_key is not None,
+        glossary=glossary,
+        rules=tuple(RULES if args.rules == [] else args.rules or ()),
+    ))
+
+    segments = read_segments(args.corpus, args.input_format)
+    if args.group_by_language_pair:
+        segments = group_by_language_pair(segments)
+    sink = open_sink(args.output, args.output_format)
+    if args.document_key:
+        app = DocumentEvaluator(app, DocumentConfig(
+            window_chars=args.window_chars,
+            chunk_chars=args.chunk_chars,
+            chunk_overlap=args.chunk_overlap,
+        ))
+        segments = group_documents(segments, args.document_key)
+        sink = DocumentSink(sink)
+    try:
+        if args.mode == "async":
+            stats = asyncio.run(arun_corpus(
+                segments,
+                sink,
+                app=app,
+                concurrency=args.concurrency or 64,
+                max_rounds=args.max_rounds,
+                progress_interval=args.progress_interval,
+                manifest=manifest,
+                dedup=None if args.dedup == "off" else args.dedup,
+            ))
+        else:
+            stats = run_corpus(
+                segments,
+                sink,
+                app=app,
+                concurrency=args.concurrency or 8,
+                max_rounds=args.max_rounds,
+                progress_interval=args.progress_interval,
+                manifest=manifest,
+                dedup=None if args.dedup == "off" else args.dedup,
+            )
+    finally:
+        sink.close()
+        if saver is not None:
+            manifest.sync()
+            saver.close()
+
+    print(
+        f"Done: {stats.done} {'documents' if args.document_key else 'segments'} ({stats.failed} failed) in "
+        f"{_format_seconds(stats.elapsed)}, {stats.throughput:.2f} seg/s"
+    )
+    if args.dedup != "off":
+        segments_in = stats.total + stats.skipped + stats.duplicates
+        print(
+            f"Dedup ({args.dedup}): {segments_in} segments, {segments_in - stats.duplicates} unique triples, "
+            f"{stats.duplicates} duplicates answered from them ({stats.dedup_ratio:.1%} of evaluations saved)"
+        )
+    if saver is not None:
+        print(f"Resume: {stats.skipped} segments already finished, {stats.resumed} resumed from a checkpoint")
+        print(f"Checkpoints: {saver.format_stats()}")
+
+    print()
+    print("Per-node metrics (means per call; cached = input tokens served from the provider prompt cache):")
+    print(node_metrics.format_table())
+
+    if isinstance(app, DocumentEvaluator):
+        print()
+        print("Documents:")
+        print(app.format_stats())
+
+    if isinstance(app, SegmentCascade):
+        print()
+        print("Cascade:")
+        print(app.format_stats())
+
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        print()
+        print("Rate limiter:")
+        print(limiter.format_stats())
+
+    cache = get_response_cache()
+    if cache is not None:
+        print()
+        print("Response cache:")
+        print(cache.format_stats())
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Evaluation Service
+
+A long-running local HTTP service around one compiled evaluation graph.
+The graph is built once at startup (core.pipeline.build_app) and every
+agent shares the pooled chat client of agents.agent_factory.get_llm, so a
+request pays for its LLM calls and nothing else: no interpreter start, no
+langchain / langgraph import, no graph compilation.
+
+Endpoints:
+- POST /evaluate: one segment {"source", "mt", "reference", optional "id"}
+  answered with {"id", "result"}, or a batch {"segments": [...]} answered
+  with {"results": [...]} in input order; a failing segment of a batch gets
+  {"id", "error"} and does not fail the others. "max_rounds" in the body
+  overrides the service default.
+- POST /stream: one segment, answered with NDJSON lines of
+  core.streaming updates (node, score, final) as the graph runs
+- GET /health: liveness, model and uptime
+- GET /queue: in-flight / queued segments, capacities, totals and latency
+
+Backpressure: at most --max-in-flight segments are evaluated at once and
+at most --max-queued more wait for a slot. A request whose segments do not
+all fit is rejected as a whole with 429 and a Retry-After estimated from
+the recent evaluation latency; a batch larger than both together gets 413.
+Segments of one batch run concurrently, so a batch costs about as long as
+its slowest segment.
+
+Usage:
+    python -m core.service --port 8080 --model gpt-4.1-mini --max-in-flight 64
+    python -m core.service --unix /tmp/mt-eval.sock --rules --cache llm_cache.sqlite
+    python -m core.service --fake --fake-latency-ms 300              # offline, FakeChatModel
+
+    curl -s localhost:8080/evaluate -d '{"source": "...", "mt": "...", "reference": "..."}'
+    curl -s localhost:8080/queue
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from core.corpus import SEGMENT_FIELDS, serialize_state
+from core.llm_cache import LLMResponseCache, get_response_cache, set_response_cache
+from core.pipeline import PipelineConfig, build_app
+from core.rate_limit import RateLimiter, set_rate_limiter
+from core.rules import RULES
+from core.runner import build_input_state
+from core.streaming import astream_evaluation
+
+
+LATENCY_SAMPLES = 1_000
+
+
+class RequestError(Exception):
+    """A request the service refuses; status and headers go into the response."""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Admission:
+    """The segments of one admitted request that still hold a place in the queue."""
+
+    def __init__(self, queue: "AdmissionQueue", n: int):
+        self.queue = queue
+        self.remaining = n
+
+    def release(self, n: int = 1):
+        n = min(n, self.remaining)
+        self.remaining -= n
+        self.queue.admitted -= n
+
+
+class AdmissionQueue:
+    """
+    Bounded admission of segments: at most `max_in_flight` evaluating, at
+    most `max_queued` more waiting for a slot. Requests are admitted whole
+    or not at all (admission()); a segment gives its place back when its
+    evaluation ends, and the request gives back whatever never reached
+    run(), e.g. when the client went away first.
+    """
+
+    def __init__(self, max_in_flight: int = 64, max_queued: int = 256):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.admitted = 0  # in flight + queued
+        self.in_flight = 0
+        self.totals = Counter()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.waits = deque(maxlen=LATENCY_SAMPLES)
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    @property
+    def capacity(self) -> int:
+        return self.max_in_flight + self.max_queued
+
+    @property
+    def queued(self) -> int:
+        return self.admitted - self.in_flight
+
+    def retry_after(self, n: int) -> int:
+        """Seconds until `n` more segments would fit, from the median recent latency."""
+        latency = sorted(self.latencies)[len(self.latencies) // 2] if self.latencies else 1.0
+        waves = math.ceil((self.admitted + n - self.capacity) / self.max_in_flight)
+        return max(1, math.ceil(waves * latency))
+
+    def admit(self, n: int):
+        if n > self.capacity:
+            self.totals["rejected"] += n
+            raise RequestError(413, f"a batch of {n} segments exceeds the queue capacity of {self.capacity}")
+        if self.admitted + n > self.capacity:
+            self.totals["rejected"] += n
+            raise RequestError(
+                429,
+                f"{self.admitted} segments admitted, capacity {self.capacity}",
+                {"Retry-After": str(self.retry_after(n))},
+            )
+        self.admitted += n
+        self.totals["accepted"] += n
+
+    @contextmanager
+    def admission(self, n: int):
+        self.admit(n)
+        admission = Admission(self, n)
+        try:
+            yield admission
+        finally:
+            admission.release(admission.remaining)
+
+    async def run(self, admission: Admission, coro_fn):
+        """Run one admitted segment's evaluation once a slot is free."""
+        queued_at = time.monotonic()
+        try:
+            async with self._slots:
+                started = time.monotonic()
+                self.waits.append(started - queued_at)
+                self.in_flight += 1
+                try:
+                    result = await coro_fn()
+                except Exception:
+                    self.totals["failed"] += 1
+                    raise
+                finally:
+                    self.in_flight -= 1
+                self.totals["completed"] += 1
+                self.latencies.append(time.monotonic() - started)
+                return result
+        finally:
+            admission.release()
+
+    def snapshot(self) -> Dict:
+        def percentile(samples, p: float) -> float:
+            samples = sorted(samples)
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+            "accepted": self.totals["accepted"],
+            "rejected": self.totals["rejected"],
+            "completed": self.totals["completed"],
+            "failed": self.totals["failed"],
+            "latency_s": {"p50": percentile(self.latencies, 0.50), "p95": percentile(self.latencies, 0.95)},
+            "queue_wait_s": {"p50": percentile(self.waits, 0.50), "p95": percentile(self.waits, 0.95)},
+        }
+
+
+def _segment(body, max_rounds: int) -> Dict:
+    if not isinstance(body, dict) or not all(isinstance(body.get(k), str) for k in SEGMENT_FIELDS):
+        raise RequestError(400, f"a segment is an object with string fields {SEGMENT_FIELDS}")
+    segment = dict(body)
+    segment.setdefault("max_rounds", max_rounds)
+    if not isinstance(segment["max_rounds"], int) or segment["max_rounds"] < 1:
+        raise RequestError(400, "max_rounds must be a positive integer")
+    return segment
+
+
+class EvaluationService:
+
+    def __init__(self, app, queue: AdmissionQueue, max_rounds: int = 2, model: str = PipelineConfig.model):
+        self.app = app
+        self.queue = queue
+        self.max_rounds = max_rounds
+        self.model = model
+        self.started_at = time.monotonic()
+
+    async def _read(self, request: web.Request):
+        try:
+            return await request.json()
+        except json.JSONDecodeError:
+            raise RequestError(400, "request body is not valid JSON")
+
+    async def _evaluate(self, admission: Admission, segment: Dict) -> Dict:
+        state = build_input_state(segment, segment["max_rounds"])
+        return await self.queue.run(admission, lambda: self.app.ainvoke(state))
+
+    async def _evaluate_many(self, segments: List[Dict]) -> List[Dict]:
+        with self.queue.admission(len(segments)) as admission:
+            outcomes = await asyncio.gather(*(self._evaluate(admission, s) for s in segments), return_exceptions=True)
+        results = []
+        for segment, outcome in zip(segments, outcomes):
+            if isinstance(outcome, BaseException):
+                results.append({"id": segment.get("id"), "error": f"{type(outcome).__name__}: {outcome}"})
+            else:
+                results.append({"id": segment.get("id"), "result": serialize_state(outcome)})
+        return results
+
+    # handlers
+
+    async def evaluate(self, request: web.Request) -> web.Response:
+        body = await self._read(request)
+        if isinstance(body, dict) and "segments" in body:
+            if not isinstance(body["segments"], list) or not body["segments"]:
+                raise RequestError(400, '"segments" must be a non-empty list')
+            max_rounds = body.get("max_rounds", self.max_rounds)
+            segments = [_segment(s, max_rounds) for s in body["segments"]]
+            return web.json_response({"results": await self._evaluate_many(segments)}, dumps=_dumps)
+
+        segment = _segment(body, self.max_rounds)
+        [result] = await self._evaluate_many([segment])
+        return web.json_response(result, status=500 if "error" in result else 200, dumps=_dumps)
+
+    async def stream(self, request: web.Request) -> web.StreamResponse:
+        segment = _segment(await self._read(request), self.max_rounds)
+        state = build_input_state(segment, segment["max_rounds"])
+        with self.queue.admission(1) as admission:
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+
+            async def stream_updates():
+                async for update in astream_evaluation(self.app, state):
+                    await response.write((_dumps(update.to_dict()) + "\n").encode("utf-8"))
+
+            try:
+                await self.queue.run(admission, stream_updates)
+            except Exception as e:
+                # the status line is gone already; the error is the stream's last line
+                error = {"kind": "error", "id": segment.get("id"), "error": f"{type(e).__name__}: {e}"}
+                await response.write((_dumps(error) + "\n").encode("utf-8"))
+            await response.write_eof()
+        return response
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "model": self.model,
+            "uptime_s": time.monotonic() - self.started_at,
+        })
+
+    async def queue_depth(self, request: web.Request) -> web.Response:
+        return web.json_response(self.queue.snapshot())
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+@web.middleware
+async def _errors(request: web.Request, handler):
+    try:
+        return await handler(request)
+    except RequestError as e:
+        return web.json_response({"error": str(e)}, status=e.status, headers=e.headers)
+
+
+def build_service(app, max_in_flight: int = 64, max_queued: int = 256, max_rounds: int = 2,
+                  model: str = PipelineConfig.model) -> web.Application:
+    """aiohttp application serving the compiled graph `app`."""
+    service = EvaluationService(app, AdmissionQueue(max_in_flight, max_queued), max_rounds, model)
+    web_app = web.Application(client_max_size=32 * 1024 * 1024, middlewares=[_errors])
+    web_app.router.add_post("/evaluate", service.evaluate)
+    web_app.router.add_post("/stream", service.stream)
+    web_app.router.add_get("/health", service.health)
+    web_app.router.add_get("/queue", service.queue_depth)
+    web_app["service"] = service
+    return web_app
+
+
+def _close_cache(web_app: web.Application):
+    async def close(_):
+        cache = get_response_cache()
+        if cache is not None:
+            cache.close()
+
+    web_app.on_cleanup.append(close)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Long-running MT evaluation service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", default=None, help="serve on this Unix socket path instead of host:port")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="segments evaluated at once")
+    parser.add_argument("--max-queued", type=int, default=256, help="segments waiting for a slot before 429")
+    parser.add_argument("--max-rounds", type=int, default=2)
+    parser.add_argument("--model", default=PipelineConfig.model, help="chat model used by every agent")
+    parser.add_argument("--reasoning-chars", type=int, default=PipelineConfig.reasoning_chars,
+                        help="reason length later stages see (default / negative: unlimited)")
+    parser.add_argument("--node-concurrency", type=int, default=None,
+                        help="max graph nodes run in parallel per segment")
+    parser.add_argument("--merged-stage2", action="store_true", help="one stage-2 call per category")
+    parser.add_argument("--gate", action="store_true", help="skip stage 2 of categories stage 1 finds clean")
+    parser.add_argument("--gate-max-prob", type=float, default=0.1)
+    parser.add_argument("--gate-min-confidence", type=float, default=80.0)
+    parser.add_argument("--glossary", default=None, help="client glossary for the terminology agents (core.glossary)")
+    parser.add_argument("--rules", nargs="*", choices=list(RULES), default=None,
+                        help="decide these sub-categories by deterministic rules when confident (no names: all)")
+    parser.add_argument("--rpm", type=float, default=None, help="provider requests/minute to stay under")
+    parser.add_argument("--tpm", type=float, default=None, help="provider tokens/minute to stay under")
+    parser.add_argument("--max-llm-concurrency", type=int, default=None,
+                        help="max LLM calls in flight (adaptive below it)")
+    parser.add_argument("--cache", default=None, help="SQLite response cache path")
+    parser.add_argument("--cache-max-mb", type=int, default=1024, help="cache size budget before LRU eviction")
+    parser.add_argument("--fake", action="store_true", help="serve FakeChatModel answers (offline load tests)")
+    parser.add_argument("--fake-latency-ms", type=float, default=300.0)
+    args = parser.parse_args(argv)
+
+    if args.rpm or args.tpm or args.max_llm_concurrency:
+        set_rate_limiter(RateLimiter(rpm=args.rpm, tpm=args.tpm, max_concurrency=args.max_llm_concurrency or 256))
+    if args.cache:
+        set_response_cache(LLMResponseCache(args.cache, max_bytes=args.cache_max_mb * 1024 * 1024))
+
+    gate = None
+    if args.gate:
+        from core.gating import CleanGate
+        gate = CleanGate(args.gate_max_prob, args.gate_min_confidence)
+    glossary = None
+    if args.glossary:
+        from core.glossary import load_glossary
+        glossary = load_glossary(args.glossary)
+        print(f"Glossary: {glossary.format_stats()}")
+    rules = tuple(RULES if args.rules == [] else args.rules or ())
+    reasoning_chars = None if args.reasoning_chars is None or args.reasoning_chars < 0 else args.reasoning_chars
+
+    if args.fake:
+        from benchmarks.fake_llm import FakeChatModel
+        from core.graph import build_graph
+
+        app = build_graph(
+            llm=FakeChatModel(latency_ms=args.fake_latency_ms), merged_stage2=args.merged_stage2, gate=gate,
+            reasoning_chars=reasoning_chars, glossary=glossary, rules=rules,
+        ).compile()
+        if args.node_concurrency:
+            app = app.with_config(max_concurrency=args.node_concurrency)
+    else:
+        app = build_app(PipelineConfig(
+            model=args.model,
+            merged_stage2=args.merged_stage2,
+            gate=gate,
+            max_concurrency=args.node_concurrency,
+            reasoning_chars=reasoning_chars,
+            glossary=glossary,
+            rules=rules,
+        ))
+
+    web_app = build_service(app, args.max_in_flight, args.max_queued, args.max_rounds,
+                            "fake" if args.fake else args.model)
+    _close_cache(web_app)
+    where = f"unix:{args.unix}" if args.unix else f"http://{args.host}:{args.port}"
+    print(f"Evaluation service on {where} (max {args.max_in_flight} in flight, {args.max_queued} queued)")
+    if args.unix:
+        web.run_app(web_app, path=args.unix, print=None, access_log=None)
+    else:
+        web.run_app(web_app, host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
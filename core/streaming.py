@@ -0,0 +1,167 @@
+"""
+Streaming Evaluation
+
+Incremental results of one segment while the graph is still running, built
+on app.stream / app.astream (stream_mode="updates"):
+
+    for update in stream_evaluation(app, build_input_state(segment, max_rounds=2)):
+        if isinstance(update, ScoreUpdate):
+            show(update.aggregation["final_quality_score_100"], update.categories)
+
+Three update types, in graph order:
+- NodeUpdate: one finished node, its outputs and LLM call records
+- ScoreUpdate: a provisional aggregate_mt_quality, recomputed whenever a
+  stage-1, stage-2 or stage-3 output changes; the last one is final
+- FinalState: the complete MTState, exactly what app.invoke returns
+
+A category's missing stage-2 outputs are stood in for by its stage-1
+probability and confidence, so the first score arrives after one LLM
+round-trip (the first stage-1 node). ScoreUpdate.categories says how far
+each category is: "pending" (nothing yet, scores 0), "stage1", "stage2"
+(stage-2 outputs, unverified) or "verified" (stage 3 done). Loop rounds
+replace earlier outputs, so later scores refine earlier ones.
+
+Works with compiled graphs; SegmentCascade and DocumentEvaluator have no
+stream of their own.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+
+from core.aggregation import aggregate_mt_quality
+from core.corpus import serialize_state
+from core.models import AgentOutputStage1, AgentOutputStage2, MTState
+from core.taxonomy import CATEGORIES, SUB_CATEGORIES, stage1_key, stage3_key
+
+
+SCORED_KEYS = frozenset(
+    [stage1_key(c) for c in CATEGORIES]
+    + [s for c in CATEGORIES for s in SUB_CATEGORIES[c]]
+    + [stage3_key(c) for c in CATEGORIES]
+)
+
+
+@dataclass(frozen=True)
+class NodeUpdate:
+    node: str
+    outputs: Dict[str, Any]
+    records: List[dict]
+    round: int
+    elapsed: float
+    kind: str = field(default="node", init=False)
+
+    def to_dict(self) -> Dict:
+        return {"kind": self.kind, "node": self.node, "outputs": serialize_state(self.outputs),
+                "records": self.records, "round": self.round, "elapsed": self.elapsed}
+
+
+@dataclass(frozen=True)
+class ScoreUpdate:
+    aggregation: Dict[str, float]
+    categories: Dict[str, str]
+    final: bool
+    elapsed: float
+    kind: str = field(default="score", init=False)
+
+    def to_dict(self) -> Dict:
+        return {"kind": self.kind, "aggregation": self.aggregation, "categories": self.categories,
+                "final": self.final, "elapsed": self.elapsed}
+
+
+@dataclass(frozen=True)
+class FinalState:
+    state: Dict
+    elapsed: float
+    kind: str = field(default="final", init=False)
+
+    def to_dict(self) -> Dict:
+        return {"kind": self.kind, "state": serialize_state(self.state), "elapsed": self.elapsed}
+
+
+StreamUpdate = Union[NodeUpdate, ScoreUpdate, FinalState]
+
+
+def _stand_in(stage1: AgentOutputStage1) -> AgentOutputStage2:
+    return AgentOutputStage2(
+        reEvaluatedProb=stage1.probability,
+        thoughtsOnStage1="",
+        reason="",
+        reEvaluatedConfidence=stage1.confidence,
+    )
+
+
+def category_progress(state: MTState) -> Dict[str, str]:
+    progress = {}
+    for category in CATEGORIES:
+        if state.get(stage3_key(category)) is not None:
+            progress[category] = "verified"
+        elif any(state.get(sub) is not None for sub in SUB_CATEGORIES[category]):
+            progress[category] = "stage2"
+        elif state.get(stage1_key(category)) is not None:
+            progress[category] = "stage1"
+        else:
+            progress[category] = "pending"
+    return progress
+
+
+def provisional_aggregation(state: MTState) -> Dict[str, float]:
+    """aggregate_mt_quality with stage-1 stand-ins for stage-2 outputs that have not arrived."""
+    filled = dict(state)
+    for category in CATEGORIES:
+        stage1 = state.get(stage1_key(category))
+        if stage1 is None:
+            continue
+        for sub in SUB_CATEGORIES[category]:
+            if filled.get(sub) is None:
+                filled[sub] = _stand_in(stage1)
+    return aggregate_mt_quality(filled)["aggregation"]
+
+
+class _Accumulator:
+    """The running state, rebuilt from node updates as LangGraph applies them."""
+
+    def __init__(self, input_state: Dict):
+        self.state: Dict = dict(input_state)
+        self.state.setdefault("nodeMetrics", [])
+        self.started = time.monotonic()
+        self._last_score: Optional[Dict[str, float]] = None
+
+    def apply(self, chunk: Dict) -> Iterator[StreamUpdate]:
+        for node, update in chunk.items():
+            update = update or {}
+            records = update.get("nodeMetrics") or []
+            outputs = {k: v for k, v in update.items() if k != "nodeMetrics"}
+            self.state.update(outputs)
+            self.state["nodeMetrics"] = self.state["nodeMetrics"] + records
+            elapsed = time.monotonic() - self.started
+            yield NodeUpdate(node, outputs, records, self.state.get("round") or 1, elapsed)
+
+            if "aggregation" in outputs:
+                self._last_score = outputs["aggregation"]
+                yield ScoreUpdate(outputs["aggregation"], category_progress(self.state), True, elapsed)
+            elif SCORED_KEYS.intersection(outputs):
+                score = provisional_aggregation(self.state)
+                if score != self._last_score:
+                    self._last_score = score
+                    yield ScoreUpdate(score, category_progress(self.state), False, elapsed)
+
+    def final(self) -> FinalState:
+        return FinalState(self.state, time.monotonic() - self.started)
+
+
+def stream_evaluation(app, input_state: Dict, config=None) -> Iterator[StreamUpdate]:
+    """Evaluate one segment with app.stream, yielding updates as nodes finish."""
+    accumulator = _Accumulator(input_state)
+    for chunk in app.stream(input_state, config, stream_mode="updates"):
+        yield from accumulator.apply(chunk)
+    yield accumulator.final()
+
+
+async def astream_evaluation(app, input_state: Dict, config=None) -> AsyncIterator[StreamUpdate]:
+    """Async counterpart of stream_evaluation on app.astream."""
+    accumulator = _Accumulator(input_state)
+    async for chunk in app.astream(input_state, config, stream_mode="updates"):
+        for update in accumulator.apply(chunk):
+            yield update
+    yield accumulator.final()
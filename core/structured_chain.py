@@ -0,0 +1,309 @@
+"""
+Structured Chain
+
+Prompt template -> LLM with structured output, as used by every agent node.
+Replaces `prompt_template | llm.with_structured_output(schema)` so that
+infrastructure shared by all nodes (response cache, retries, metrics, ...)
+lives in one place instead of in each factory.
+
+The schema is bound as a forced tool call and the tool arguments are
+validated here, which keeps the provider call, retries and validation
+separately measurable (see core.metrics). Every attempt, retries included,
+first takes a slot from the shared rate limiter when one is configured
+(core.rate_limit); the time spent waiting for it counts as queue_wait.
+
+Arguments that fail validation are repaired locally first (core.repair).
+Only if that does not produce a valid output is one correction request sent,
+carrying the rejected arguments and the validation error instead of the
+whole prompt again.
+
+Prompt layout is prefix-cache friendly: the output schema (sent as a tool)
+and the system prompt come first and never contain variable data, the human
+message lists the variable fields in a fixed order, and each node sends its
+name as `prompt_cache_key` so the provider routes a node's requests to the
+same cache.
+"""
+
+import asyncio
+import random
+import textwrap
+import time
+from typing import Optional, Tuple
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import ValidationError
+
+from core.llm_cache import get_response_cache, make_cache_key
+from core.metrics import add_usage, new_record, node_metrics
+from core.rate_limit import estimate_request_tokens, get_rate_limiter
+from core.repair import correction_messages, repair_arguments
+
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def model_name(llm) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+def build_prompt(system_prompt: str, human_template: str) -> ChatPromptTemplate:
+    """
+    Byte-stable message layout: the static system prompt first, then the
+    human message with the variable fields. Indentation and surrounding
+    whitespace of both templates are normalized so the static prefix is
+    identical for every call of a node.
+    """
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt.strip()),
+        ("human", textwrap.dedent(human_template).strip()),
+    ])
+
+
+def is_retryable(exc: Exception) -> bool:
+    if getattr(exc, "status_code", None) in RETRYABLE_STATUS:
+        return True
+    return type(exc).__name__ in ("APITimeoutError", "APIConnectionError", "TimeoutException", "ConnectError")
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on a provider error, if present."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class StructuredChain:
+
+    def __init__(
+        self,
+        prompt_template,
+        llm,
+        schema,
+        node: str,
+        max_retries: int = 3,
+        retry_backoff: float = 1.0,
+        escalation=None,
+    ):
+        self.prompt_template = prompt_template
+        self.llm = llm
+        self.schema = schema
+        self.node = node
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # a stage whose cheap model is the strong one has nothing to escalate to
+        self.escalation = escalation if escalation is not None and escalation.llm is not llm else None
+        self._bound = self._bind(llm)
+        self._escalated = self._bind(self.escalation.llm) if self.escalation is not None else None
+
+    def _bind(self, llm):
+        return llm.bind_tools(
+            [self.schema],
+            tool_choice=self.schema.__name__,
+            parallel_tool_calls=False,
+            extra_body={"prompt_cache_key": self.node},
+        )
+
+    def _model_label(self) -> str:
+        if self.escalation is None:
+            return model_name(self.llm)
+        return f"{model_name(self.llm)}>{model_name(self.escalation.llm)}"
+
+    def _lookup(self, messages):
+        cache = get_response_cache()
+        if cache is None:
+            return None, None, None
+        key = make_cache_key(self._model_label(), messages, self.schema)
+        cached = cache.get(key, self.node)
+        if cached is None:
+            return cache, key, None
+        return cache, key, self.schema.model_validate_json(cached)
+
+    def _backoff(self, exc: Exception, attempt: int) -> float:
+        delay = retry_after(exc)
+        if delay is None:
+            delay = self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+        return delay
+
+    def _arguments(self, message):
+        """(raw tool arguments, error): a dict for a parsed call, the raw string for a malformed one."""
+        if message.tool_calls:
+            return message.tool_calls[0]["args"], None
+        if message.invalid_tool_calls:
+            call = message.invalid_tool_calls[0]
+            return call.get("args"), OutputParserException(f"malformed arguments: {call.get('error')}")
+        return None, OutputParserException(f"model returned no {self.schema.__name__} tool call")
+
+    def _validate(self, message, record: dict):
+        """(output, None) on success, possibly after local repair; (None, (raw, error)) otherwise."""
+        started = time.monotonic()
+        try:
+            raw, error = self._arguments(message)
+            if error is None:
+                try:
+                    return self.schema.model_validate(raw), None
+                except ValidationError as e:
+                    error = e
+            record["validation_failures"] += 1
+
+            repaired = repair_arguments(self.schema, raw) if raw is not None else None
+            if repaired is not None:
+                try:
+                    output = self.schema.model_validate(repaired)
+                    record["local_repairs"] += 1
+                    return output, None
+                except ValidationError as e:
+                    error = e
+            return None, (raw, error)
+        finally:
+            record["validation_time"] += time.monotonic() - started
+
+    def _failed(self, error: Exception):
+        return OutputParserException(f"{self.node}: invalid {self.schema.__name__} after correction: {error}")
+
+    def _abort(self, record: dict, started: float):
+        """Record a call that ends without an output (invalid after correction, provider error, cancellation)."""
+        record["failed"] = True
+        record["wall_time"] = time.monotonic() - started
+        node_metrics.record(record)
+
+    def _call_done(self, message, record: dict, limiter, call_started: float, tokens: int):
+        elapsed = time.monotonic() - call_started
+        record["llm_time"] += elapsed
+        add_usage(record, message.usage_metadata)
+        if limiter is not None:
+            usage = message.usage_metadata or {}
+            actual = usage.get("input_tokens", 0) + usage.get("output_tokens", 0) if usage else None
+            limiter.release(elapsed, estimated_tokens=tokens, actual_tokens=actual)
+
+    def _finish(self, output, record: dict, started: float, cache, key):
+        record["wall_time"] = time.monotonic() - started
+        node_metrics.record(record)
+
+        if cache is not None:
+            cache.put(key, output.model_dump_json(), self.node)
+        return output
+
+    def _cache_hit(self, record: dict, started: float):
+        record["cache_hit"] = True
+        record["wall_time"] = time.monotonic() - started
+        node_metrics.record(record)
+
+    def _request(self, bound, messages, record: dict):
+        """One provider call with retries on transient errors."""
+        limiter = get_rate_limiter()
+        tokens = estimate_request_tokens(messages) if limiter is not None else 0
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                record["queue_wait"] += limiter.acquire(tokens)
+            call_started = time.monotonic()
+            try:
+                message = bound.invoke(messages)
+            except Exception as e:
+                elapsed = time.monotonic() - call_started
+                record["llm_time"] += elapsed
+                if limiter is not None:
+                    limiter.release(elapsed, error=e, retry_after=retry_after(e))
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                record["retries"] += 1
+                time.sleep(self._backoff(e, attempt))
+                continue
+            self._call_done(message, record, limiter, call_started, tokens)
+            return message
+
+    async def _arequest(self, bound, messages, record: dict):
+        limiter = get_rate_limiter()
+        tokens = estimate_request_tokens(messages) if limiter is not None else 0
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                record["queue_wait"] += await limiter.aacquire(tokens)
+            call_started = time.monotonic()
+            try:
+                message = await bound.ainvoke(messages)
+            except asyncio.CancelledError:
+                if limiter is not None:
+                    limiter.release(time.monotonic() - call_started, error=asyncio.CancelledError())
+                raise
+            except Exception as e:
+                elapsed = time.monotonic() - call_started
+                record["llm_time"] += elapsed
+                if limiter is not None:
+                    limiter.release(elapsed, error=e, retry_after=retry_after(e))
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                record["retries"] += 1
+                await asyncio.sleep(self._backoff(e, attempt))
+                continue
+            self._call_done(message, record, limiter, call_started, tokens)
+            return message
+
+    def _complete(self, bound, messages, record: dict):
+        """Request, validate, and send one correction request if validation fails."""
+        output, failure = self._validate(self._request(bound, messages, record), record)
+        if failure is not None:
+            record["correction_calls"] += 1
+            output, failure = self._validate(self._request(bound, correction_messages(self.schema, *failure), record), record)
+            if failure is not None:
+                raise self._failed(failure[1])
+        return output
+
+    async def _acomplete(self, bound, messages, record: dict):
+        output, failure = self._validate(await self._arequest(bound, messages, record), record)
+        if failure is not None:
+            record["correction_calls"] += 1
+            message = await self._arequest(bound, correction_messages(self.schema, *failure), record)
+            output, failure = self._validate(message, record)
+            if failure is not None:
+                raise self._failed(failure[1])
+        return output
+
+    def invoke(self, inputs: dict, round_: int = 1) -> Tuple[object, dict]:
+        """Run the chain; returns (parsed output, metrics record)."""
+        started = time.monotonic()
+        record = new_record(self.node)
+        record["round"] = round_
+
+        messages = self.prompt_template.format_messages(**inputs)
+        cache, key, output = self._lookup(messages)
+        if output is not None:
+            self._cache_hit(record, started)
+            return output, record
+
+        record["queue_wait"] += time.monotonic() - started
+        try:
+            output = self._complete(self._bound, messages, record)
+            if self.escalation is not None and self.escalation.should_escalate(output):
+                record["escalations"] += 1
+                output = self._complete(self._escalated, messages, record)
+        except BaseException:
+            self._abort(record, started)
+            raise
+
+        return self._finish(output, record, started, cache, key), record
+
+    async def ainvoke(self, inputs: dict, round_: int = 1) -> Tuple[object, dict]:
+        started = time.monotonic()
+        record = new_record(self.node)
+        record["round"] = round_
+
+        messages = self.prompt_template.format_messages(**inputs)
+        cache, key, output = self._lookup(messages)
+        if output is not None:
+            self._cache_hit(record, started)
+            return output, record
+
+        record["queue_wait"] += time.monotonic() - started
+        try:
+            output = await self._acomplete(self._bound, messages, record)
+            if self.escalation is not None and self.escalation.should_escalate(output):
+                record["escalations"] += 1
+                output = await self._acomplete(self._escalated, messages, record)
+        except BaseException:
+            self._abort(record, started)
+            raise
+
+        return self._finish(output, record, started, cache, key), record
@@ -0,0 +1,72 @@
+"""
+Error Taxonomy
+
+Super categories, their sub-categories and the MTState keys each stage
+writes. Single source of truth for code that walks the hierarchy.
+"""
+
+from typing import Dict, List
+
+SUB_CATEGORIES: Dict[str, List[str]] = {
+    "accuracy": ["addition", "omission", "mistranslation", "untranslated_text"],
+    "fluency": ["punctuation", "spelling", "grammar", "register", "inconsistency", "characterEncoding"],
+    "terminology": ["inappropriate_for_context", "inconsistent_use"],
+    "style": ["awkward"],
+}
+
+CATEGORIES: List[str] = list(SUB_CATEGORIES)
+
+# error types that show up across segments rather than within one; in
+# document mode (core.document) their agents also see the document context
+CROSS_SEGMENT_SUBS: List[str] = ["inconsistency", "inconsistent_use"]
+
+
+def stage1_key(category: str) -> str:
+    return f"{category}Stage1"
+
+
+def stage3_key(category: str) -> str:
+    return f"{category}Stage3"
+
+
+def category_of(sub_category: str) -> str:
+    for category, subs in SUB_CATEGORIES.items():
+        if sub_category in subs:
+            return category
+    raise KeyError(sub_category)
+
+
+def _normalize(name: str) -> str:
+    return "".join(ch for ch in name.lower() if ch.isalnum())
+
+
+_CATEGORY_BY_NAME = {_normalize(c): c for c in CATEGORIES}
+_SUB_BY_NAME = {_normalize(s): s for subs in SUB_CATEGORIES.values() for s in subs}
+
+
+def resolve_error_types(error_types: List[str]):
+    """
+    Map audit strings such as "fluency:grammar", "Accuracy" or "untranslated
+    text" onto the taxonomy.
+
+    Returns (categories, sub_categories, unresolved): whole categories to
+    re-run, individual sub-categories to re-run, and the strings that matched
+    nothing.
+    """
+    categories, subs, unresolved = set(), set(), []
+    for raw in error_types:
+        head, _, tail = raw.partition(":")
+        head, tail = _normalize(head), _normalize(tail)
+
+        if tail and tail in _SUB_BY_NAME:
+            subs.add(_SUB_BY_NAME[tail])
+        elif not tail and head in _SUB_BY_NAME:
+            subs.add(_SUB_BY_NAME[head])
+        elif head in _CATEGORY_BY_NAME:
+            # category named without a known sub-category
+            categories.add(_CATEGORY_BY_NAME[head])
+        else:
+            unresolved.append(raw)
+
+    subs = {s for s in subs if category_of(s) not in categories}
+    return categories, subs, unresolved
@@ -0,0 +1,36 @@
+"""
+Text Helpers
+
+Small Unicode utilities shared by the corpus tools.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+
+
+# invisible characters with no meaning of their own (ZWJ / ZWNJ do carry meaning in some scripts and stay)
+_INVISIBLE = dict.fromkeys(map(ord, "\u200b\u2060\ufeff\u00ad"))
+_WHITESPACE = re.compile(r"\s+")
+
+
+def char_script(ch: str) -> str:
+    """Script of a single character from its Unicode name, e.g. LATIN, DEVANAGARI."""
+    try:
+        return unicodedata.name(ch).split(" ")[0]
+    except ValueError:
+        return "UNKNOWN"
+
+
+def dominant_script(text: str) -> str:
+    """Most frequent script among the letters of `text`, or "UNKNOWN" when it has none."""
+    counts = Counter(char_script(ch) for ch in text if ch.isalpha())
+    if not counts:
+        return "UNKNOWN"
+    return counts.most_common(1)[0][0]
+
+
+def normalize_text(text: str) -> str:
+    """NFKC, invisible characters dropped, whitespace runs collapsed and trimmed; case is kept."""
+    text = unicodedata.normalize("NFKC", text or "").translate(_INVISIBLE)
+    return _WHITESPACE.sub(" ", text).strip()
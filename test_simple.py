@@ -6,24 +6,10 @@ translation that the reference implementation uses.
 """
 
 from core.graph import app
+from core.corpus import serialize_state
 import json
 
 
-def serialize_state(obj):
-    """
-    Convert Pydantic models to JSON-serializable dict.
-    Recursively handles nested models.
-    """
-    if hasattr(obj, "model_dump"):
-        return obj.model_dump()
-    elif isinstance(obj, dict):
-        return {k: serialize_state(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [serialize_state(v) for v in obj]
-    else:
-        return obj
-
-
 if __name__ == "__main__":
     print("=" * 70)
     print("TESTING FRAMEWORK_IMPLEMENTATION")
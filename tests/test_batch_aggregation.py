@@ -0,0 +1,88 @@
+"""
+core.batch_aggregation must equal core.aggregation.aggregate_mt_quality up
+to float rounding, on random states with missing stage-2 / stage-3 outputs,
+for the default weights and for every weight vector of a sweep.
+"""
+
+import random
+
+import numpy as np
+
+from core.aggregation import aggregate_mt_quality
+from core.batch_aggregation import SUB_KEYS, AggregationArrays, aggregate_batch, simplex_grid, sweep_scores
+from core.models import AgentOutputStage2, AgentOutputStage3
+from core.taxonomy import CATEGORIES, stage3_key
+
+RTOL = 1e-12
+ATOL = 1e-12
+
+
+def random_states(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    states = []
+    for _ in range(n):
+        state = {}
+        for sub in SUB_KEYS:
+            if rng.random() < 0.8:
+                state[sub] = AgentOutputStage2(
+                    reEvaluatedProb=rng.random(),
+                    thoughtsOnStage1="",
+                    reason="",
+                    reEvaluatedConfidence=rng.choice([0.0, rng.uniform(0, 100)]),
+                )
+        for category in CATEGORIES:
+            if rng.random() < 0.8:
+                state[stage3_key(category)] = AgentOutputStage3(
+                    consistencyScore=rng.uniform(0, 100),
+                    errorsExists=rng.choice(["YES", "NO"]),
+                    existanceReasoning="",
+                )
+        states.append(state)
+    return states
+
+
+def _weights(vector):
+    return dict(zip(CATEGORIES, (float(w) for w in vector)))
+
+
+def test_aggregate_batch_matches_scalar():
+    states = random_states(2000)
+    batch = aggregate_batch(AggregationArrays.from_states(states))
+    scalar = [aggregate_mt_quality(state)["aggregation"] for state in states]
+    for key in scalar[0]:
+        expected = [values[key] for values in scalar]
+        np.testing.assert_allclose(batch[key], expected, rtol=RTOL, atol=ATOL, err_msg=key)
+
+
+def test_serialized_states_match():
+    states = random_states(200, seed=1)
+    serialized = [{key: output.model_dump() for key, output in state.items()} for state in states]
+    np.testing.assert_array_equal(
+        aggregate_batch(AggregationArrays.from_states(serialized))["final_quality_score_100"],
+        aggregate_batch(AggregationArrays.from_states(states))["final_quality_score_100"],
+    )
+
+
+def test_sweep_scores_match_scalar():
+    states = random_states(300, seed=2)
+    arrays = AggregationArrays.from_states(states)
+    grid = simplex_grid(0.1)
+    finals = sweep_scores(arrays, grid, chunk_size=128)
+    for g, vector in enumerate(grid):
+        weights = _weights(vector)
+        expected = [aggregate_mt_quality(state, weights)["aggregation"]["final_quality_score_100"] for state in states]
+        np.testing.assert_allclose(finals[g], expected, rtol=RTOL, atol=ATOL, err_msg=str(g))
+
+
+def test_sweep_no_verdict_factors_match_scalar():
+    states = random_states(100, seed=3)
+    arrays = AggregationArrays.from_states(states)
+    grid = simplex_grid(0.25)
+    factors = np.linspace(0.0, 1.0, len(grid))
+    finals = sweep_scores(arrays, grid, no_verdict_factors=factors)
+    for g, (vector, factor) in enumerate(zip(grid, factors)):
+        expected = [
+            aggregate_mt_quality(state, _weights(vector), float(factor))["aggregation"]["final_quality_score_100"]
+            for state in states
+        ]
+        np.testing.assert_allclose(finals[g], expected, rtol=RTOL, atol=ATOL, err_msg=str(g))
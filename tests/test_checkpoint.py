@@ -0,0 +1,126 @@
+"""
+core.checkpoint: a corpus run that dies part way resumes from the run
+manifest and the SQLite checkpoints, with the fake LLM of benchmarks.
+"""
+
+import asyncio
+import json
+
+from benchmarks.fake_llm import FakeChatModel
+from benchmarks.suite import synthetic_segments
+from core.checkpoint import RunManifest, SQLiteCheckpointSaver, state_serializer
+from core.corpus import JsonlSink
+from core.graph import build_graph
+from core.llm_cache import set_response_cache
+from core.models import AgentOutputStage1
+from core.runner import arun_corpus
+
+
+class CountingLLM(FakeChatModel):
+    """Fake LLM that counts its calls and dies (like a killed run) once `fail_after` is reached."""
+
+    calls: int = 0
+    fail_after: int = -1
+
+    def _check(self):
+        if self.fail_after >= 0 and self.calls >= self.fail_after:
+            raise RuntimeError("killed")
+        self.calls += 1
+
+    def _generate(self, *args, **kwargs):
+        self._check()
+        return super()._generate(*args, **kwargs)
+
+    async def _agenerate(self, *args, **kwargs):
+        self._check()
+        return await super()._agenerate(*args, **kwargs)
+
+
+def _llm(fail_after: int = -1) -> CountingLLM:
+    return CountingLLM(latency_ms=0, latency_sigma=0, seed=0, fail_after=fail_after)
+
+
+def _run(path, sink_path, segments, llm):
+    saver = SQLiteCheckpointSaver(str(path), flush_interval=0.05)
+    manifest = RunManifest(saver)
+    app = build_graph(llm=llm).compile(checkpointer=saver)
+    sink = JsonlSink(str(sink_path))
+    try:
+        stats = asyncio.run(arun_corpus(
+            segments, sink, app=app, concurrency=4, max_rounds=1, progress_interval=3600, manifest=manifest,
+        ))
+    finally:
+        sink.close()
+        manifest.sync()
+        saver.close()
+    return stats
+
+
+class _NullSink:
+    def write(self, segment, result=None, error=None):
+        pass
+
+
+def _fresh_calls(segments) -> int:
+    """LLM calls of an uncheckpointed run over `segments`."""
+    llm = _llm()
+    app = build_graph(llm=llm).compile()
+    asyncio.run(arun_corpus(segments, _NullSink(), app=app, concurrency=4, max_rounds=1, progress_interval=3600))
+    return llm.calls
+
+
+def _rows(sink_path):
+    with open(sink_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_killed_run_resumes_from_checkpoints(tmp_path):
+    set_response_cache(None)
+    segments = synthetic_segments(12, seed=3)
+    db, sink_path = tmp_path / "run.sqlite", tmp_path / "results.jsonl"
+
+    first = _run(db, sink_path, segments, _llm(fail_after=_fresh_calls(segments) // 2))
+    assert 0 < first.failed < len(segments)
+    failed_ids = {row["id"] for row in _rows(sink_path) if row.get("error")}
+
+    resumed_llm = _llm()
+    second = _run(db, sink_path, segments, resumed_llm)
+    assert second.failed == 0
+    assert second.skipped == len(segments) - first.failed
+    assert second.resumed == first.failed
+    # resumed segments only re-run the nodes that had not finished
+    assert 0 < resumed_llm.calls < _fresh_calls([s for s in segments if s["id"] in failed_ids])
+
+    last = {}
+    for row in _rows(sink_path):
+        last[row["id"]] = row
+    assert sorted(last) == sorted(s["id"] for s in segments)
+    assert not any(row.get("error") for row in last.values())
+
+
+def test_resumed_state_keeps_pydantic_outputs(tmp_path):
+    set_response_cache(None)
+    segment = synthetic_segments(1, seed=4)[0]
+    saver = SQLiteCheckpointSaver(str(tmp_path / "run.sqlite"), flush_interval=0.05)
+    manifest = RunManifest(saver)
+    app = build_graph(llm=_llm(fail_after=4)).compile(checkpointer=saver)
+    state = {"source": segment["source"], "mt": segment["mt"], "reference": segment["reference"], "round": 1, "max_rounds": 1}
+    try:
+        app.invoke(state, manifest.config(segment))
+    except RuntimeError:
+        pass
+    saver.close()
+
+    reopened = SQLiteCheckpointSaver(str(tmp_path / "run.sqlite"))
+    try:
+        saved = reopened.get_tuple(RunManifest(reopened).config(segment))
+        values = list(saved.checkpoint["channel_values"].values()) + [value for _, _, value in saved.pending_writes]
+        assert any(isinstance(value, AgentOutputStage1) for value in values)
+    finally:
+        reopened.close()
+
+
+def test_state_serializer_round_trips_outputs():
+    serde = state_serializer()
+    output = AgentOutputStage1(probability=0.25, confidence=80.0, reason="r")
+    assert serde.loads_typed(serde.dumps_typed({"accuracyStage1": output})) == {"accuracyStage1": output}
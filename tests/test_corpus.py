@@ -0,0 +1,123 @@
+"""
+core.corpus dedup: triple keys (exact / normalized / documents),
+dedupe_segments and FanOutSink; core.document.DocumentSink row fan-out.
+"""
+
+import pytest
+
+from core.corpus import FanOutSink, dedupe_segments, triple_key
+from core.document import DocumentSink, as_document
+
+
+class ListSink:
+
+    def __init__(self, buffered: int = 0):
+        self.rows = []
+        self.buffered = buffered
+        self.flushed = 0
+        self.closed = False
+
+    def write(self, segment, result=None, error=None):
+        self.rows.append((segment.get("id"), result, error))
+
+    def flush(self):
+        self.flushed += 1
+
+    def close(self):
+        self.closed = True
+
+
+def seg(id_, source="Hallo Welt", mt="Hello world", reference="Hello world", **extra):
+    return dict(id=id_, source=source, mt=mt, reference=reference, **extra)
+
+
+def test_exact_key_is_the_raw_triple():
+    assert triple_key(seg(1)) == ("Hallo Welt", "Hello world", "Hello world")
+    assert triple_key(seg(1, source="Hallo  Welt ")) != triple_key(seg(2))
+
+
+def test_normalized_key_folds_source_and_reference_but_not_mt():
+    wide = seg(1, source="Hallo\u3000Welt\u200b ", reference=" Hello   world")
+    assert triple_key(wide, "normalized") == triple_key(seg(2), "normalized")
+    assert triple_key(seg(1, mt="Hello world\uff01"), "normalized") != triple_key(seg(2, mt="Hello world!"), "normalized")
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        triple_key(seg(1), "fuzzy")
+
+
+def test_missing_fields_key_as_empty_text():
+    assert triple_key({"source": "a", "mt": "b"}) == ("a", "b", "")
+
+
+def test_dedupe_keeps_first_occurrences_in_order():
+    segments = [seg(1), seg(2, mt="Hi world"), seg(3), seg(4, source="Hallo  Welt"), seg(5, mt="Hi world")]
+    unique, occurrences = dedupe_segments(segments)
+    assert [s["id"] for s in unique] == [1, 2, 4]
+    assert [s["id"] for s in occurrences[triple_key(seg(1))]] == [1, 3]
+
+    unique, occurrences = dedupe_segments(segments, "normalized")
+    assert [s["id"] for s in unique] == [1, 2]
+    assert [s["id"] for s in occurrences[triple_key(seg(1), "normalized")]] == [1, 3, 4]
+
+
+def test_fan_out_writes_every_occurrence():
+    segments = [seg(1), seg(2, mt="Hi world"), seg(3)]
+    unique, occurrences = dedupe_segments(segments)
+    inner = ListSink(buffered=2)
+    sink = FanOutSink(inner, occurrences)
+    sink.write(unique[0], result={"score": 1})
+    sink.write(unique[1], error="Boom")
+    assert inner.rows == [(1, {"score": 1}, None), (3, {"score": 1}, None), (2, None, "Boom")]
+
+    assert sink.buffered == 2
+    sink.flush()
+    sink.close()
+    assert inner.flushed == 1 and inner.closed
+
+
+def test_fan_out_writes_unknown_segments_once():
+    sink = FanOutSink(ListSink(), {})
+    sink.write(seg(9), result={})
+    assert sink.sink.rows == [(9, {}, None)]
+
+
+def test_document_keys_do_not_collide_on_joined_text():
+    joined = as_document("a", [seg(1, source="x\ny", mt="m\nn", reference="r\ns")])
+    split = as_document("b", [seg(2, source="x", mt="m", reference="r"), seg(3, source="y", mt="n", reference="s")])
+    assert joined["source"] == split["source"]
+    assert triple_key(joined) != triple_key(split)
+
+    same = as_document("c", [seg(4, source="x", mt="m", reference="r"), seg(5, source="y", mt="n", reference="s")])
+    unique, _ = dedupe_segments([joined, split, same])
+    assert [d["id"] for d in unique] == ["a", "b"]
+
+
+def test_document_key_follows_the_mode():
+    doc = as_document("a", [seg(1, source="Hallo\u3000Welt")])
+    assert triple_key(doc, "normalized") == (triple_key(seg(2), "normalized"),)
+
+
+def test_document_sink_writes_one_row_per_segment():
+    doc = as_document("d", [seg(1), seg(2)])
+    inner = ListSink()
+    DocumentSink(inner).write(doc, result={"segments": [{"s": 1}, {"s": 2}]})
+    DocumentSink(inner).write(doc, error="Boom")
+    assert inner.rows == [(1, {"s": 1}, None), (2, {"s": 2}, None), (1, None, "Boom"), (2, None, "Boom")]
+
+
+def test_document_sink_rejects_a_result_of_the_wrong_length():
+    doc = as_document("d", [seg(1), seg(2)])
+    inner = ListSink()
+    with pytest.raises(ValueError):
+        DocumentSink(inner).write(doc, result={"segments": [{"s": 1}]})
+    assert inner.rows == []
+
+
+def test_document_sink_forwards_buffering():
+    inner = ListSink(buffered=3)
+    sink = DocumentSink(inner)
+    assert sink.buffered == 3
+    sink.flush()
+    assert inner.flushed == 1
@@ -0,0 +1,177 @@
+"""
+core.rate_limit: AIMD limit changes, FIFO order of waiters, Retry-After
+pauses, and slots / reservations given back when a waiting caller is
+cancelled (thread and async).
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core import rate_limit
+from core.rate_limit import AIMDController, RateLimiter
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_aimd_decreases_on_rate_limit():
+    limiter = RateLimiter(initial_concurrency=8)
+    limiter.acquire(0)
+    limiter.release(0.1, error=RateLimitError())
+    state = limiter.snapshot()
+    assert state["concurrency_limit"] == 4
+    assert state["decreases"] == 1
+    assert state["rate_limited"] == 1
+    assert state["in_flight"] == 0
+
+
+def test_aimd_decreases_once_per_cooldown():
+    controller = AIMDController(initial=16, cooldown=60.0)
+    for _ in range(3):
+        controller.acquire()
+        controller.release(rate_limited=True)
+    assert int(controller.limit) == 8
+    assert controller.decreases == 1
+
+
+def test_aimd_increases_after_a_window_of_successes():
+    controller = AIMDController(initial=2)
+    for _ in range(2):
+        controller.acquire()
+        controller.release(latency=0.1)
+    assert int(controller.limit) == 3
+    assert controller.increases == 1
+
+
+def test_other_errors_leave_the_limit_alone():
+    limiter = RateLimiter(initial_concurrency=4)
+    limiter.acquire(0)
+    limiter.release(0.1, error=ValueError("bad request"))
+    state = limiter.snapshot()
+    assert (state["concurrency_limit"], state["increases"], state["decreases"]) == (4, 0, 0)
+
+
+def test_thread_waiters_are_served_in_fifo_order():
+    controller = AIMDController(initial=1)
+    controller.acquire()
+    order = []
+
+    def worker(i):
+        controller.acquire()
+        order.append(i)
+        controller.release(latency=0.01)
+
+    threads = []
+    for i in range(5):
+        thread = threading.Thread(target=worker, args=(i,))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda: len(controller._waiters) == i + 1)
+
+    controller.release(latency=0.01)
+    for thread in threads:
+        thread.join(2.0)
+    assert order == [0, 1, 2, 3, 4]
+    assert controller.in_flight == 0
+
+
+def test_async_waiters_are_served_in_fifo_order():
+    async def run():
+        controller = AIMDController(initial=1)
+        await controller.aacquire()
+        order = []
+
+        async def worker(i):
+            await controller.aacquire()
+            order.append(i)
+            await asyncio.sleep(0)
+            controller.release(latency=0.01)
+
+        tasks = []
+        for i in range(5):
+            tasks.append(asyncio.ensure_future(worker(i)))
+            await asyncio.sleep(0)
+        assert len(controller._waiters) == 5
+        controller.release(latency=0.01)
+        await asyncio.gather(*tasks)
+        return order, controller.in_flight
+
+    assert asyncio.run(run()) == ([0, 1, 2, 3, 4], 0)
+
+
+def test_retry_after_pauses_new_calls():
+    limiter = RateLimiter(initial_concurrency=8)
+    limiter.acquire(0)
+    limiter.release(0.1, error=RateLimitError(), retry_after=0.2)
+    assert limiter.acquire(0) >= 0.15
+    limiter.release(0.1)
+
+    async def next_call():
+        limiter.pause(0.2)
+        return await limiter.aacquire(0)
+
+    assert asyncio.run(next_call()) >= 0.15
+
+
+def test_cancelled_thread_returns_slot_and_reservation(monkeypatch):
+    limiter = RateLimiter(rpm=60, initial_concurrency=4)
+    limiter.acquire(0)
+
+    def interrupted(seconds):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(rate_limit.time, "sleep", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        limiter.acquire(0)
+    monkeypatch.undo()
+
+    assert limiter.concurrency.in_flight == 1
+    # the interrupted call's request reservation was refunded
+    assert limiter.requests.available > -0.5
+    assert limiter.calls == 1
+
+
+def test_cancelled_task_returns_slot_while_waiting_on_bucket():
+    async def run():
+        limiter = RateLimiter(rpm=60, initial_concurrency=4)
+        await limiter.aacquire(0)
+        task = asyncio.ensure_future(limiter.aacquire(0))
+        await asyncio.sleep(0.05)
+        assert limiter.concurrency.in_flight == 2
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert limiter.concurrency.in_flight == 1
+    assert limiter.requests.available > -0.5
+
+
+def test_cancelled_task_leaves_the_queue_for_the_next_waiter():
+    async def run():
+        controller = AIMDController(initial=1)
+        await controller.aacquire()
+        cancelled = asyncio.ensure_future(controller.aacquire())
+        waiting = asyncio.ensure_future(controller.aacquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        controller.release(latency=0.01)
+        await asyncio.wait_for(waiting, 1.0)
+        return controller
+
+    controller = asyncio.run(run())
+    assert controller.in_flight == 1
+    assert not controller._waiters
@@ -0,0 +1,124 @@
+"""
+core.repair: local fixes of rejected tool arguments (clamping, key
+normalization, percent rescaling, malformed JSON, literals, lists, nested
+models) and the correction follow-up, which carries only the rejected
+arguments and the validation error.
+"""
+
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from core.models import (
+    AgentOutputStage1,
+    AgentOutputStage2,
+    AgentOutputStage3,
+    FluencyStage2Output,
+    MissingErrorsOutput,
+)
+from core.repair import correction_messages, parse_json_loosely, repair_arguments, validation_summary
+
+STAGE2 = {"reEvaluatedProb": 0.4, "thoughtsOnStage1": "agree", "reason": "r", "reEvaluatedConfidence": 70}
+
+
+def _repaired(schema, raw):
+    return schema.model_validate(repair_arguments(schema, raw))
+
+
+def test_probability_above_one_is_clamped():
+    output = _repaired(AgentOutputStage2, dict(STAGE2, reEvaluatedProb=1.2))
+    assert output.reEvaluatedProb == 1.0
+
+
+def test_confidence_out_of_range_is_clamped():
+    assert _repaired(AgentOutputStage2, dict(STAGE2, reEvaluatedConfidence=150)).reEvaluatedConfidence == 100
+    assert _repaired(AgentOutputStage2, dict(STAGE2, reEvaluatedConfidence=-5)).reEvaluatedConfidence == 0
+
+
+@pytest.mark.parametrize("value, expected", [(85, 0.85), ("85%", 0.85), ("0.3", 0.3), ("about 40 %", 0.4)])
+def test_probability_percentages_are_rescaled(value, expected):
+    assert _repaired(AgentOutputStage2, dict(STAGE2, reEvaluatedProb=value)).reEvaluatedProb == pytest.approx(expected)
+
+
+def test_confidence_strings_keep_their_scale():
+    assert _repaired(AgentOutputStage2, dict(STAGE2, reEvaluatedConfidence="85%")).reEvaluatedConfidence == 85
+
+
+def test_keys_are_normalized():
+    raw = {"re_evaluated_prob": 0.2, "Thoughts-On-Stage1": "t", "REASON": "r", "reevaluatedconfidence": 60, "extra": 1}
+    assert repair_arguments(AgentOutputStage2, raw) == {
+        "reEvaluatedProb": 0.2, "thoughtsOnStage1": "t", "reason": "r", "reEvaluatedConfidence": 60,
+    }
+
+
+def test_aliased_keys_map_to_the_alias():
+    raw = {sub: dict(STAGE2) for sub in ("punctuation", "spelling", "grammar", "Register", "inconsistency", "characterEncoding")}
+    output = _repaired(FluencyStage2Output, raw)
+    assert output.register_.reEvaluatedProb == 0.4
+
+
+@pytest.mark.parametrize("value, expected", [("yes", "YES"), ("No.", "NO"), (True, "YES"), (False, "NO")])
+def test_literals_are_normalized(value, expected):
+    raw = {"consistencyScore": 90, "errorsExists": value, "existanceReasoning": "e"}
+    assert _repaired(AgentOutputStage3, raw).errorsExists == expected
+
+
+def test_single_string_becomes_a_list():
+    raw = {"missingErrorsExists": "YES", "missingErrorTypes": "fluency:grammar", "reasoning": "r"}
+    assert _repaired(MissingErrorsOutput, raw).missingErrorTypes == ["fluency:grammar"]
+
+
+def test_non_string_reason_is_stringified():
+    raw = {"probability": 0.1, "confidence": 50, "reason": {"words": ["a", "b"]}}
+    assert json.loads(_repaired(AgentOutputStage1, raw).reason) == {"words": ["a", "b"]}
+
+
+def test_nested_models_are_repaired():
+    raw = {sub: dict(STAGE2, reEvaluatedProb="90%") for sub in
+           ("punctuation", "spelling", "grammar", "register", "inconsistency", "characterEncoding")}
+    output = _repaired(FluencyStage2Output, raw)
+    assert output.grammar.reEvaluatedProb == pytest.approx(0.9)
+
+
+@pytest.mark.parametrize("text", [
+    '```json\n{"probability": 0.2, "confidence": 80, "reason": "r"}\n```',
+    'Here you go: {"probability": 0.2, "confidence": 80, "reason": "r",} Thanks.',
+    "{'probability': 0.2, 'confidence': 80, 'reason': 'r'}",
+    '{"probability": 0.2, "confidence": 80, "reason": "r',
+])
+def test_malformed_json_is_parsed(text):
+    assert _repaired(AgentOutputStage1, text) == AgentOutputStage1(probability=0.2, confidence=80, reason="r")
+
+
+def test_unparseable_input_gives_none():
+    assert parse_json_loosely("no object here") is None
+    assert repair_arguments(AgentOutputStage1, "no object here") is None
+    assert repair_arguments(AgentOutputStage1, ["not", "a", "dict"]) is None
+
+
+def test_missing_fields_still_fail_validation():
+    with pytest.raises(ValidationError):
+        _repaired(AgentOutputStage1, {"probability": 0.2})
+
+
+def test_correction_messages_carry_only_the_error_and_rejected_arguments():
+    raw = {"probability": "high", "confidence": 80, "reason": "r"}
+    with pytest.raises(ValidationError) as info:
+        AgentOutputStage1.model_validate(raw)
+    system, human = correction_messages(AgentOutputStage1, raw, info.value)
+
+    assert "AgentOutputStage1" in system.content
+    assert human.content == (
+        f"Rejected arguments:\n{json.dumps(raw)}\n\nValidation errors:\n{validation_summary(info.value)}"
+    )
+    assert "probability" in validation_summary(info.value)
+    # nothing of the original prompt or the schema's field descriptions
+    description = AgentOutputStage1.model_fields["reason"].description
+    assert description not in system.content + human.content
+
+
+def test_correction_messages_keep_raw_text_as_is():
+    text = '{"probability": 0.2, "confidence": 80'
+    _, human = correction_messages(AgentOutputStage1, text, ValueError("unterminated object"))
+    assert human.content == f"Rejected arguments:\n{text}\n\nValidation errors:\nunterminated object"
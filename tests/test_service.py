@@ -0,0 +1,106 @@
+"""
+core.service through aiohttp's test client: 429 with Retry-After when the
+queue is full, 413 for a batch larger than the queue, and admitted places
+given back when a request is cancelled.
+"""
+
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from core.service import build_service
+
+
+class GatedApp:
+    """Stands in for the compiled graph: every evaluation waits for `gate`."""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+
+    async def ainvoke(self, state, config=None):
+        await self.gate.wait()
+        return dict(state)
+
+    async def astream(self, state, config=None, stream_mode="updates"):
+        await self.gate.wait()
+        yield {"noop": {}}
+
+
+SEGMENT = {"source": "Hallo Welt", "mt": "Hello world", "reference": "Hello world"}
+
+
+async def _wait_for(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def _run(test, **service_kwargs):
+    async def run():
+        app = GatedApp()
+        web_app = build_service(app, **service_kwargs)
+        async with TestClient(TestServer(web_app)) as client:
+            await test(client, app, web_app["service"].queue)
+
+    asyncio.run(run())
+
+
+def test_full_queue_answers_429_with_retry_after():
+    async def test(client, app, queue):
+        held = [asyncio.ensure_future(client.post("/evaluate", json=SEGMENT)) for _ in range(2)]
+        await _wait_for(lambda: queue.admitted == 2)
+
+        response = await client.post("/evaluate", json=SEGMENT)
+        assert response.status == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert queue.snapshot()["rejected"] == 1
+
+        app.gate.set()
+        for response in await asyncio.gather(*held):
+            assert response.status == 200
+        assert queue.admitted == 0
+
+    _run(test, max_in_flight=1, max_queued=1)
+
+
+def test_oversize_batch_answers_413():
+    async def test(client, app, queue):
+        response = await client.post("/evaluate", json={"segments": [SEGMENT] * 3})
+        assert response.status == 413
+        assert "error" in await response.json()
+        assert queue.admitted == 0
+
+    _run(test, max_in_flight=1, max_queued=1)
+
+
+def test_batch_that_fits_is_answered_in_order():
+    async def test(client, app, queue):
+        app.gate.set()
+        segments = [dict(SEGMENT, id=str(i)) for i in range(3)]
+        response = await client.post("/evaluate", json={"segments": segments})
+        assert response.status == 200
+        assert [r["id"] for r in (await response.json())["results"]] == ["0", "1", "2"]
+
+    _run(test, max_in_flight=2, max_queued=2)
+
+
+def test_cancelled_requests_give_their_places_back():
+    async def test(client, app, queue):
+        batch = asyncio.ensure_future(client.post("/evaluate", json={"segments": [SEGMENT] * 2}))
+        await _wait_for(lambda: queue.in_flight == 2)
+        # a stream's response starts before its evaluation: the client closes it instead of cancelling
+        stream = await client.post("/stream", json=SEGMENT)
+        assert queue.admitted == 3
+
+        batch.cancel()
+        await asyncio.gather(batch, return_exceptions=True)
+        stream.close()
+        await _wait_for(lambda: queue.admitted == 0 and queue.in_flight == 0)
+
+        # the places are usable again
+        app.gate.set()
+        response = await client.post("/evaluate", json={"segments": [SEGMENT] * 4})
+        assert response.status == 200
+
+    _run(test, max_in_flight=2, max_queued=2)